@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Parallel Batch Runner for Addis Ababa Traffic Variations
+Runs every combination of SUMO configs and seeds headless in a process pool,
+each run in its own output directory, and collects one summary table
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+DEFAULT_CONFIGS = [
+    "config_morning_rush.sumocfg",
+    "config_evening_rush.sumocfg",
+    "config_regular_traffic.sumocfg"
+]
+
+# Outputs every run writes for the summary table, whatever its config says
+RUNNER_OUTPUTS = ('summary', 'summary-output', 'tripinfo', 'tripinfo-output', 'statistic-output')
+
+SUMMARY_COLUMNS = [
+    'scenario', 'seed', 'status', 'wall_seconds', 'sim_seconds',
+    'loaded', 'inserted', 'arrived', 'ended', 'max_running', 'teleports',
+    'trips', 'mean_duration', 'mean_waiting_time', 'mean_time_loss', 'mean_route_length',
+    'output_dir'
+]
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def config_outputs(config_file):
+    """Output options of a .sumocfg as {option: file name}"""
+    root = ET.parse(config_file).getroot()
+    outputs = {}
+    for section in root.findall('output'):
+        for element in section:
+            if element.get('value'):
+                outputs[element.tag] = os.path.basename(element.get('value'))
+    return outputs
+
+
+def build_command(run, sumo_binary, threads, skip_outputs, end=None):
+    """SUMO command for one run, with every output redirected into the run directory"""
+    command = [
+        sumo_binary,
+        "-c", run['config'],
+        "--seed", str(run['seed']),
+        "--threads", str(threads),
+        "--no-step-log", "true",
+        "--summary-output", os.path.join(run['output_dir'], "summary.xml"),
+        "--tripinfo-output", os.path.join(run['output_dir'], "tripinfo.xml"),
+        "--statistic-output", os.path.join(run['output_dir'], "statistics.xml")
+    ]
+    for option, filename in config_outputs(run['config']).items():
+        if option in RUNNER_OUTPUTS:
+            continue
+        if option in skip_outputs:
+            # SUMO treats /dev/null as a null device on every platform
+            command.extend([f"--{option}", "/dev/null"])
+        else:
+            command.extend([f"--{option}", os.path.join(run['output_dir'], filename)])
+    if end is not None:
+        command.extend(["--end", str(end)])
+    return command
+
+
+def summarize_summary(filename):
+    """Totals from the last step of a summary output"""
+    last = None
+    max_running = 0
+    for _, element in ET.iterparse(filename):
+        if element.tag == 'step':
+            max_running = max(max_running, int(float(element.get('running', 0))))
+            last = dict(element.attrib)
+            element.clear()
+    if last is None:
+        return {}
+    return {
+        'sim_seconds': float(last.get('time', 0)),
+        'loaded': int(float(last.get('loaded', 0))),
+        'inserted': int(float(last.get('inserted', 0))),
+        'arrived': int(float(last.get('arrived', 0))),
+        # Every vehicle that left the simulation, including teleported-out and removed ones
+        'ended': int(float(last.get('ended', 0))),
+        'max_running': max_running
+    }
+
+
+def summarize_tripinfo(filename):
+    """Mean trip statistics from a tripinfo output, streamed so large files fit in memory"""
+    count = 0
+    totals = {'duration': 0.0, 'waitingTime': 0.0, 'timeLoss': 0.0, 'routeLength': 0.0}
+    for _, element in ET.iterparse(filename):
+        if element.tag == 'tripinfo':
+            count += 1
+            for key in totals:
+                totals[key] += float(element.get(key, 0))
+            element.clear()
+    if count == 0:
+        return {'trips': 0}
+    return {
+        'trips': count,
+        'mean_duration': totals['duration'] / count,
+        'mean_waiting_time': totals['waitingTime'] / count,
+        'mean_time_loss': totals['timeLoss'] / count,
+        'mean_route_length': totals['routeLength'] / count
+    }
+
+
+def summarize_statistics(filename):
+    """Teleports from a statistic output"""
+    teleports = ET.parse(filename).getroot().find('teleports')
+    return {'teleports': int(teleports.get('total', 0)) if teleports is not None else 0}
+
+
+def execute_run(run, sumo_binary, threads, skip_outputs, end):
+    """Run one config/seed combination in a worker process and summarize its outputs"""
+    os.makedirs(run['output_dir'], exist_ok=True)
+    command = build_command(run, sumo_binary, threads, skip_outputs, end)
+    log_file = os.path.join(run['output_dir'], "sumo.log")
+    result = {'scenario': run['scenario'], 'seed': run['seed'], 'output_dir': run['output_dir']}
+
+    started = time.time()
+    with open(log_file, "w") as log:
+        log.write(' '.join(command) + "\n")
+        log.flush()
+        # Relative inputs in the config resolve against the config's directory
+        process = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT,
+                                 cwd=os.path.dirname(run['config']))
+    result['wall_seconds'] = round(time.time() - started, 2)
+
+    if process.returncode != 0:
+        result['status'] = f"failed ({process.returncode})"
+        return result
+
+    result['status'] = 'ok'
+    try:
+        result.update(summarize_summary(os.path.join(run['output_dir'], "summary.xml")))
+        result.update(summarize_tripinfo(os.path.join(run['output_dir'], "tripinfo.xml")))
+        result.update(summarize_statistics(os.path.join(run['output_dir'], "statistics.xml")))
+    except (OSError, ET.ParseError) as e:
+        result['status'] = f"unreadable output ({e})"
+    return result
+
+
+class BatchRunner:
+    def __init__(self, configs, seeds, output_root, workers=None, sumo_binary="sumo", threads=1,
+                 skip_outputs=(), end=None):
+        self.configs = [os.path.abspath(config) for config in configs]
+        self.seeds = list(seeds)
+        self.output_root = os.path.abspath(output_root)
+        self.workers = workers or available_cores()
+        self.sumo_binary = sumo_binary
+        self.threads = threads
+        self.skip_outputs = set(skip_outputs)
+        self.end = end
+
+    def plan_runs(self):
+        """One run per config and seed, each with its own output directory"""
+        runs = []
+        for config in self.configs:
+            scenario = os.path.splitext(os.path.basename(config))[0]
+            if scenario.startswith('config_'):
+                scenario = scenario[len('config_'):]
+            for seed in self.seeds:
+                runs.append({
+                    'scenario': scenario,
+                    'seed': seed,
+                    'config': config,
+                    'output_dir': os.path.join(self.output_root, f"{scenario}_seed{seed}")
+                })
+        return runs
+
+    def check_prerequisites(self):
+        missing = [config for config in self.configs if not os.path.exists(config)]
+        if missing:
+            print("❌ Missing config files:")
+            for config in missing:
+                print(f"   - {config}")
+            return False
+        return True
+
+    def run(self):
+        """Run all combinations and return their results in plan order"""
+        if not self.check_prerequisites():
+            return None
+
+        runs = self.plan_runs()
+        workers = min(self.workers, len(runs))
+        print(f"🚀 Running {len(runs)} simulations ({len(self.configs)} configs × {len(self.seeds)} seeds) "
+              f"on {workers} workers")
+        print(f"📁 Output: {self.output_root}")
+        os.makedirs(self.output_root, exist_ok=True)
+
+        started = time.time()
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(execute_run, run, self.sumo_binary, self.threads, self.skip_outputs, self.end): index
+                for index, run in enumerate(runs)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                run = runs[futures[future]]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'scenario': run['scenario'], 'seed': run['seed'], 'status': f"error ({e})",
+                              'output_dir': run['output_dir']}
+                results[futures[future]] = result
+                icon = "✅" if result['status'] == 'ok' else "❌"
+                print(f"{icon} [{done}/{len(runs)}] {result['scenario']} seed {result['seed']}: "
+                      f"{result['status']} in {result.get('wall_seconds', 0):.1f}s", flush=True)
+
+        elapsed = time.time() - started
+        ordered = [results[index] for index in range(len(runs))]
+        longest = max((result.get('wall_seconds', 0) for result in ordered), default=0)
+        print(f"\n⏱️  Batch finished in {elapsed:.1f}s (longest single run {longest:.1f}s)")
+        self.write_summary(ordered)
+        return ordered
+
+    def write_summary(self, results):
+        """Write the summary table as CSV and JSON and print it"""
+        csv_file = os.path.join(self.output_root, "summary.csv")
+        with open(csv_file, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(results)
+        with open(os.path.join(self.output_root, "summary.json"), "w") as f:
+            json.dump(results, f, indent=2)
+
+        print("\n📋 BATCH SUMMARY")
+        print("=" * 96)
+        print(f"{'scenario':<18} {'seed':>5} {'status':<8} {'wall s':>8} {'trips':>7} {'arrived':>8} "
+              f"{'teleports':>9} {'duration':>9} {'waiting':>8} {'loss':>8}")
+        print("-" * 96)
+        for result in results:
+            print(f"{result['scenario']:<18} {result['seed']:>5} {result['status'][:8]:<8} "
+                  f"{result.get('wall_seconds', 0):>8.1f} {result.get('trips', 0):>7} "
+                  f"{result.get('arrived', 0):>8} {result.get('teleports', 0):>9} "
+                  f"{result.get('mean_duration', 0):>9.1f} {result.get('mean_waiting_time', 0):>8.1f} "
+                  f"{result.get('mean_time_loss', 0):>8.1f}")
+        print("=" * 96)
+        print(f"✅ Summary saved to {csv_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run SUMO configs × seeds in parallel and summarize them")
+    parser.add_argument('configs', nargs='*', default=DEFAULT_CONFIGS, help="SUMO config files")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3, 4, 5], help="Random seeds per config")
+    parser.add_argument('--workers', type=int, default=None, help="Parallel runs (default: available cores)")
+    parser.add_argument('--threads', type=int, default=1, help="SUMO threads per run")
+    parser.add_argument('--sumo-binary', default="sumo", help="SUMO binary to run")
+    parser.add_argument('--end', type=float, default=None, help="Override the simulation end time")
+    parser.add_argument('--skip-output', nargs='*', default=['fcd-output'],
+                        help="Config outputs to switch off (default: fcd-output)")
+    parser.add_argument('--output-root', default=None,
+                        help="Directory for run outputs (default: batch_runs/<timestamp>)")
+    args = parser.parse_args()
+
+    output_root = args.output_root or os.path.join("batch_runs", datetime.now().strftime("%Y%m%d_%H%M%S"))
+    runner = BatchRunner(args.configs, args.seeds, output_root, workers=args.workers,
+                         sumo_binary=args.sumo_binary, threads=args.threads,
+                         skip_outputs=args.skip_output, end=args.end)
+    results = runner.run()
+    if results is None:
+        return 1
+    return 0 if all(result['status'] == 'ok' for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
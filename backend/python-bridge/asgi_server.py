@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Asyncio serving mode for the SUMO bridge
+Serves the parameterless snapshot views and /stream straight from the frame
+cache on the event loop, so polling clients cost no thread and a cache hit
+never waits on a lock. Every other route of setup_routes, including the
+scenario mounts, runs in the Flask app on a bounded thread pool. The update
+thread keeps stepping SUMO on its own; the event loop only reads the
+published snapshot and the frames encoded from it
+
+Usage:
+    SERVER_MODE=asgi python sumo_bridge.py
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+from werkzeug.http import parse_etags
+
+from frame_stream import sse_frame
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncFrameSubscriber:
+    """/stream subscriber whose queue lives on the event loop; the update thread calls offer()"""
+
+    def __init__(self, loop, max_frames=1):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_frames)
+        self.dropped = 0
+
+    def offer(self, snapshot):
+        try:
+            self.loop.call_soon_threadsafe(self.put, snapshot)
+        except RuntimeError:
+            # The event loop has been closed during shutdown
+            pass
+
+    def put(self, snapshot):
+        """Queue a snapshot, dropping the oldest queued one if full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(snapshot)
+
+
+class BridgeASGI:
+    """ASGI app for a bridge: snapshot views on the event loop, everything else through Flask"""
+
+    def __init__(self, bridge, workers=16):
+        self.bridge = bridge
+        self.wsgi = WSGIMiddleware(bridge.app, workers=workers)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD') and not scope['query_string']:
+            bridge, path = self.resolve(scope['path'])
+            if bridge is not None:
+                if path in bridge.snapshot_views:
+                    await self.snapshot_view(bridge, path, scope, send)
+                    return
+                if path == '/stream' and scope['method'] == 'GET':
+                    await self.stream(bridge, scope, receive, send)
+                    return
+        await self.wsgi(scope, receive, send)
+
+    def resolve(self, path):
+        """The bridge serving a path and the path within it; scenarios live under /scenarios/<id>/"""
+        scenarios = self.bridge.scenarios
+        if scenarios is not None and path.startswith('/scenarios/'):
+            scenario_id, _, rest = path[len('/scenarios/'):].partition('/')
+            return scenarios.bridges.get(scenario_id), '/' + rest
+        return self.bridge, path
+
+    def headers(self, scope, content_type):
+        """Response headers shared by every fast-path response, with the same CORS headers as flask-cors"""
+        request_headers = dict(scope['headers'])
+        headers = [(b'content-type', content_type), (b'cache-control', b'no-cache')]
+        origin = request_headers.get(b'origin')
+        if origin:
+            headers.extend([(b'access-control-allow-origin', origin), (b'vary', b'Origin')])
+        else:
+            headers.append((b'access-control-allow-origin', b'*'))
+        return request_headers, headers
+
+    async def snapshot_view(self, bridge, path, scope, send):
+        """Serve a view of the current snapshot from the frame cache with ETag/304 support"""
+        started = time.perf_counter()
+        view, build = bridge.snapshot_views[path]
+        request_headers, headers = self.headers(scope, b'application/json')
+        snapshot = bridge.snapshot
+        frame_cache = bridge.frame_cache
+        compressed = bridge.frame_gzip and b'gzip' in request_headers.get(b'accept-encoding', b'')
+        etag = frame_cache.etag(snapshot, view, compressed)
+
+        if_none_match = request_headers.get(b'if-none-match')
+        if if_none_match and parse_etags(if_none_match.decode('latin-1')).contains(etag):
+            status = 304
+            body = b''
+        else:
+            status = 200
+            body = frame_cache.peek(snapshot, view, compressed)
+            if body is None:
+                # The first request of a step encodes it off the event loop
+                body, etag = await asyncio.get_running_loop().run_in_executor(
+                    None, frame_cache.get, snapshot, view, build, compressed)
+            if compressed:
+                headers.append((b'content-encoding', b'gzip'))
+            headers.append((b'content-length', str(len(body)).encode('ascii')))
+
+        headers.extend([(b'etag', f'"{etag}"'.encode('ascii')), (b'vary', b'Accept-Encoding')])
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body if scope['method'] == 'GET' else b''})
+        bridge.metrics.request_seconds.observe(time.perf_counter() - started, endpoint=path,
+                                               method=scope['method'], status=status)
+
+    async def stream(self, bridge, scope, receive, send):
+        """Server-Sent Events stream of /all-data frames, one per step, without a thread per client"""
+        loop = asyncio.get_running_loop()
+        subscriber = bridge.frame_stream.subscribe(AsyncFrameSubscriber(loop, bridge.frame_stream.max_frames))
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        view, build = bridge.snapshot_views['/all-data']
+        _, headers = self.headers(scope, b'text/event-stream')
+        headers.append((b'x-accel-buffering', b'no'))
+
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': b'retry: 1000\n\n', 'more_body': True})
+            snapshot = bridge.snapshot
+            last_etag = None
+
+            while True:
+                if snapshot is None:
+                    # Comment line keeps proxies open
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                else:
+                    body = bridge.frame_cache.peek(snapshot, view)
+                    etag = bridge.frame_cache.etag(snapshot, view)
+                    if body is None:
+                        body, etag = await loop.run_in_executor(None, bridge.frame_cache.get, snapshot, view, build)
+                    if etag != last_etag:
+                        last_etag = etag
+                        await send({'type': 'http.response.body', 'body': sse_frame(etag, body), 'more_body': True})
+
+                next_snapshot = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait((next_snapshot, disconnected), timeout=bridge.stream_keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    next_snapshot.cancel()
+                    break
+                if next_snapshot in done:
+                    snapshot = next_snapshot.result()
+                else:
+                    next_snapshot.cancel()
+                    snapshot = None
+        finally:
+            bridge.frame_stream.unsubscribe(subscriber)
+            disconnected.cancel()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def serve(bridge, host='0.0.0.0', port=8814):
+    """Run a bridge's API on uvicorn until interrupted"""
+    # Flask routes that reach the thread pool: control commands, parameterised views, scenarios
+    workers = int(os.getenv('ASGI_WSGI_WORKERS', '16'))
+    uvicorn.run(BridgeASGI(bridge, workers=workers), host=host, port=port, lifespan='off',
+                access_log=False, log_level=os.getenv('ASGI_LOG_LEVEL', 'warning'))
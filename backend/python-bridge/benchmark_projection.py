@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Projection benchmark
+Times NetworkProjection.project for random positions inside a network's
+boundary and reports the median time per call and the maximum error
+against the exact projection.
+
+Usage:
+    python benchmark_projection.py [--net PATH] [--counts 10000 50000] [--repeat 200]
+"""
+
+import argparse
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from geo_projection import METERS_PER_DEGREE, NetworkProjection, project_exact
+from network_geometry import find_net_file, read_location
+
+
+def default_net():
+    """Return the network of the AddisAbaba config used by the bridge"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(script_dir))
+    return find_net_file(os.path.join(project_root, 'AddisAbabaSumo', 'AddisAbaba.sumocfg'))
+
+
+def max_error_meters(lat, lng, exact_lat, exact_lng):
+    return float(np.max(np.hypot((lat - exact_lat) * METERS_PER_DEGREE,
+                                 (lng - exact_lng) * METERS_PER_DEGREE * np.cos(np.radians(exact_lat)))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vectorized network projection')
+    parser.add_argument('--net', default=default_net(), help='SUMO network file')
+    parser.add_argument('--counts', type=int, nargs='+', default=[10000, 50000], help='Positions per call')
+    parser.add_argument('--repeat', type=int, default=200, help='Calls per timing round')
+    args = parser.parse_args()
+
+    location = read_location(args.net)
+    projection = NetworkProjection(location)
+    x0, y0, x1, y1 = (float(value) for value in location['convBoundary'].split(','))
+    print(f"{platform.processor() or platform.machine()}, Python {platform.python_version()}, numpy {np.__version__}")
+    print(f"{args.net}: {location.get('projParameter', '!')}")
+    print(f"fitted polynomial: {projection.use_fit} (fit error {projection.fit_error * 1000:.3f} mm)")
+    print(f"{'positions':>10} {'median ms':>10} {'min ms':>8} {'max error mm':>13}")
+
+    rng = np.random.default_rng(0)
+    for count in args.counts:
+        xs = rng.uniform(x0, x1, count)
+        ys = rng.uniform(y0, y1, count)
+        lat, lng = projection.project(xs, ys)
+        error = max_error_meters(lat, lng, *project_exact(projection.location, xs, ys))
+
+        rounds = []
+        for _ in range(7):
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                projection.project(xs, ys)
+            rounds.append((time.perf_counter() - started) / args.repeat)
+        rounds.sort()
+        print(f"{count:>10} {rounds[len(rounds) // 2] * 1000:>10.3f} {rounds[0] * 1000:>8.3f} {error * 1000:>13.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Vehicle collection benchmark
+Compares per-vehicle polling with subscription-based collection at several
+vehicle counts and reports TraCI calls per step and wall time per step.
+
+Usage:
+    python benchmark_vehicle_collection.py [--config PATH] [--counts 1000 5000 10000]
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+
+import traci
+
+from bridge_metrics import TraciCallCounter
+from sumo_bridge import SUMOBridge
+
+logging.basicConfig(level=logging.WARNING)
+
+# Unique IDs for vehicles inserted by the benchmark
+BENCH_VEHICLE_IDS = itertools.count()
+
+
+def default_config():
+    """Return the AddisAbaba config used by the bridge"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(script_dir))
+    return os.path.join(project_root, 'AddisAbabaSumo', 'AddisAbaba.sumocfg')
+
+
+def fill_network(target, max_steps, burst):
+    """Step and insert extra vehicles until `target` vehicles are running"""
+    routes = list(traci.route.getIDList())
+
+    for _ in range(max_steps):
+        running = traci.vehicle.getIDCount()
+        if running >= target:
+            break
+
+        pending = len(traci.simulation.getPendingVehicles())
+        for _ in range(max(0, min(target - running - pending, burst))):
+            if not routes:
+                break
+            route_id = random.choice(routes)
+            try:
+                traci.vehicle.add(f"bench_{next(BENCH_VEHICLE_IDS)}", route_id,
+                                  departLane="random", departPos="random", departSpeed="max")
+            except traci.TraCIException:
+                # Embedded routes disappear once their vehicle arrives
+                routes.remove(route_id)
+
+        traci.simulationStep()
+        if len(routes) < 10:
+            routes = list(traci.route.getIDList())
+
+    return traci.vehicle.getIDCount()
+
+
+def unsubscribe_vehicles():
+    """Drop the vehicle subscriptions left by an earlier subscription run"""
+    for vehicle_id in list(traci.vehicle.getAllSubscriptionResults()):
+        traci.vehicle.unsubscribe(vehicle_id)
+
+
+def measure(bridge, counter, mode, steps):
+    """Run `steps` steps in the given mode and time stepping and collection"""
+    bridge.vehicle_collection_mode = mode
+    bridge.vehicle_subscriptions.reset()
+    if mode == 'polling':
+        # SUMO would otherwise keep computing and sending results for every
+        # vehicle subscribed at a lower target, inflating the polling step time
+        unsubscribe_vehicles()
+
+    # Warm-up step so initial subscriptions are not counted
+    traci.simulationStep()
+    bridge.collect_vehicles_data()
+
+    total_calls = 0
+    step_time = 0.0
+    collect_time = 0.0
+    total_vehicles = 0
+
+    for _ in range(steps):
+        calls_before = counter.calls
+        started = time.perf_counter()
+        traci.simulationStep()
+        stepped = time.perf_counter()
+        vehicles, emergency_vehicles = bridge.collect_vehicles_data()
+        collect_time += time.perf_counter() - stepped
+        step_time += stepped - started
+        total_calls += counter.calls - calls_before
+        total_vehicles += len(vehicles) + len(emergency_vehicles)
+
+    # Subscription results are parsed inside simulationStep, so both
+    # phases are reported
+    return (total_vehicles / steps, total_calls / steps,
+            step_time * 1000.0 / steps, collect_time * 1000.0 / steps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark SUMO bridge vehicle collection')
+    parser.add_argument('--config', default=default_config(), help='SUMO config file')
+    parser.add_argument('--sumo-binary', default='sumo', help='SUMO binary to run')
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 5000, 10000],
+                        help='Vehicle counts to benchmark')
+    parser.add_argument('--steps', type=int, default=10, help='Measured steps per mode')
+    parser.add_argument('--fill-steps', type=int, default=3600,
+                        help='Maximum steps spent reaching each vehicle count')
+    parser.add_argument('--burst', type=int, default=200, help='Vehicles inserted per fill step')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        print(f"Config file not found: {args.config}")
+        return 1
+
+    random.seed(42)
+    traci.start([
+        args.sumo_binary,
+        "-c", os.path.abspath(args.config),
+        "--no-warnings",
+        "--no-step-log",
+        "--xml-validation", "never",
+        "--ignore-route-errors",
+        "--time-to-teleport", "600",
+        "--max-num-vehicles", str(max(args.counts) * 2)
+    ])
+
+    try:
+        bridge = SUMOBridge()
+        bridge.connected = True
+        counter = TraciCallCounter()
+
+        print(f"{'target':>8} {'running':>8} {'mode':>13} {'calls/step':>11} "
+              f"{'step ms':>9} {'collect ms':>11} {'total ms':>9}")
+        for target in sorted(args.counts):
+            running = fill_network(target, args.fill_steps, args.burst)
+            if running < target:
+                print(f"Only reached {running} of {target} vehicles")
+
+            for mode in ('polling', 'subscription'):
+                vehicles, calls, step_ms, collect_ms = measure(bridge, counter, mode, args.steps)
+                print(f"{target:>8} {vehicles:>8.0f} {mode:>13} {calls:>11.1f} "
+                      f"{step_ms:>9.1f} {collect_ms:>11.1f} {step_ms + collect_ms:>9.1f}", flush=True)
+    finally:
+        traci.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
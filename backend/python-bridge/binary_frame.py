@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Columnar binary frames for the SUMO bridge
+Encodes the vehicles of a snapshot as little-endian column arrays instead of
+one JSON object per vehicle. Vehicle, road and lane ids are interned in a
+string table that lives for one run; each response carries only the table
+entries the client does not have yet.
+
+Response layout (all integers little-endian):
+    magic            4 bytes  b'SBF1'
+    dictionaryStart  uint32   index of the first table entry in this response
+    dictionaryCount  uint32   number of table entries in this response
+    dictionaryBytes  uint32   length of the UTF-8 blob, entries separated by NUL
+    dictionary       blob, zero-padded to a multiple of 4
+    frame            see encode_frame
+"""
+
+import json
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b'SBF1'
+
+# Frame header: step, vehicleCount, simulationTime, timestamp (ms),
+# dictionarySize, jsonBytes
+FRAME_HEADER = struct.Struct('<IIddII')
+DICTIONARY_HEADER = struct.Struct('<4sIII')
+
+VEHICLE_TYPES = ('car', 'bus', 'truck', 'motorcycle', 'bicycle', 'emergency')
+EMERGENCY_TYPES = (None, 'ambulance', 'police', 'fire', 'rescue')
+
+TYPE_CODES = {name: code for code, name in enumerate(VEHICLE_TYPES)}
+EMERGENCY_CODES = {name: code for code, name in enumerate(EMERGENCY_TYPES)}
+
+FLOAT_COLUMNS = (
+    ('lat', lambda vehicle: vehicle['position']['lat']),
+    ('lng', lambda vehicle: vehicle['position']['lng']),
+    ('speed', lambda vehicle: vehicle['speed']),
+    ('angle', lambda vehicle: vehicle['angle']),
+    ('waitingTime', lambda vehicle: vehicle['waitingTime']),
+    ('distance', lambda vehicle: vehicle['distance'])
+)
+
+
+def padding(length):
+    return b'\0' * (-length % 4)
+
+
+class StringTable:
+    """Append-only id dictionary shared by every binary frame of one run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.strings = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern_all(self, values):
+        """Table indices of the values as a uint32 array, adding unseen values"""
+        indices = self.indices
+        result = []
+        with self.lock:
+            for value in values:
+                index = indices.get(value)
+                if index is None:
+                    index = indices[value] = len(self.strings)
+                    self.strings.append(value)
+                result.append(index)
+        return np.array(result, dtype='<u4')
+
+    def resolve(self, indices):
+        """Strings for an array of table indices"""
+        strings = self.strings
+        return [strings[index] for index in indices.tolist()]
+
+    def entries(self, start, end):
+        with self.lock:
+            return self.strings[start:end]
+
+
+def encode_frame(snapshot, strings):
+    """
+    Encode a snapshot as a binary frame:
+
+        header       FRAME_HEADER (32 bytes)
+        id           uint32[n]   string table indices
+        roadId       uint32[n]
+        laneId       uint32[n]
+        routeId      uint32[n]   see /routes/<id>
+        lat, lng, speed, angle, waitingTime, distance
+                     float32[n] each; speed in km/h
+        type         uint8[n]    index into VEHICLE_TYPES
+        emergency    uint8[n]    index into EMERGENCY_TYPES, 0 for regular vehicles
+        padding      to a multiple of 4
+        json         UTF-8 {"intersections", "roads", "stats"}
+
+    Emergency vehicles follow the regular vehicles. The frame only refers to
+    table entries below its dictionarySize, so it can be cached and sent to
+    every client whatever part of the table they already hold.
+    """
+    vehicles = snapshot.vehicles + snapshot.emergency_vehicles
+    count = len(vehicles)
+
+    ids = strings.intern_all(vehicle['id'] for vehicle in vehicles)
+    road_ids = strings.intern_all(vehicle['position']['roadId'] for vehicle in vehicles)
+    lane_ids = strings.intern_all(vehicle['position']['laneId'] for vehicle in vehicles)
+    route_ids = strings.intern_all(vehicle['routeId'] for vehicle in vehicles)
+    columns = [ids.tobytes(), road_ids.tobytes(), lane_ids.tobytes(), route_ids.tobytes()]
+
+    for _, read in FLOAT_COLUMNS:
+        columns.append(np.fromiter((read(vehicle) for vehicle in vehicles), dtype='<f4', count=count).tobytes())
+
+    types = np.fromiter((TYPE_CODES.get(vehicle['type'], 0) for vehicle in vehicles), dtype=np.uint8, count=count)
+    emergency = np.fromiter((EMERGENCY_CODES.get(vehicle.get('emergencyType'), 0) for vehicle in vehicles),
+                            dtype=np.uint8, count=count)
+    columns.extend((types.tobytes(), emergency.tobytes(), padding(2 * count)))
+
+    trailer = json.dumps({
+        'intersections': snapshot.intersections,
+        'roads': snapshot.roads,
+        'stats': snapshot.stats
+    }, separators=(',', ':')).encode('utf-8')
+
+    header = FRAME_HEADER.pack(snapshot.step, count, snapshot.sim_time, snapshot.created_at * 1000,
+                               len(strings), len(trailer))
+    return b''.join([header] + columns + [trailer])
+
+
+def frame_dictionary_size(frame):
+    """Number of string table entries a frame may refer to"""
+    return FRAME_HEADER.unpack_from(frame)[4]
+
+
+def build_response(strings, known, frame):
+    """Prefix a cached frame with the table entries from `known` up to what it uses"""
+    end = frame_dictionary_size(frame)
+    start = min(known, end)
+    blob = '\0'.join(strings.entries(start, end)).encode('utf-8')
+    return b''.join((DICTIONARY_HEADER.pack(MAGIC, start, end - start, len(blob)), blob, padding(len(blob)), frame))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Metrics for the SUMO bridge
+Fixed-bucket histograms for the update loop phases, frame serialization and
+HTTP requests, exposed in Prometheus text format and as JSON
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import traci
+
+# Latency buckets in seconds
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Buckets for per-step counts such as TraCI calls or vehicles
+COUNT_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+class TraciCallCounter:
+    """Counts TraCI commands sent over the active connection"""
+
+    def __init__(self, connection=None):
+        self.calls = 0
+        connection = connection or traci.getConnection()
+        send_cmd = connection._sendCmd
+
+        def counting_send_cmd(*args, **kwargs):
+            self.calls += 1
+            return send_cmd(*args, **kwargs)
+
+        connection._sendCmd = counting_send_cmd
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, buckets, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        """Copy of all series as (labels, cumulative bucket counts, sum, count)"""
+        with self.lock:
+            items = [(key, list(series['buckets']), series['sum'], series['count'])
+                     for key, series in sorted(self.series.items())]
+        result = []
+        for key, buckets, total, count in items:
+            cumulative = []
+            running = 0
+            for value in buckets:
+                running += value
+                cumulative.append(running)
+            result.append((dict(zip(self.label_names, key)), cumulative, total, count))
+        return result
+
+    def quantile(self, cumulative, count, q):
+        """Estimate a quantile by linear interpolation within its bucket"""
+        if count == 0:
+            return None
+        rank = q * count
+        lower = 0.0
+        previous = 0
+        for bound, running in zip(self.buckets, cumulative):
+            if running >= rank:
+                in_bucket = running - previous
+                fraction = (rank - previous) / in_bucket if in_bucket else 0.0
+                return lower + (bound - lower) * fraction
+            lower = bound
+            previous = running
+        # Beyond the largest bucket
+        return self.buckets[-1]
+
+
+class BridgeMetrics:
+    """Registry of the bridge's histograms"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.step_seconds = Histogram(
+            'bridge_simulation_step_seconds', 'Latency of traci.simulationStep()', SECONDS_BUCKETS)
+        self.collect_seconds = Histogram(
+            'bridge_collect_seconds', 'Time spent collecting one update, by phase', SECONDS_BUCKETS, ('phase',))
+        self.serialize_seconds = Histogram(
+            'bridge_serialize_seconds', 'Time spent encoding a snapshot view', SECONDS_BUCKETS, ('view', 'encoding'))
+        self.request_seconds = Histogram(
+            'bridge_request_seconds', 'HTTP request latency by endpoint', SECONDS_BUCKETS, ('endpoint', 'method', 'status'))
+        self.command_seconds = Histogram(
+            'bridge_command_seconds', 'Time from queueing a TraCI command to its result', SECONDS_BUCKETS, ('command',))
+        self.traci_calls = Histogram(
+            'bridge_traci_calls_per_step', 'TraCI commands sent per published update', COUNT_BUCKETS)
+        self.vehicles = Histogram(
+            'bridge_vehicles_per_step', 'Running vehicles per published update', COUNT_BUCKETS)
+        self.histograms = (self.step_seconds, self.collect_seconds, self.serialize_seconds,
+                           self.request_seconds, self.command_seconds, self.traci_calls, self.vehicles)
+
+        self.call_counter = None
+        self.calls_at_last_update = 0
+
+    def attach(self, connection=None):
+        """Start counting TraCI calls on a new connection"""
+        self.call_counter = TraciCallCounter(connection)
+        self.calls_at_last_update = 0
+
+    def observe_update(self, vehicle_count):
+        """Record per-update counters once a frame has been published"""
+        self.vehicles.observe(vehicle_count)
+        if self.call_counter is not None:
+            calls = self.call_counter.calls
+            self.traci_calls.observe(calls - self.calls_at_last_update)
+            self.calls_at_last_update = calls
+
+    @contextmanager
+    def timer(self, histogram, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - started, **labels)
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for histogram in self.histograms:
+            lines.append(f'# HELP {histogram.name} {histogram.help_text}')
+            lines.append(f'# TYPE {histogram.name} histogram')
+            for labels, cumulative, total, count in histogram.snapshot():
+                base = ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items())
+                prefix = base + ',' if base else ''
+                for bound, running in zip(histogram.buckets, cumulative):
+                    lines.append(f'{histogram.name}_bucket{{{prefix}le="{bound:g}"}} {running}')
+                lines.append(f'{histogram.name}_bucket{{{prefix}le="+Inf"}} {count}')
+                suffix = f'{{{base}}}' if base else ''
+                lines.append(f'{histogram.name}_sum{suffix} {total:.9g}')
+                lines.append(f'{histogram.name}_count{suffix} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def as_json(self):
+        """Summaries with estimated quantiles for dashboards and quick checks"""
+        metrics = {}
+        for histogram in self.histograms:
+            series = []
+            for labels, cumulative, total, count in histogram.snapshot():
+                series.append({
+                    'labels': labels,
+                    'count': count,
+                    'sum': total,
+                    'mean': total / count if count else None,
+                    'p50': histogram.quantile(cumulative, count, 0.5),
+                    'p95': histogram.quantile(cumulative, count, 0.95),
+                    'p99': histogram.quantile(cumulative, count, 0.99),
+                    'buckets': dict(zip((f'{bound:g}' for bound in histogram.buckets), cumulative))
+                })
+            metrics[histogram.name] = {'help': histogram.help_text, 'series': series}
+        return {
+            'uptimeSeconds': time.time() - self.started_at,
+            'metrics': metrics
+        }
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Step-boundary command queue for the SUMO bridge
+The TraCI socket is not thread-safe, so HTTP request threads do not call
+TraCI themselves. They enqueue typed commands and wait on a future while the
+thread that steps the simulation applies every pending command in one batch
+between steps. Control latency is bounded by one pass of the update loop and
+the socket never sees concurrent requests
+"""
+
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ABC):
+    """A TraCI operation applied by the thread that owns the connection"""
+
+    name = 'command'
+
+    @abstractmethod
+    def apply(self, bridge):
+        """Run the command against `bridge.traci` and return its result"""
+
+
+class SimulationStatus(Command):
+    """Current simulation time and vehicle counts"""
+
+    name = 'simulation-status'
+
+    def apply(self, bridge):
+        simulation = bridge.traci.simulation
+        return {
+            'simulation_time': bridge.safe_float(simulation.getTime()),
+            'vehicle_count': bridge.traci.vehicle.getIDCount(),
+            'loaded_count': simulation.getLoadedNumber(),
+            'departed_count': simulation.getDepartedNumber()
+        }
+
+
+class TrafficLightOverride(Command):
+    """Force a traffic light to one colour"""
+
+    name = 'traffic-light'
+
+    def __init__(self, intersection_id, phase, duration):
+        self.intersection_id = intersection_id
+        self.phase = phase
+        self.duration = duration
+
+    def apply(self, bridge):
+        return bridge.override_traffic_light(self.intersection_id, self.phase, self.duration)
+
+
+class CommandQueue:
+    """Pending commands and the lock held by whichever thread uses the connection"""
+
+    def __init__(self, observe=None):
+        """`observe(command, seconds)` is called with each command's latency from enqueueing to its result"""
+        self.pending = deque()
+        self.lock = threading.Lock()
+        # Held by the update loop while it steps and collects, and by request
+        # threads that apply commands themselves while no update loop runs
+        self.connection_lock = threading.Lock()
+        self.observe = observe
+
+    def submit(self, command):
+        """Enqueue a command and return a future for its result"""
+        future = Future()
+        with self.lock:
+            self.pending.append((command, future, time.perf_counter()))
+        return future
+
+    def apply_pending(self, bridge):
+        """
+        Apply every pending command in submission order. The caller must hold
+        connection_lock; a failing command sets its future's exception and
+        does not stop the batch. Returns the number of commands applied.
+        """
+        with self.lock:
+            batch, self.pending = self.pending, deque()
+
+        for command, future, submitted in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(command.apply(bridge))
+            except Exception as e:
+                logger.error(f"Command {command.name} failed: {e}")
+                future.set_exception(e)
+            if self.observe is not None:
+                self.observe(command, time.perf_counter() - submitted)
+        return len(batch)
+
+    def cancel_pending(self, reason):
+        """Fail every pending command, e.g. because the connection is closing"""
+        with self.lock:
+            batch, self.pending = self.pending, deque()
+        for _, future, _ in batch:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError(reason))
+        return len(batch)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
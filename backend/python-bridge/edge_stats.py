@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Whole-network edge statistics for the SUMO bridge
+Keeps per-edge and per-lane traffic state in arrays indexed by the network
+geometry's edge index. Each step only the edges that are occupied now or
+were occupied in the previous step are touched, using the road and lane ids
+already present in the vehicle records, so the cost follows the number of
+occupied edges rather than the size of the network
+"""
+
+import numpy as np
+
+# Mean speeds (m/s) below which an edge counts as congested
+HIGH_CONGESTION_SPEED = 5.0
+MEDIUM_CONGESTION_SPEED = 15.0
+
+# SUMO's halting threshold for getLastStepHaltingNumber
+HALTING_SPEED = 0.1
+
+
+class EdgeStats:
+    """Per-edge vehicle counts and speeds for every edge of a network"""
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        edge_count = geometry.edge_count
+
+        # Static data, read once from the network: lane j of edge i lives at
+        # lane_offsets[i] + j in the per-lane arrays
+        self.lane_counts = geometry.edge_lane_counts.astype(np.int32)
+        self.lane_offsets = np.zeros(edge_count + 1, dtype=np.int32)
+        np.cumsum(self.lane_counts, out=self.lane_offsets[1:])
+        self.lengths = geometry.edge_lengths
+        self.speed_limits = geometry.edge_speeds
+
+        self.vehicle_counts = np.zeros(edge_count, dtype=np.int32)
+        self.halting_counts = np.zeros(edge_count, dtype=np.int32)
+        self.lane_vehicle_counts = np.zeros(self.lane_offsets[-1], dtype=np.int32)
+        self.lane_speed_sums = np.zeros(self.lane_offsets[-1], dtype=np.float64)
+
+        # Edge indices occupied after the last update; together with the
+        # current step's edges these are the only entries an update touches
+        self.occupied = np.empty(0, dtype=np.int64)
+
+    def update(self, vehicles):
+        """Refresh the state of occupied and previously occupied edges from vehicle records"""
+        self.update_lanes((vehicle['position']['roadId'] for vehicle in vehicles),
+                          (vehicle['position']['laneId'] for vehicle in vehicles),
+                          (vehicle['speed'] / 3.6 for vehicle in vehicles))  # Records carry km/h
+
+    def update_lanes(self, road_ids, lane_ids, speeds):
+        """Refresh the edge state from every vehicle's road id, lane id and speed (m/s)"""
+        edge_index = self.geometry.edge_index
+        lane_offsets = self.lane_offsets
+        lane_counts = self.lane_counts
+        edges = []
+        lanes = []
+        lane_speeds = []
+
+        for road_id, lane_id, speed in zip(road_ids, lane_ids, speeds):
+            index = edge_index.get(road_id)
+            if index is None:
+                # Internal (junction) edges are not part of the road map
+                continue
+            try:
+                lane_number = int(lane_id.rsplit('_', 1)[1])
+            except (IndexError, ValueError):
+                continue
+            if lane_number >= lane_counts[index]:
+                continue
+            edges.append(index)
+            lanes.append(lane_offsets[index] + lane_number)
+            lane_speeds.append(speed)
+
+        edges = np.array(edges, dtype=np.int64)
+        lanes = np.array(lanes, dtype=np.int64)
+        speeds = np.array(lane_speeds, dtype=np.float64)
+
+        # Clear what the previous step left behind, then accumulate this step
+        previous = self.occupied
+        self.vehicle_counts[previous] = 0
+        self.halting_counts[previous] = 0
+        previous_lanes = self.lane_ranges(previous)
+        self.lane_vehicle_counts[previous_lanes] = 0
+        self.lane_speed_sums[previous_lanes] = 0.0
+
+        np.add.at(self.vehicle_counts, edges, 1)
+        np.add.at(self.halting_counts, edges, (speeds < HALTING_SPEED).astype(np.int32))
+        np.add.at(self.lane_vehicle_counts, lanes, 1)
+        np.add.at(self.lane_speed_sums, lanes, speeds)
+
+        self.occupied = np.unique(edges)
+
+    def lane_ranges(self, edges):
+        """Per-lane array indices of all lanes of the given edges"""
+        if len(edges) == 0:
+            return np.empty(0, dtype=np.int64)
+        counts = self.lane_counts[edges]
+        starts = np.repeat(self.lane_offsets[edges], counts)
+        steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return starts + steps
+
+    def mean_speeds(self, edges):
+        """
+        Mean speeds (m/s) of edges as traci.edge.getLastStepMeanSpeed defines
+        them: lane means weighted by vehicle count, an empty lane counting as
+        one vehicle at the speed limit
+        """
+        if len(edges) == 0:
+            return np.empty(0, dtype=np.float64)
+        lanes = self.lane_ranges(edges)
+        counts = self.lane_vehicle_counts[lanes]
+        limits = np.repeat(self.speed_limits[edges], self.lane_counts[edges])
+        speed_sums = np.where(counts > 0, self.lane_speed_sums[lanes], limits)
+        starts = np.cumsum(self.lane_counts[edges]) - self.lane_counts[edges]
+        return np.add.reduceat(speed_sums, starts) / np.add.reduceat(np.maximum(counts, 1), starts)
+
+    def congestion_level(self, mean_speed):
+        if mean_speed < HIGH_CONGESTION_SPEED:
+            return 'high'
+        if mean_speed < MEDIUM_CONGESTION_SPEED:
+            return 'medium'
+        return 'low'
+
+    def road_record(self, index, mean_speed, timestamp):
+        """Road record for one edge in the /roads format"""
+        edge_id = self.geometry.edge_ids[index]
+        length_km = float(self.lengths[index]) / 1000
+        speed_limit = float(self.speed_limits[index])
+        lanes = []
+
+        for lane_number in range(self.lane_counts[index]):
+            lane = self.lane_offsets[index] + lane_number
+            count = int(self.lane_vehicle_counts[lane])
+            lane_speed = self.lane_speed_sums[lane] / count if count else speed_limit
+            lanes.append({
+                'id': f'{edge_id}_{lane_number}',
+                'vehicleCount': count,
+                'averageSpeed': lane_speed * 3.6,  # Convert to km/h
+                'density': count / length_km if length_km > 0 else 0,
+                'flow': count * 3600 / max(1.0, lane_speed) if lane_speed > 0 else 0
+            })
+
+        return {
+            'id': str(edge_id),
+            'coordinates': self.geometry.edge_coordinates(str(edge_id)),
+            'lanes': lanes,
+            'vehicleCount': int(self.vehicle_counts[index]),
+            'haltingCount': int(self.halting_counts[index]),
+            'congestionLevel': self.congestion_level(mean_speed),
+            'incidents': [],
+            'timestamp': timestamp
+        }
+
+    def road_records(self, timestamp):
+        """Road records for every currently occupied edge"""
+        mean_speeds = self.mean_speeds(self.occupied).tolist()
+        return [self.road_record(index, mean_speed, timestamp)
+                for index, mean_speed in zip(self.occupied.tolist(), mean_speeds)]
+
+    def summary(self):
+        """Network-wide counters for the simulation stats"""
+        occupied = self.occupied
+        mean_speeds = self.mean_speeds(occupied)
+        return {
+            'totalEdges': int(self.geometry.edge_count),
+            'occupiedEdges': int(len(occupied)),
+            'congestedEdges': int(np.count_nonzero(mean_speeds < HIGH_CONGESTION_SPEED)),
+            'haltingVehicles': int(self.halting_counts[occupied].sum())
+        }
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Serialized frame cache for the SUMO bridge
+Encodes each published snapshot once per view and serves the cached bytes
+(optionally gzip-compressed) to every client polling the same step
+"""
+
+import gzip
+import json
+import threading
+import time
+import uuid
+
+
+class FrameCache:
+    """Caches the encoded views of the current snapshot"""
+
+    def __init__(self, gzip_level=5, observe=None):
+        self.gzip_level = gzip_level
+        # Optional observe(view, encoding, seconds) hook for encode timings
+        self.observe = observe
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.frames = {}
+        self.new_run()
+
+    def new_run(self):
+        """Start a new run id so ETags from a previous connection never match"""
+        with self.lock:
+            self.run_id = uuid.uuid4().hex[:8]
+            self.snapshot = None
+            self.frames = {}
+            self.current = (None, self.frames)
+
+    def etag(self, snapshot, view, compressed=False):
+        """ETag for a view of a snapshot, tied to run and step number"""
+        suffix = '-gz' if compressed else ''
+        return f'{self.run_id}-{snapshot.step}-{view}{suffix}'
+
+    def encode(self, snapshot, view, build, compressed):
+        """Encode a payload built from the snapshot; binary views build bytes themselves"""
+        started = time.perf_counter()
+        body = build(snapshot)
+        if isinstance(body, bytes):
+            self.timed(view, 'binary', started)
+        else:
+            body = json.dumps(body, separators=(',', ':')).encode('utf-8')
+            self.timed(view, 'json', started)
+        if compressed:
+            body = self.compress(view, body)
+        return body
+
+    def compress(self, view, body):
+        started = time.perf_counter()
+        body = gzip.compress(body, compresslevel=self.gzip_level)
+        self.timed(view, 'gzip', started)
+        return body
+
+    def timed(self, view, encoding, started):
+        if self.observe is not None:
+            self.observe(view, encoding, time.perf_counter() - started)
+
+    def peek(self, snapshot, view, compressed=False):
+        """Cached body for a view of the snapshot, or None; never waits for the lock"""
+        cached_snapshot, frames = self.current
+        if cached_snapshot is not snapshot:
+            return None
+        return frames.get((view, compressed))
+
+    def get(self, snapshot, view, build, compressed=False):
+        """
+        Return (body, etag) for a view of the snapshot.
+
+        `build(snapshot)` produces the JSON payload and is called at most once
+        per snapshot and view; concurrent requests wait for that encoding
+        instead of repeating it.
+        """
+        etag = self.etag(snapshot, view, compressed)
+
+        with self.lock:
+            if self.snapshot is not snapshot:
+                if self.snapshot is not None and snapshot.created_at < self.snapshot.created_at:
+                    # A request that started before the last publish; encode
+                    # it without evicting the newer frames
+                    return self.encode(snapshot, view, build, compressed), etag
+                self.snapshot = snapshot
+                self.frames = {}
+                # Swapped as one reference so peek() never pairs a snapshot with another's frames
+                self.current = (snapshot, self.frames)
+
+            body = self.frames.get((view, compressed))
+            if body is None:
+                plain = self.frames.get((view, False))
+                if plain is None:
+                    plain = self.encode(snapshot, view, build, False)
+                    self.frames[(view, False)] = plain
+                body = self.compress(view, plain) if compressed else plain
+                self.frames[(view, compressed)] = body
+
+        return body, etag
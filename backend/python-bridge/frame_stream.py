@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Frame streaming for the SUMO bridge
+Fans each published snapshot out to push subscribers. Every subscriber has a
+small bounded queue; when a slow consumer falls behind, its oldest queued
+frame is dropped so it always receives the latest step next
+"""
+
+import queue
+import threading
+
+
+def sse_frame(etag, body):
+    """Server-Sent Event carrying one encoded /all-data frame"""
+    return b'id: ' + etag.encode('ascii') + b'\nevent: frame\ndata: ' + body + b'\n\n'
+
+
+class FrameSubscriber:
+    """Bounded queue of snapshots waiting to be sent to one client"""
+
+    def __init__(self, max_frames=1):
+        self.queue = queue.Queue(maxsize=max_frames)
+        self.dropped = 0
+
+    def offer(self, snapshot):
+        """Queue a snapshot, dropping the oldest queued one if full"""
+        while True:
+            try:
+                self.queue.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def next(self, timeout):
+        """Wait for the next snapshot; None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class FrameBroadcaster:
+    """Registry of stream subscribers fed by the update thread"""
+
+    def __init__(self, max_frames=1):
+        self.max_frames = max_frames
+        self.lock = threading.Lock()
+        self.subscribers = set()
+
+    def subscribe(self, subscriber=None):
+        """Register a subscriber; anything with offer(snapshot) and `dropped` will do"""
+        subscriber = subscriber or FrameSubscriber(self.max_frames)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, snapshot):
+        """Offer a snapshot to every subscriber without blocking"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(snapshot)
+
+    def stats(self):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        return {
+            'subscribers': len(subscribers),
+            'droppedFrames': sum(subscriber.dropped for subscriber in subscribers)
+        }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Network to lat/lng projection for the SUMO bridge
+Converts whole arrays of SUMO x/y positions using the network's <location>
+projection. A cubic polynomial is fitted to the exact projection once per
+network, so projecting every vehicle of a step costs a few array operations
+"""
+
+import logging
+
+import numpy as np
+
+try:
+    import pyproj
+except ImportError:
+    pyproj = None
+
+logger = logging.getLogger(__name__)
+
+# Used when the network has no geo-reference (projParameter "!"): the local
+# approximation around central Addis Ababa the bridge has always used
+DEFAULT_ORIGIN = (9.0320, 38.7469)
+METERS_PER_DEGREE = 111320.0
+
+# Largest fitted-polynomial error accepted before falling back to pyproj
+MAX_FIT_ERROR_METERS = 0.05
+
+
+def project_exact(location, xs, ys):
+    """Project network x/y arrays to (lat, lng) float64 arrays with the net's <location>"""
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    proj_parameter = location.get('projParameter', '!')
+
+    if proj_parameter and proj_parameter != '!' and pyproj is not None:
+        offset_x, offset_y = (float(value) for value in location.get('netOffset', '0,0').split(','))
+        lng, lat = pyproj.Proj(proj_parameter)(xs - offset_x, ys - offset_y, inverse=True)
+        return np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64)
+
+    lat = DEFAULT_ORIGIN[0] + ys / METERS_PER_DEGREE
+    lng = DEFAULT_ORIGIN[1] + xs / (METERS_PER_DEGREE * 0.9)
+    return lat, lng
+
+
+def cubic_terms(u, v):
+    """Design matrix columns, in the order NetworkProjection.evaluate uses them"""
+    return np.column_stack((np.ones_like(u), u, u * u, u ** 3, v, v * v, v ** 3, u * v, u * u * v, u * v * v))
+
+
+# Total degree of each cubic_terms column
+TERM_DEGREES = np.array([0, 1, 2, 3, 1, 2, 3, 2, 3, 3])
+
+
+class NetworkProjection:
+    """Vectorized x/y to lat/lng conversion for one network"""
+
+    def __init__(self, location=None):
+        self.location = dict(location or {})
+        self.workspace = None
+        proj_parameter = self.location.get('projParameter', '!')
+        if proj_parameter and proj_parameter != '!' and pyproj is None:
+            logger.warning("pyproj is not installed; using approximate network coordinates")
+            self.location['projParameter'] = '!'
+
+        x0, y0, x1, y1 = self.boundary()
+        self.center = (np.float32((x0 + x1) / 2), np.float32((y0 + y1) / 2))
+        self.scale = np.float32(2.0 / max(x1 - x0, y1 - y0, 1.0))
+
+        # Fit on a grid over the network, centred so float32 is accurate
+        self.origin = project_exact(self.location, [float(self.center[0])], [float(self.center[1])])
+        self.origin = (float(self.origin[0][0]), float(self.origin[1][0]))
+        xs, ys = (grid.ravel() for grid in np.meshgrid(np.linspace(x0, x1, 17), np.linspace(y0, y1, 17)))
+        lat, lng = project_exact(self.location, xs, ys)
+        terms = cubic_terms(*self.normalize(xs, ys))
+        coefficients = np.stack((np.linalg.lstsq(terms, lat - self.origin[0], rcond=None)[0],
+                                 np.linalg.lstsq(terms, lng - self.origin[1], rcond=None)[0]), axis=1)
+        # Fold the scale into the coefficients so evaluate works on metres from
+        # the centre; one (10, 2, 1) array evaluates lat and lng side by side
+        coefficients *= (float(self.scale) ** TERM_DEGREES)[:, None]
+        self.coefficients = coefficients[:, :, None].astype(np.float32)
+        self.offset = (np.array(self.origin) + coefficients[0])[:, None]
+
+        # Check the fit between the sample points
+        xs, ys = (grid.ravel() for grid in np.meshgrid(np.linspace(x0, x1, 33), np.linspace(y0, y1, 33)))
+        exact_lat, exact_lng = project_exact(self.location, xs, ys)
+        fitted_lat, fitted_lng = self.evaluate(xs.astype(np.float32), ys.astype(np.float32))
+        self.fit_error = float(np.max(np.hypot(
+            (fitted_lat - exact_lat) * METERS_PER_DEGREE,
+            (fitted_lng - exact_lng) * METERS_PER_DEGREE * np.cos(np.radians(exact_lat))
+        )))
+        self.use_fit = self.fit_error <= MAX_FIT_ERROR_METERS
+        if not self.use_fit:
+            logger.warning(f"Projection fit error {self.fit_error:.3f} m is too large; using exact projection")
+
+    def boundary(self):
+        """Network boundary from convBoundary, padded so edge vehicles stay inside the fit"""
+        try:
+            x0, y0, x1, y1 = (float(value) for value in self.location['convBoundary'].split(','))
+        except (KeyError, ValueError):
+            x0, y0, x1, y1 = 0.0, 0.0, 1000.0, 1000.0
+        pad = max(x1 - x0, y1 - y0, 1.0) * 0.05
+        return x0 - pad, y0 - pad, x1 + pad, y1 + pad
+
+    def normalize(self, xs, ys):
+        return ((np.asarray(xs) - float(self.center[0])) * float(self.scale),
+                (np.asarray(ys) - float(self.center[1])) * float(self.scale))
+
+    def buffers(self, count):
+        """
+        Reusable float32 scratch arrays: u and v of one row each, then four
+        (lat, lng) row pairs. Projection runs on the update thread only.
+        """
+        if self.workspace is None or self.workspace.shape[1] < count:
+            self.workspace = np.empty((10, max(count, 1024)), dtype=np.float32)
+        workspace = self.workspace[:, :count]
+        return workspace[0], workspace[1], workspace[2:4], workspace[4:6], workspace[6:8], workspace[8:10]
+
+    def evaluate(self, xs, ys):
+        """Evaluate the fitted polynomial for x/y arrays, lat and lng in the same passes"""
+        u, v, a, b, c, d = self.buffers(len(xs))
+        # Cast to float32 while subtracting, without a converted copy
+        np.subtract(xs, self.center[0], out=u)
+        np.subtract(ys, self.center[1], out=v)
+        k = self.coefficients
+
+        # Horner form in u with polynomials in v:
+        # k0 + v*(k4 + v*(k5 + v*k6)) + u*((k1 + v*(k7 + v*k9)) + u*((k2 + v*k8) + u*k3))
+        np.multiply(v, k[6], out=a)
+        a += k[5]
+        a *= v
+        a += k[4]
+        a *= v
+        np.multiply(v, k[9], out=b)
+        b += k[7]
+        b *= v
+        b += k[1]
+        np.multiply(v, k[8], out=c)
+        c += k[2]
+        np.multiply(u, k[3], out=d)
+        d += c
+        d *= u
+        d += b
+        d *= u
+        d += a
+        lat, lng = np.add(d, self.offset)
+        return lat, lng
+
+    def project(self, xs, ys):
+        """Project x/y arrays to (lat, lng) float64 arrays"""
+        if not self.use_fit:
+            return project_exact(self.location, xs, ys)
+        return self.evaluate(xs, ys)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Vehicle density heatmaps for the SUMO bridge
+Bins the vehicles of a step into Web Mercator grid cells at several zoom
+levels, so overview maps get per-cell counts and speeds instead of every
+vehicle. Cells are the tiles of zoom level z + CELL_ZOOM_OFFSET, i.e. an
+8x8 grid inside each map tile of zoom z
+"""
+
+import math
+
+import numpy as np
+
+from edge_stats import HALTING_SPEED
+
+CELL_ZOOM_OFFSET = 3
+
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.05112878
+
+
+def parse_zoom_range(value):
+    """Parse "min-max" (or a single level) into a range of zoom levels"""
+    first, _, last = value.partition('-')
+    first = int(first)
+    last = int(last) if last else first
+    if not 0 <= first <= last <= 22:
+        raise ValueError('Heatmap zoom levels must satisfy 0 <= min <= max <= 22')
+    return range(first, last + 1)
+
+
+def mercator(lat, lng):
+    """Web Mercator x/y in [0, 1) for lat/lng arrays"""
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(lng) + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+    return x, y
+
+
+def cell_center(x, y, cell_zoom):
+    """Lat/lng of the centre of tile (x, y) at a zoom level"""
+    scale = 2 ** cell_zoom
+    lng = (x + 0.5) / scale * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + 0.5) / scale))))
+    return lat, lng
+
+
+class HeatmapGrid:
+    """Non-empty cells of one zoom level, as parallel arrays"""
+
+    def __init__(self, zoom, mx, my, speed, halted):
+        self.zoom = zoom
+        self.cell_zoom = zoom + CELL_ZOOM_OFFSET
+        scale = 2 ** self.cell_zoom
+        cx = np.minimum((mx * scale).astype(np.int64), scale - 1)
+        cy = np.minimum((my * scale).astype(np.int64), scale - 1)
+
+        if len(cx) == 0:
+            self.x = self.y = self.counts = self.halted = np.empty(0, dtype=np.int64)
+            self.mean_speeds = self.lat = self.lng = np.empty(0, dtype=np.float64)
+            return
+
+        # One bin per occupied cell, so memory follows the vehicles rather
+        # than the extent of the window they span at deep zoom levels
+        occupied, cells = np.unique(cy * scale + cx, return_inverse=True)
+        self.counts = np.bincount(cells)
+        self.mean_speeds = np.bincount(cells, weights=speed) / self.counts
+        self.halted = np.bincount(cells, weights=halted).astype(np.int64)
+        self.x = occupied % scale
+        self.y = occupied // scale
+        self.lat, self.lng = cell_center(self.x, self.y, self.cell_zoom)
+
+    def cells(self, bbox=None):
+        """Cell records, optionally only those whose centre lies in (minLat, minLng, maxLat, maxLng)"""
+        selected = np.arange(len(self.counts))
+        if bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            selected = np.flatnonzero((self.lat >= min_lat) & (self.lat <= max_lat) &
+                                      (self.lng >= min_lng) & (self.lng <= max_lng))
+        columns = zip(self.x[selected].tolist(), self.y[selected].tolist(),
+                      self.lat[selected].tolist(), self.lng[selected].tolist(),
+                      self.counts[selected].tolist(), (self.mean_speeds[selected] * 3.6).tolist(),
+                      self.halted[selected].tolist())
+        return [{
+            'x': x,
+            'y': y,
+            'lat': lat,
+            'lng': lng,
+            'count': count,
+            'meanSpeed': mean_speed,  # km/h
+            'halted': halted
+        } for x, y, lat, lng, count, mean_speed, halted in columns]
+
+
+class Heatmap:
+    """Heatmap grids of one step for a range of zoom levels"""
+
+    def __init__(self, lat, lng, speed, zooms):
+        """`speed` in m/s, one entry per vehicle like `lat` and `lng`"""
+        self.vehicle_count = len(lat)
+        mx, my = mercator(np.asarray(lat, dtype=np.float64), np.asarray(lng, dtype=np.float64))
+        speed = np.asarray(speed, dtype=np.float64)
+        halted = (speed < HALTING_SPEED).astype(np.float64)
+        self.grids = {zoom: HeatmapGrid(zoom, mx, my, speed, halted) for zoom in zooms}
+        self.min_zoom = min(self.grids)
+        self.max_zoom = max(self.grids)
+
+    def grid(self, zoom):
+        """Grid for a zoom level, clamped to the computed range"""
+        return self.grids[min(max(zoom, self.min_zoom), self.max_zoom)]
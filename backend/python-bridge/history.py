@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Step history for the SUMO bridge
+Keeps the vehicles of recent published steps in a fixed-size ring of column
+arrays, the same columns as the binary frames: ids interned in the run's
+string table, float32 positions and speeds, uint8 type codes. Memory is
+bounded by the arena size chosen up front, so the history never grows with
+traffic; when a step does not fit, the oldest steps are dropped
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+from binary_frame import EMERGENCY_CODES, EMERGENCY_TYPES, FLOAT_COLUMNS, TYPE_CODES, VEHICLE_TYPES
+
+# Columns stored for every vehicle of a recorded step
+STRING_COLUMNS = ('id', 'roadId', 'laneId', 'routeId')
+NUMBER_COLUMNS = tuple(name for name, _ in FLOAT_COLUMNS)
+CODE_COLUMNS = ('type', 'emergencyType')
+HISTORY_COLUMNS = STRING_COLUMNS + NUMBER_COLUMNS + CODE_COLUMNS
+COLUMN_DTYPES = dict([(name, '<u4') for name in STRING_COLUMNS] + [(name, '<f4') for name in NUMBER_COLUMNS] +
+                     [(name, 'u1') for name in CODE_COLUMNS])
+ROW_BYTES = sum(np.dtype(dtype).itemsize for dtype in COLUMN_DTYPES.values())
+
+# Per-step values that are not vehicle columns
+STEP_FIELDS = ('stats',)
+
+DEFAULT_FIELDS = ('id', 'lat', 'lng', 'speed')
+
+
+def vehicle_columns(registry, slots, strings):
+    """The history columns of the vehicles in registry `slots`, ids interned in `strings`"""
+    slot_list = slots.tolist()
+    count = len(slot_list)
+    ids, info = registry.ids, registry.info
+    return {
+        'id': strings.intern_all(ids[slot] for slot in slot_list),
+        'roadId': strings.intern_all(registry.road_ids[slot] for slot in slot_list),
+        'laneId': strings.intern_all(registry.lane_ids[slot] for slot in slot_list),
+        'routeId': strings.intern_all(info[slot].route_id for slot in slot_list),
+        'lat': registry.lat[slots],
+        'lng': registry.lng[slots],
+        'speed': registry.speed[slots] * 3.6,  # km/h, as in vehicle records
+        'angle': registry.angle[slots],
+        'waitingTime': registry.waiting_time[slots],
+        'distance': registry.distance[slots],
+        'type': np.fromiter((TYPE_CODES.get(info[slot].type, 0) for slot in slot_list),
+                            dtype=np.uint8, count=count),
+        'emergencyType': np.fromiter((EMERGENCY_CODES.get(info[slot].emergency_type, 0) for slot in slot_list),
+                                     dtype=np.uint8, count=count)
+    }
+
+
+def parse_fields(value):
+    """Parse "id,lat,lng" into a tuple of known history fields"""
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+    unknown = [name for name in fields if name not in HISTORY_COLUMNS and name not in STEP_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}; "
+                         f"choose from {', '.join(HISTORY_COLUMNS + STEP_FIELDS)}")
+    return fields
+
+
+class HistoryStep:
+    """Where one recorded step's vehicles live in the arena"""
+
+    __slots__ = ('sequence', 'step', 'sim_time', 'created_at', 'start', 'count', 'stats')
+
+    def __init__(self, sequence, step, sim_time, created_at, start, count, stats):
+        self.sequence = sequence
+        self.step = step
+        self.sim_time = sim_time
+        self.created_at = created_at
+        self.start = start
+        self.count = count
+        self.stats = stats
+
+
+class StepHistory:
+    """
+    Ring buffer of recent steps. Each step's vehicles take a contiguous range
+    of rows in preallocated column arrays; a step that does not fit before
+    the end of the arena starts again at row 0, evicting the steps it
+    overwrites. At most `max_steps` steps are kept.
+    """
+
+    def __init__(self, max_steps=600, max_bytes=256 * 1024 * 1024):
+        self.max_steps = max_steps
+        self.capacity = max_bytes // ROW_BYTES if max_steps > 0 else 0
+        self.lock = threading.Lock()
+        # Allocated on first use; pages are only committed once rows are written
+        self.columns = None
+        self.strings = None
+        # Never restarts, so a step read after a reset is recognised as evicted
+        self.sequence = 0
+        self.reset()
+
+    @property
+    def enabled(self):
+        return self.capacity > 0
+
+    def reset(self, strings=None):
+        """Drop all steps; ids are interned in `strings`, the string table of the new run"""
+        with self.lock:
+            self.strings = strings
+            self.entries = deque()
+            self.position = 0
+            self.skipped = 0
+
+    def record(self, snapshot, registry, slots, rows=None):
+        """
+        Store the vehicles in registry `slots` (in snapshot order) as the
+        snapshot's step; `rows` are their vehicle_columns if already built
+        """
+        if not self.enabled or self.strings is None:
+            return False
+        count = len(slots)
+        if count > self.capacity:
+            self.skipped += 1
+            return False
+
+        # Build the step's columns before taking the lock
+        if rows is None:
+            rows = vehicle_columns(registry, slots, self.strings)
+
+        with self.lock:
+            if self.columns is None:
+                self.columns = {name: np.empty(self.capacity, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+            start = self.position
+            wrapped = start + count > self.capacity
+            if wrapped:
+                start = 0
+            end = start + count
+
+            # The oldest steps are the ones ahead of the write position; on a
+            # wrap that includes every step left at the end of the arena
+            entries = self.entries
+            while entries:
+                oldest = entries[0]
+                overlaps = oldest.start < end and start < oldest.start + oldest.count
+                if len(entries) >= self.max_steps or overlaps or (wrapped and oldest.start >= self.position):
+                    entries.popleft()
+                else:
+                    break
+
+            for name, values in rows.items():
+                self.columns[name][start:end] = values
+            entries.append(HistoryStep(self.sequence, snapshot.step, snapshot.sim_time, snapshot.created_at,
+                                       start, count, snapshot.stats))
+            self.sequence += 1
+            self.position = end
+        return True
+
+    def read(self, entry, names):
+        """Copies of a step's columns, or None if the step was evicted meanwhile"""
+        with self.lock:
+            if not self.entries or entry.sequence < self.entries[0].sequence:
+                return None
+            end = entry.start + entry.count
+            return {name: self.columns[name][entry.start:end].copy() for name in names}
+
+    def query(self, start_time=None, end_time=None, fields=DEFAULT_FIELDS, bbox=None, every=1, max_steps=300):
+        """
+        Recorded steps with simulation time in [start_time, end_time], every
+        `every`th one, as columnar payloads. Negative times count back from
+        the newest step. At most `max_steps` steps are returned; `truncated`
+        tells whether more matched.
+        """
+        with self.lock:
+            entries = list(self.entries)
+            strings = self.strings
+        latest = entries[-1].sim_time if entries else 0.0
+        if start_time is not None and start_time < 0:
+            start_time = latest + start_time
+        if end_time is not None and end_time < 0:
+            end_time = latest + end_time
+        selected = [entry for entry in entries
+                    if (start_time is None or entry.sim_time >= start_time)
+                    and (end_time is None or entry.sim_time <= end_time)][::every]
+        truncated = len(selected) > max_steps
+        selected = selected[:max_steps]
+
+        columns = [name for name in fields if name in HISTORY_COLUMNS]
+        names = set(columns)
+        if bbox is not None:
+            names.update(('lat', 'lng'))
+
+        steps = []
+        for entry in selected:
+            values = self.read(entry, names)
+            if values is None:
+                continue
+            count = entry.count
+            if bbox is not None:
+                min_lat, min_lng, max_lat, max_lng = bbox
+                inside = (values['lat'] >= min_lat) & (values['lat'] <= max_lat) & \
+                         (values['lng'] >= min_lng) & (values['lng'] <= max_lng)
+                values = {name: column[inside] for name, column in values.items()}
+                count = int(inside.sum())
+
+            vehicles = {}
+            for name in columns:
+                column = values[name]
+                if name in STRING_COLUMNS:
+                    vehicles[name] = strings.resolve(column)
+                elif name == 'type':
+                    vehicles[name] = [VEHICLE_TYPES[code] for code in column.tolist()]
+                elif name == 'emergencyType':
+                    vehicles[name] = [EMERGENCY_TYPES[code] for code in column.tolist()]
+                else:
+                    vehicles[name] = column.astype(np.float64).round(6).tolist()
+
+            step = {
+                'step': entry.step,
+                'simulationTime': entry.sim_time,
+                'timestamp': entry.created_at,
+                'count': count,
+                'vehicles': vehicles
+            }
+            if 'stats' in fields:
+                step['stats'] = entry.stats
+            steps.append(step)
+
+        return {
+            'status': 'success',
+            'fields': list(fields),
+            'steps': steps,
+            'truncated': truncated,
+            'history': self.stats()
+        }
+
+    def stats(self):
+        """Coverage and memory use of the buffer"""
+        with self.lock:
+            entries = list(self.entries)
+            allocated = self.capacity * ROW_BYTES if self.columns is not None else 0
+        rows = sum(entry.count for entry in entries)
+        return {
+            'steps': len(entries),
+            'maxSteps': self.max_steps,
+            'oldestStep': entries[0].step if entries else None,
+            'newestStep': entries[-1].step if entries else None,
+            'fromTime': entries[0].sim_time if entries else None,
+            'toTime': entries[-1].sim_time if entries else None,
+            'rows': rows,
+            'capacityRows': self.capacity,
+            'rowBytes': ROW_BYTES,
+            'usedBytes': rows * ROW_BYTES,
+            'allocatedBytes': allocated,
+            'skippedSteps': self.skipped
+        }
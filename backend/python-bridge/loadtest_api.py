@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Bridge API load test
+Simulates dashboard clients that each poll the bridge at a fixed rate over
+keep-alive HTTP/1.1 connections and reports sustained requests/sec and
+latency percentiles. Latency is measured from each request's scheduled send
+time, so a server that falls behind is not hidden by clients slowing down;
+requests still unsent when the test ends are reported as missed.
+
+Usage:
+    python loadtest_api.py [--url http://localhost:8814] [--clients 50] [--rate 10] [--duration 30]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from urllib.parse import urlsplit
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif status != 304:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def client(host, port, paths, interval, deadline, gzip, timeout, latencies, errors):
+    """Poll `paths` in turn every `interval` seconds until `deadline`; returns the requests not sent"""
+    reader = writer = None
+    # Spread clients over the first interval like independent dashboards
+    next_send = time.monotonic() + random.uniform(0, interval)
+    index = 0
+    while True:
+        if interval:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            next_send = time.monotonic()
+        if next_send >= deadline or time.monotonic() >= deadline:
+            break
+
+        path = paths[index % len(paths)]
+        index += 1
+        request = f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n'
+        if gzip:
+            request += 'Accept-Encoding: gzip\r\n'
+        request = (request + '\r\n').encode('ascii')
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await asyncio.wait_for(read_response(reader), timeout)
+            latencies.append(time.monotonic() - next_send)
+            if status >= 400:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+        next_send += interval
+
+    if writer is not None:
+        writer.close()
+    return max(0, int((deadline - next_send) / interval)) if interval else 0
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    latencies = []
+    errors = []
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    missed = sum(await asyncio.gather(*(
+        client(host, port, args.paths, interval, deadline, args.gzip, args.timeout, latencies, errors)
+        for _ in range(args.clients))))
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    if not latencies:
+        print(f"No successful requests ({len(errors)} errors)")
+        return 1
+    offered = args.clients * args.rate if args.rate > 0 else None
+    print(f"clients={args.clients} rate={args.rate}/s paths={','.join(args.paths)} gzip={args.gzip}")
+    print(f"{'offered/s':>10} {'achieved/s':>11} {'requests':>9} {'missed':>7} {'errors':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    print(f"{offered if offered is not None else 'max':>10} {len(latencies) / elapsed:>11.1f} {len(latencies):>9} "
+          f"{missed:>7} {len(errors):>7} {percentile(latencies, 0.50) * 1000:>8.1f} "
+          f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+          f"{latencies[-1] * 1000:>8.1f}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the SUMO bridge API with polling dashboard clients')
+    parser.add_argument('--url', default='http://localhost:8814', help='Bridge base URL')
+    parser.add_argument('--clients', type=int, default=50, help='Concurrent polling clients')
+    parser.add_argument('--rate', type=float, default=10, help='Requests per second per client (0: as fast as possible)')
+    parser.add_argument('--duration', type=float, default=30, help='Test length in seconds')
+    parser.add_argument('--paths', nargs='+', default=['/all-data'], help='Paths each client polls in turn')
+    parser.add_argument('--gzip', action='store_true', help='Send Accept-Encoding: gzip')
+    parser.add_argument('--timeout', type=float, default=10, help='Seconds before a request counts as an error')
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
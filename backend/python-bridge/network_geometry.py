@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Network geometry cache for the SUMO bridge
+Parses the .net.xml once with a streaming parser, projects edge shapes,
+junction positions and traffic light positions to lat/lng, and keeps them in
+compact arrays persisted on disk under the net file's content hash
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from geo_projection import project_exact
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached arrays change shape or meaning
+CACHE_VERSION = 2
+
+# Bridges of several scenarios may load the same net at once; the first
+# builds the cache entry and the others read it
+LOAD_LOCK = threading.Lock()
+
+
+def find_net_file(config_path):
+    """Resolve the net-file referenced by a .sumocfg"""
+    root = ET.parse(config_path).getroot()
+    element = root.find('./input/net-file')
+    if element is None:
+        element = root.find('.//net-file')
+    if element is None or not element.get('value'):
+        return None
+    net_file = element.get('value').split(',')[0].strip()
+    return os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(config_path)), net_file))
+
+
+def file_hash(path, index_path=None):
+    """
+    Content hash of a file. Hashes are remembered in an index keyed by path,
+    size and mtime so an unchanged multi-hundred-MB net is not re-read.
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    index = {}
+
+    if index_path and os.path.exists(index_path):
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            entry = index.get(key)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return entry['hash']
+        except (OSError, ValueError, KeyError):
+            index = {}
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()
+
+    if index_path:
+        index[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': value}
+        try:
+            with open(index_path, 'w') as f:
+                json.dump(index, f)
+        except OSError as e:
+            logger.warning(f"Could not write net hash index: {e}")
+
+    return value
+
+
+def read_location(net_file):
+    """Read only the <location> element, which sits at the top of a .net.xml"""
+    for _, element in ET.iterparse(net_file, events=('end',)):
+        if element.tag == 'location':
+            return dict(element.attrib)
+        if element.tag in ('edge', 'junction'):
+            break
+    return {}
+
+
+def parse_shape(shape):
+    """Parse a SUMO shape attribute ("x,y x,y ...") into a list of points"""
+    points = []
+    for pair in shape.split():
+        coords = pair.split(',')
+        points.append((float(coords[0]), float(coords[1])))
+    return points
+
+
+class NetworkGeometry:
+    """Projected static geometry of a SUMO network"""
+
+    def __init__(self, net_hash, arrays):
+        self.net_hash = net_hash
+        self.location = json.loads(str(arrays['location']))
+
+        self.edge_ids = arrays['edge_ids']
+        self.edge_lengths = arrays['edge_lengths']
+        self.edge_lane_counts = arrays['edge_lane_counts']
+        self.edge_speeds = arrays['edge_speeds']
+        self.shape_offsets = arrays['shape_offsets']
+        self.shape_lat = arrays['shape_lat']
+        self.shape_lng = arrays['shape_lng']
+
+        self.junction_ids = arrays['junction_ids']
+        self.junction_lat = arrays['junction_lat']
+        self.junction_lng = arrays['junction_lng']
+
+        self.tls_ids = arrays['tls_ids']
+        self.tls_lat = arrays['tls_lat']
+        self.tls_lng = arrays['tls_lng']
+        self.tls_junction_offsets = arrays['tls_junction_offsets']
+        self.tls_junctions = arrays['tls_junctions']
+
+        self.edge_index = {edge_id: index for index, edge_id in enumerate(self.edge_ids.tolist())}
+        self.junction_index = {junction_id: index for index, junction_id in enumerate(self.junction_ids.tolist())}
+        self.tls_index = {tls_id: index for index, tls_id in enumerate(self.tls_ids.tolist())}
+
+        # Per-edge [[lat, lng], ...] lists, built on first use and shared by every snapshot
+        self.coordinates = {}
+
+    @property
+    def edge_count(self):
+        return len(self.edge_ids)
+
+    def arrays(self):
+        return {
+            'version': np.array(CACHE_VERSION),
+            'location': np.array(json.dumps(self.location)),
+            'edge_ids': self.edge_ids,
+            'edge_lengths': self.edge_lengths,
+            'edge_lane_counts': self.edge_lane_counts,
+            'edge_speeds': self.edge_speeds,
+            'shape_offsets': self.shape_offsets,
+            'shape_lat': self.shape_lat,
+            'shape_lng': self.shape_lng,
+            'junction_ids': self.junction_ids,
+            'junction_lat': self.junction_lat,
+            'junction_lng': self.junction_lng,
+            'tls_ids': self.tls_ids,
+            'tls_lat': self.tls_lat,
+            'tls_lng': self.tls_lng,
+            'tls_junction_offsets': self.tls_junction_offsets,
+            'tls_junctions': self.tls_junctions
+        }
+
+    def edge_coordinates(self, edge_id):
+        """Shape of an edge as [[lat, lng], ...], or None for unknown edges"""
+        coordinates = self.coordinates.get(edge_id)
+        if coordinates is None:
+            index = self.edge_index.get(edge_id)
+            if index is None:
+                return None
+            start, end = self.shape_offsets[index], self.shape_offsets[index + 1]
+            coordinates = np.column_stack((self.shape_lat[start:end], self.shape_lng[start:end])).tolist()
+            self.coordinates[edge_id] = coordinates
+        return coordinates
+
+    def tls_position(self, tls_id):
+        """Position of a traffic light (centroid of its junctions), or None if it has none"""
+        index = self.tls_index.get(tls_id)
+        if index is None:
+            return None
+        lat, lng = float(self.tls_lat[index]), float(self.tls_lng[index])
+        # A light without member junctions is stored as NaN, which is not valid JSON
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            return None
+        return {'lat': lat, 'lng': lng}
+
+    def junction_position(self, junction_id):
+        index = self.junction_index.get(junction_id)
+        if index is None:
+            return None
+        return {'lat': float(self.junction_lat[index]), 'lng': float(self.junction_lng[index])}
+
+    @classmethod
+    def parse(cls, net_file, net_hash=None):
+        """Build the geometry by streaming through a .net.xml"""
+        location = {}
+        edge_ids = []
+        edge_to = {}
+        edge_lengths = []
+        edge_lane_counts = []
+        edge_speeds = []
+        shape_offsets = [0]
+        shape_xs = []
+        shape_ys = []
+        junction_ids = []
+        junction_xs = []
+        junction_ys = []
+        tls_ids = []
+        tls_junction_sets = {}
+
+        context = ET.iterparse(net_file, events=('start', 'end'))
+        _, root = next(context)
+
+        for event, element in context:
+            if event != 'end':
+                continue
+            tag = element.tag
+
+            if tag == 'edge':
+                if element.get('function') != 'internal':
+                    lanes = element.findall('lane')
+                    shape = element.get('shape')
+                    if not shape and lanes:
+                        shape = lanes[len(lanes) // 2].get('shape', '')
+                    points = parse_shape(shape or '')
+                    edge_ids.append(element.get('id'))
+                    edge_to[element.get('id')] = element.get('to')
+                    edge_lengths.append(float(lanes[0].get('length', 0)) if lanes else 0.0)
+                    edge_lane_counts.append(len(lanes))
+                    edge_speeds.append(float(lanes[0].get('speed', 0)) if lanes else 0.0)
+                    shape_xs.extend(point[0] for point in points)
+                    shape_ys.extend(point[1] for point in points)
+                    shape_offsets.append(len(shape_xs))
+                element.clear()
+            elif tag == 'junction':
+                if element.get('type') != 'internal':
+                    junction_ids.append(element.get('id'))
+                    junction_xs.append(float(element.get('x', 0)))
+                    junction_ys.append(float(element.get('y', 0)))
+                element.clear()
+            elif tag == 'tlLogic':
+                if element.get('id') not in tls_junction_sets:
+                    tls_ids.append(element.get('id'))
+                    tls_junction_sets[element.get('id')] = set()
+                element.clear()
+            elif tag == 'connection':
+                tls_id = element.get('tl')
+                junction_id = edge_to.get(element.get('from'))
+                if tls_id and junction_id:
+                    tls_junction_sets.setdefault(tls_id, set()).add(junction_id)
+                element.clear()
+            elif tag == 'location':
+                location = dict(element.attrib)
+            else:
+                continue
+
+            # Drop finished elements from the tree to keep memory flat
+            root.clear()
+
+        shape_lat, shape_lng = project_exact(location, shape_xs, shape_ys)
+        junction_lat, junction_lng = project_exact(location, junction_xs, junction_ys)
+        junction_index = {junction_id: index for index, junction_id in enumerate(junction_ids)}
+
+        tls_lat = []
+        tls_lng = []
+        tls_junction_offsets = [0]
+        tls_junctions = []
+        for tls_id in tls_ids:
+            members = sorted(junction_index[junction_id] for junction_id in tls_junction_sets[tls_id]
+                             if junction_id in junction_index)
+            if not members and tls_id in junction_index:
+                members = [junction_index[tls_id]]
+            tls_junctions.extend(members)
+            tls_junction_offsets.append(len(tls_junctions))
+            tls_lat.append(float(np.mean(junction_lat[members])) if members else np.nan)
+            tls_lng.append(float(np.mean(junction_lng[members])) if members else np.nan)
+
+        return cls(net_hash, {
+            'location': np.array(json.dumps(location)),
+            'edge_ids': np.array(edge_ids, dtype=str),
+            'edge_lengths': np.array(edge_lengths, dtype=np.float32),
+            'edge_lane_counts': np.array(edge_lane_counts, dtype=np.uint8),
+            'edge_speeds': np.array(edge_speeds, dtype=np.float32),
+            'shape_offsets': np.array(shape_offsets, dtype=np.int32),
+            'shape_lat': np.asarray(shape_lat, dtype=np.float64),
+            'shape_lng': np.asarray(shape_lng, dtype=np.float64),
+            'junction_ids': np.array(junction_ids, dtype=str),
+            'junction_lat': np.asarray(junction_lat, dtype=np.float64),
+            'junction_lng': np.asarray(junction_lng, dtype=np.float64),
+            'tls_ids': np.array(tls_ids, dtype=str),
+            'tls_lat': np.array(tls_lat, dtype=np.float64),
+            'tls_lng': np.array(tls_lng, dtype=np.float64),
+            'tls_junction_offsets': np.array(tls_junction_offsets, dtype=np.int32),
+            'tls_junctions': np.array(tls_junctions, dtype=np.int32)
+        })
+
+
+def load_network_geometry(net_file, cache_dir):
+    """
+    Load the geometry of a net file, parsing it only when no cache entry
+    exists for its content hash.
+    """
+    with LOAD_LOCK:
+        return load_or_build(net_file, cache_dir)
+
+
+def load_or_build(net_file, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    started = time.time()
+    net_hash = file_hash(net_file, os.path.join(cache_dir, 'net-hashes.json'))
+    cache_path = os.path.join(cache_dir, f'network-{net_hash}.npz')
+
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                if int(data['version']) == CACHE_VERSION:
+                    geometry = NetworkGeometry(net_hash, {key: data[key] for key in data.files})
+                    logger.info(f"Loaded network geometry from cache in {(time.time() - started) * 1000:.0f} ms "
+                                f"({geometry.edge_count} edges, {len(geometry.tls_ids)} traffic lights)")
+                    return geometry
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable network geometry cache {cache_path}: {e}")
+
+    logger.info(f"Building network geometry from {net_file}")
+    geometry = NetworkGeometry.parse(net_file, net_hash)
+
+    # Write under a temporary name so a crash never leaves a partial cache
+    temp_path = cache_path[:-len('.npz')] + '.tmp.npz'
+    np.savez(temp_path, **geometry.arrays())
+    os.replace(temp_path, cache_path)
+
+    logger.info(f"Built network geometry in {time.time() - started:.1f} s "
+                f"({geometry.edge_count} edges, {len(geometry.tls_ids)} traffic lights)")
+    return geometry
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Run recorder for the SUMO bridge
+Appends every simulated step's vehicle, traffic light and edge arrays to raw
+little-endian column files, one file per column, in segments of a fixed
+number of steps. Each segment has an index of fixed-size rows giving every
+step's time and its row range in the column files, so a recording is read
+back with numpy memory maps: finding a time is a binary search on the index
+and a step's columns are slices of the mapped files, with no parsing. It
+replaces the FCD XML output of the configs, which is slow to write and to
+read back.
+
+Layout of a recording directory:
+    meta.json                     column dtypes and code tables
+    strings.jsonl                 the run's string table, one JSON string per line
+    segment-000000/index.bin      one INDEX_DTYPE row per step
+    segment-000000/<table>.<column>.bin
+
+Usage:
+    python run_recorder.py <recording-dir> [--at <time>]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import numpy as np
+
+from binary_frame import EMERGENCY_TYPES, VEHICLE_TYPES
+from history import COLUMN_DTYPES
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+CONGESTION_LEVELS = ('low', 'medium', 'high', 'critical')
+CONGESTION_CODES = {level: code for code, level in enumerate(CONGESTION_LEVELS)}
+
+# Column dtypes per table; 'u4' string columns are indices into strings.jsonl
+TABLES = {
+    'vehicles': COLUMN_DTYPES,
+    'tls': {
+        'id': '<u4',
+        'phaseIndex': '<i2',
+        'state': '<u4',
+        'nextSwitch': '<f4',
+        'maxQueueLength': '<i4',
+        'averageWaitingTime': '<f4',
+        'congestionLevel': 'u1'
+    },
+    'edges': {
+        'id': '<u4',
+        'vehicleCount': '<i4',
+        'haltingCount': '<i4',
+        'meanSpeed': '<f4'  # km/h
+    }
+}
+
+# One row per recorded step; starts are row offsets into the segment's column files
+INDEX_DTYPE = np.dtype([
+    ('step', '<i8'),
+    ('simulationTime', '<f8'),
+    ('timestamp', '<f8'),
+    ('vehiclesStart', '<i8'),
+    ('vehiclesCount', '<i4'),
+    ('tlsStart', '<i8'),
+    ('tlsCount', '<i4'),
+    ('edgesStart', '<i8'),
+    ('edgesCount', '<i4')
+])
+
+
+def config_output(config_path, option):
+    """The value of an <output> option of a .sumocfg, or None if it is not set"""
+    try:
+        element = ET.parse(config_path).getroot().find(f'.//{option}')
+    except (ET.ParseError, OSError):
+        return None
+    if element is None or not element.get('value'):
+        return None
+    return element.get('value')
+
+
+def tls_columns(intersections, strings):
+    """Traffic light columns of a snapshot's intersection records"""
+    count = len(intersections)
+    signals = [record['trafficLights'][0] for record in intersections]
+    return {
+        'id': strings.intern_all(record['id'] for record in intersections),
+        'phaseIndex': np.fromiter((signal['phaseIndex'] for signal in signals), dtype=np.int16, count=count),
+        'state': strings.intern_all(signal['state'] or '' for signal in signals),
+        'nextSwitch': np.fromiter((signal['nextSwitch'] for signal in signals), dtype=np.float32, count=count),
+        'maxQueueLength': np.fromiter((record['maxQueueLength'] for record in intersections),
+                                      dtype=np.int32, count=count),
+        'averageWaitingTime': np.fromiter((record['averageWaitingTime'] for record in intersections),
+                                          dtype=np.float32, count=count),
+        'congestionLevel': np.fromiter((CONGESTION_CODES.get(record['congestionLevel'], 0)
+                                        for record in intersections), dtype=np.uint8, count=count)
+    }
+
+
+def edge_columns(edge_stats, strings):
+    """Columns of the occupied edges of an EdgeStats, or empty columns without one"""
+    if edge_stats is None:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in TABLES['edges'].items()}
+    occupied = edge_stats.occupied
+    edge_ids = edge_stats.geometry.edge_ids
+    return {
+        'id': strings.intern_all(str(edge_ids[index]) for index in occupied.tolist()),
+        'vehicleCount': edge_stats.vehicle_counts[occupied],
+        'haltingCount': edge_stats.halting_counts[occupied],
+        'meanSpeed': edge_stats.mean_speeds(occupied) * 3.6
+    }
+
+
+class RunRecorder:
+    """
+    Writes one recording per connected run under `directory`. Column data is
+    flushed before the step's index row, so a reader never sees an index
+    row whose data is incomplete, even while the run is still recording.
+    """
+
+    def __init__(self, directory, segment_steps=600):
+        self.directory = directory
+        self.segment_steps = max(1, segment_steps)
+        self.path = None
+        self.strings = None
+        self.files = None
+        self.reset_counters()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def reset_counters(self):
+        self.segment = -1
+        self.segment_rows = 0
+        self.offsets = {}
+        self.strings_written = 0
+        self.steps = 0
+        self.bytes_written = 0
+
+    def start(self, name, strings, step_length, config_path=None):
+        """Start a new recording `name`; ids are interned in `strings`, the run's string table"""
+        self.close()
+        if not self.enabled:
+            return None
+        try:
+            self.path = os.path.join(self.directory, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}")
+            os.makedirs(self.path, exist_ok=True)
+            self.strings = strings
+            self.reset_counters()
+            meta = {
+                'version': FORMAT_VERSION,
+                'name': name,
+                'config': config_path,
+                'stepLength': step_length,
+                'startedAt': time.time(),
+                'segmentSteps': self.segment_steps,
+                'index': [[field, INDEX_DTYPE.fields[field][0].str] for field in INDEX_DTYPE.names],
+                'tables': TABLES,
+                'codes': {
+                    'type': list(VEHICLE_TYPES),
+                    'emergencyType': list(EMERGENCY_TYPES),
+                    'congestionLevel': list(CONGESTION_LEVELS)
+                }
+            }
+            with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+            self.strings_file = open(os.path.join(self.path, 'strings.jsonl'), 'a', encoding='utf-8')
+            logger.info(f"Recording run to {self.path}")
+            return self.path
+        except OSError as e:
+            logger.error(f"Cannot start recording in {self.directory}: {e}")
+            self.path = None
+            return None
+
+    def open_segment(self):
+        """Close the current segment's files and open the next segment"""
+        self.close_segment()
+        self.segment += 1
+        self.segment_rows = 0
+        segment_dir = os.path.join(self.path, f'segment-{self.segment:06d}')
+        os.makedirs(segment_dir, exist_ok=True)
+        self.files = {'index': open(os.path.join(segment_dir, 'index.bin'), 'ab')}
+        for table, columns in TABLES.items():
+            self.offsets[table] = 0
+            for column in columns:
+                self.files[(table, column)] = open(os.path.join(segment_dir, f'{table}.{column}.bin'), 'ab')
+
+    def close_segment(self):
+        if self.files is None:
+            return
+        for f in self.files.values():
+            f.close()
+        self.files = None
+
+    def record(self, step, sim_time, timestamp, vehicles, intersections, edge_stats):
+        """
+        Append one step: its vehicle_columns, its intersection records and
+        the occupied edges of `edge_stats`
+        """
+        if self.path is None:
+            return False
+        try:
+            strings = self.strings
+            tables = {
+                'vehicles': vehicles,
+                'tls': tls_columns(intersections, strings),
+                'edges': edge_columns(edge_stats, strings)
+            }
+
+            if self.files is None or self.segment_rows >= self.segment_steps:
+                self.open_segment()
+
+            # Strings first, then columns, then the index row that refers to them
+            added = strings.entries(self.strings_written, len(strings))
+            if added:
+                self.strings_file.write(''.join(json.dumps(value) + '\n' for value in added))
+                self.strings_file.flush()
+                self.strings_written += len(added)
+
+            index = np.zeros(1, dtype=INDEX_DTYPE)
+            index['step'] = step
+            index['simulationTime'] = sim_time
+            index['timestamp'] = timestamp
+            for table, columns in tables.items():
+                count = 0
+                for column, dtype in TABLES[table].items():
+                    values = np.ascontiguousarray(columns[column], dtype=dtype)
+                    count = len(values)
+                    f = self.files[(table, column)]
+                    f.write(values.tobytes())
+                    f.flush()
+                    self.bytes_written += values.nbytes
+                index[f'{table}Start'] = self.offsets[table]
+                index[f'{table}Count'] = count
+                self.offsets[table] += count
+
+            self.files['index'].write(index.tobytes())
+            self.files['index'].flush()
+            self.bytes_written += INDEX_DTYPE.itemsize
+            self.segment_rows += 1
+            self.steps += 1
+            return True
+
+        except (OSError, ValueError) as e:
+            logger.error(f"Error recording step, recording stopped: {e}")
+            self.close()
+            return False
+
+    def close(self):
+        """Finish the current recording"""
+        self.close_segment()
+        if self.path is not None:
+            self.strings_file.close()
+            logger.info(f"Recorded {self.steps} steps to {self.path}")
+        self.path = None
+        self.strings = None
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'steps': self.steps,
+            'segments': self.segment + 1,
+            'bytes': self.bytes_written
+        }
+
+
+class RecordedRun:
+    """
+    Read-only view of a recording. The index of every segment is loaded at
+    once (a few dozen bytes per step); column files are memory-mapped on
+    first use, so a step's arrays are views into the page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.tables = {table: {column: np.dtype(dtype) for column, dtype in columns.items()}
+                       for table, columns in self.meta['tables'].items()}
+        self.codes = self.meta['codes']
+        self.segments = []
+        self.mapped = {}
+
+        indexes = []
+        segment = 0
+        while True:
+            segment_dir = os.path.join(path, f'segment-{segment:06d}')
+            if not os.path.isdir(segment_dir):
+                break
+            index = self.map(os.path.join(segment_dir, 'index.bin'), INDEX_DTYPE)
+            self.segments.append(segment_dir)
+            indexes.append((index, np.full(len(index), segment, dtype=np.int32)))
+            segment += 1
+        self.index = np.concatenate([index for index, _ in indexes]) if indexes else np.zeros(0, dtype=INDEX_DTYPE)
+        self.segment_of = np.concatenate([numbers for _, numbers in indexes]) if indexes else np.zeros(0, np.int32)
+        self.times = np.ascontiguousarray(self.index['simulationTime'])
+        self.load_strings()
+
+    def map(self, filename, dtype):
+        """Memory-map the whole rows of a column file; a partly written last row is ignored"""
+        rows = os.path.getsize(filename) // dtype.itemsize
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r', shape=(rows,))
+
+    def load_strings(self):
+        """Read the string table; call again to pick up strings of a run still recording"""
+        with open(os.path.join(self.path, 'strings.jsonl'), encoding='utf-8') as f:
+            self.strings = [json.loads(line) for line in f if line.endswith('\n')]
+
+    def __len__(self):
+        return len(self.index)
+
+    def find(self, sim_time):
+        """Position of the last recorded step at or before `sim_time`, or None"""
+        position = int(np.searchsorted(self.times, sim_time, side='right')) - 1
+        return position if position >= 0 else None
+
+    def column(self, position, table, column):
+        """One column of the step at `position` as a read-only view"""
+        segment = int(self.segment_of[position])
+        key = (segment, table, column)
+        values = self.mapped.get(key)
+        if values is None or len(values) < self.index[position][f'{table}Start'] + self.index[position][f'{table}Count']:
+            # Mapped once per file, or again when the file has grown since
+            values = self.mapped[key] = self.map(
+                os.path.join(self.segments[segment], f'{table}.{column}.bin'), self.tables[table][column])
+        start = int(self.index[position][f'{table}Start'])
+        return values[start:start + int(self.index[position][f'{table}Count'])]
+
+    def step(self, position, tables=('vehicles', 'tls', 'edges')):
+        """Every column of the step at `position`, by table"""
+        row = self.index[position]
+        result = {
+            'step': int(row['step']),
+            'simulationTime': float(row['simulationTime']),
+            'timestamp': float(row['timestamp'])
+        }
+        for table in tables:
+            result[table] = {column: self.column(position, table, column) for column in self.tables[table]}
+        return result
+
+    def resolve(self, indices):
+        """Strings of a string column"""
+        strings = self.strings
+        return [strings[index] for index in indices.tolist()]
+
+    def steps_between(self, start_time=None, end_time=None):
+        """Positions of the steps with simulation time in [start_time, end_time]"""
+        start = 0 if start_time is None else int(np.searchsorted(self.times, start_time, side='left'))
+        end = len(self.times) if end_time is None else int(np.searchsorted(self.times, end_time, side='right'))
+        return range(start, end)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise a recording written by the SUMO bridge')
+    parser.add_argument('path', help='Recording directory')
+    parser.add_argument('--at', type=float, help='Print the step at this simulation time')
+    args = parser.parse_args()
+
+    run = RecordedRun(args.path)
+    if not len(run):
+        print(f"{args.path}: no steps recorded")
+        return 1
+    index = run.index
+    print(f"{args.path}: {len(run)} steps in {len(run.segments)} segments, "
+          f"t={index['simulationTime'][0]:.1f}..{index['simulationTime'][-1]:.1f}")
+    print(f"vehicle rows {int(index['vehiclesCount'].sum())}, peak {int(index['vehiclesCount'].max())} per step; "
+          f"{len(run.strings)} strings")
+
+    if args.at is not None:
+        position = run.find(args.at)
+        if position is None:
+            print(f"No step at or before t={args.at}")
+            return 1
+        step = run.step(position)
+        vehicles = step['vehicles']
+        print(f"step {step['step']} t={step['simulationTime']:.1f}: {len(vehicles['id'])} vehicles, "
+              f"{len(step['tls']['id'])} traffic lights, {len(step['edges']['id'])} occupied edges")
+        ids = run.resolve(vehicles['id'][:10])
+        for vehicle_id, lat, lng, speed in zip(ids, vehicles['lat'][:10].tolist(), vehicles['lng'][:10].tolist(),
+                                               vehicles['speed'][:10].tolist()):
+            print(f"  {vehicle_id:<20} {lat:.6f} {lng:.6f} {speed:6.1f} km/h")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
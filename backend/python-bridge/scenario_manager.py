@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Multi-scenario support for the SUMO bridge
+Runs one bridge per scenario, each with its own SUMO process, TraCI
+connection, update thread and snapshot, and serves every bridge's API under
+/scenarios/<id>/ of the main bridge. SUMO processes can be pinned to
+disjoint CPU sets so the scenarios step on separate cores
+"""
+
+import logging
+import os
+
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Routes of the main bridge under /scenarios/ that scenario ids must not shadow
+RESERVED_IDS = ('connect', 'disconnect')
+
+
+def parse_scenarios(value):
+    """Parse "id=path.sumocfg,id2=other.sumocfg" into [(id, absolute config path)]"""
+    scenarios = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        scenario_id, separator, config_path = entry.partition('=')
+        scenario_id = scenario_id.strip()
+        if not separator or not scenario_id or '/' in scenario_id:
+            raise ValueError(f'Scenario entries must look like id=config.sumocfg, got {entry!r}')
+        if scenario_id in RESERVED_IDS:
+            raise ValueError(f'Scenario id {scenario_id!r} is reserved')
+        if any(scenario_id == existing for existing, _ in scenarios):
+            raise ValueError(f'Duplicate scenario id {scenario_id!r}')
+        scenarios.append((scenario_id, os.path.abspath(os.path.expanduser(config_path.strip()))))
+    return scenarios
+
+
+def parse_cpu_list(value):
+    """Parse "0-3,6" into {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in value.split(','):
+        first, _, last = part.strip().partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def split_cpus(cpus, count):
+    """Split CPUs into `count` disjoint sets of neighbouring CPUs, as even as possible"""
+    cpus = sorted(cpus)
+    if count <= 0:
+        return []
+    if len(cpus) < count:
+        # More scenarios than CPUs: share them round-robin
+        return [{cpus[index % len(cpus)]} for index in range(count)] if cpus else [None] * count
+    size, extra = divmod(len(cpus), count)
+    sets = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        sets.append(set(cpus[start:end]))
+        start = end
+    return sets
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return os.sched_getaffinity(0)
+    return set(range(os.cpu_count() or 1))
+
+
+def process_tasks(pid):
+    """Thread ids of a process and of all its descendants (Linux /proc)"""
+    tasks = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            task_ids = [int(task) for task in os.listdir(f'/proc/{current}/task')]
+        except OSError:
+            task_ids = [current]
+        tasks.extend(task_ids)
+        for task in task_ids:
+            try:
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                pass
+    return tasks
+
+
+def pin_process(pid, cpus):
+    """
+    Restrict a process, its threads and its child processes to `cpus`.
+    Launchers such as the pip `sumo` wrapper run the simulation in a child
+    process, and threads started before pinning keep their own affinity,
+    so every task is pinned. Returns the number of tasks pinned.
+    """
+    pinned = 0
+    for task in process_tasks(pid):
+        try:
+            os.sched_setaffinity(task, cpus)
+            pinned += 1
+        except OSError:
+            # Tasks may exit while we walk the tree
+            pass
+    return pinned
+
+
+def parse_cpu_sets(value, count):
+    """
+    CPU sets for `count` scenarios: '' leaves them unpinned, 'auto' splits
+    the CPUs this process may use, and "0-1;2-3" gives one list per scenario
+    """
+    value = value.strip()
+    if not value:
+        return [None] * count
+    if value == 'auto':
+        return split_cpus(available_cpus(), count)
+    cpu_sets = [parse_cpu_list(part) for part in value.split(';')]
+    if len(cpu_sets) != count:
+        raise ValueError(f'Expected {count} CPU lists separated by ";", got {len(cpu_sets)}')
+    return cpu_sets
+
+
+class ScenarioManager:
+    """Scenario bridges by id, mounted into the main bridge's Flask app"""
+
+    def __init__(self, create_bridge, scenarios, cpu_sets=None):
+        """
+        `create_bridge(scenario_id, config_path, cpus)` returns a bridge;
+        `cpu_sets` has one CPU set (or None) per scenario, in order
+        """
+        cpu_sets = cpu_sets or [None] * len(scenarios)
+        self.bridges = {}
+        for (scenario_id, config_path), cpus in zip(scenarios, cpu_sets):
+            self.bridges[scenario_id] = create_bridge(scenario_id, config_path, cpus)
+
+    def mount(self, app):
+        """Serve each scenario's routes under /scenarios/<id>/ of `app`"""
+        app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
+            f'/scenarios/{scenario_id}': bridge.app for scenario_id, bridge in self.bridges.items()
+        })
+
+    def connect(self, scenario_ids=None):
+        """Start the given scenarios (default: all); returns {id: connected}"""
+        results = {}
+        for scenario_id in scenario_ids or list(self.bridges):
+            bridge = self.bridges.get(scenario_id)
+            if bridge is None:
+                results[scenario_id] = False
+                continue
+            if not bridge.connected:
+                logger.info(f"Starting scenario {scenario_id}")
+                bridge.connect_to_sumo()
+            results[scenario_id] = bridge.connected
+        return results
+
+    def disconnect(self):
+        for bridge in self.bridges.values():
+            bridge.disconnect_from_sumo()
+
+    def describe(self):
+        scenarios = []
+        for scenario_id, bridge in self.bridges.items():
+            snapshot = bridge.snapshot
+            scenarios.append({
+                'id': scenario_id,
+                'config': bridge.config_path,
+                'connected': bridge.connected,
+                'simulationRunning': bridge.simulation_running,
+                'cpus': sorted(bridge.cpus) if bridge.cpus else None,
+                'step': snapshot.step,
+                'simulationTime': snapshot.sim_time,
+                'vehicleCount': len(snapshot.vehicles) + len(snapshot.emergency_vehicles)
+            })
+        return scenarios
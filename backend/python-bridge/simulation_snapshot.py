@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Simulation snapshots for the SUMO bridge
+One immutable object per simulation step, published by the update thread
+with a single reference swap so readers always see a consistent frame
+"""
+
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class SimulationSnapshot:
+    """Immutable view of all bridge data for one simulation step"""
+    step: int
+    sim_time: float
+    vehicles: tuple = ()
+    emergency_vehicles: tuple = ()
+    intersections: tuple = ()
+    roads: tuple = ()
+    stats: dict = field(default_factory=dict)
+    heatmap: object = None  # heatmap.Heatmap of all vehicles, when computed
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def vehicle_count(self):
+        """Number of running vehicles, including emergency vehicles"""
+        return len(self.vehicles) + len(self.emergency_vehicles)
+
+
+# Served until the first step has been collected
+EMPTY_SNAPSHOT = SimulationSnapshot(step=0, sim_time=0.0)
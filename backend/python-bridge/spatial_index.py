@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Spatial index for the SUMO bridge
+A uniform lat/lng grid over the vehicles of one snapshot, so viewport
+queries only look at the vehicles in the cells the viewport covers
+"""
+
+import math
+import threading
+
+import numpy as np
+
+from geo_projection import METERS_PER_DEGREE
+
+# Upper bound on grid cells; cells grow beyond the requested size to stay under it
+MAX_CELLS = 1 << 20
+
+
+def parse_bbox(value):
+    """Parse "minLat,minLng,maxLat,maxLng" into a tuple of floats"""
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must be minLat,minLng,maxLat,maxLng')
+    min_lat, min_lng, max_lat, max_lng = parts
+    if min_lat > max_lat or min_lng > max_lng:
+        raise ValueError('bbox minimum must not exceed its maximum')
+    return min_lat, min_lng, max_lat, max_lng
+
+
+class GridIndex:
+    """Vehicle indices bucketed by grid cell, built from position arrays"""
+
+    def __init__(self, lat, lng, cell_meters=250.0):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.rows = self.cols = 0
+        if len(self.lat) == 0:
+            return
+
+        self.min_lat = float(self.lat.min())
+        self.min_lng = float(self.lng.min())
+        self.cell_lat = cell_meters / METERS_PER_DEGREE
+        self.cell_lng = self.cell_lat / max(math.cos(math.radians(float(self.lat.mean()))), 0.1)
+        rows = int((float(self.lat.max()) - self.min_lat) / self.cell_lat) + 1
+        cols = int((float(self.lng.max()) - self.min_lng) / self.cell_lng) + 1
+        if rows * cols > MAX_CELLS:
+            scale = math.sqrt(rows * cols / MAX_CELLS)
+            self.cell_lat *= scale
+            self.cell_lng *= scale
+            rows = int((float(self.lat.max()) - self.min_lat) / self.cell_lat) + 1
+            cols = int((float(self.lng.max()) - self.min_lng) / self.cell_lng) + 1
+        self.rows, self.cols = rows, cols
+
+        # Vehicle indices sorted by cell; cell c holds order[starts[c]:starts[c + 1]]
+        cells = self.row_of(self.lat) * cols + self.col_of(self.lng)
+        self.order = np.argsort(cells, kind='stable')
+        self.starts = np.zeros(rows * cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=rows * cols), out=self.starts[1:])
+
+    def row_of(self, lat):
+        return np.clip(((lat - self.min_lat) / self.cell_lat).astype(np.int64), 0, self.rows - 1)
+
+    def col_of(self, lng):
+        return np.clip(((lng - self.min_lng) / self.cell_lng).astype(np.int64), 0, self.cols - 1)
+
+    def query(self, min_lat, min_lng, max_lat, max_lng):
+        """Indices of the vehicles inside the bounding box, in ascending order"""
+        if self.rows == 0:
+            return np.empty(0, dtype=np.int64)
+        row_start = math.floor((min_lat - self.min_lat) / self.cell_lat)
+        row_end = math.floor((max_lat - self.min_lat) / self.cell_lat)
+        col_start = math.floor((min_lng - self.min_lng) / self.cell_lng)
+        col_end = math.floor((max_lng - self.min_lng) / self.cell_lng)
+        if row_end < 0 or col_end < 0 or row_start >= self.rows or col_start >= self.cols:
+            return np.empty(0, dtype=np.int64)
+        row_start, row_end = max(row_start, 0), min(row_end, self.rows - 1)
+        col_start, col_end = max(col_start, 0), min(col_end, self.cols - 1)
+
+        # The cells of one row between two columns are contiguous in `order`
+        rows = np.arange(row_start, row_end + 1) * self.cols
+        candidates = np.concatenate([self.order[self.starts[row + col_start]:self.starts[row + col_end + 1]]
+                                     for row in rows.tolist()])
+
+        lat = self.lat[candidates]
+        lng = self.lng[candidates]
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+        return np.sort(candidates[inside])
+
+
+class SnapshotIndex:
+    """Builds the grid index of the latest snapshot once, on first query"""
+
+    def __init__(self, cell_meters=250.0):
+        self.cell_meters = cell_meters
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.index = None
+
+    def build(self, snapshot):
+        vehicles = snapshot.vehicles
+        count = len(vehicles)
+        lat = np.fromiter((vehicle['position']['lat'] for vehicle in vehicles), dtype=np.float64, count=count)
+        lng = np.fromiter((vehicle['position']['lng'] for vehicle in vehicles), dtype=np.float64, count=count)
+        return GridIndex(lat, lng, self.cell_meters)
+
+    def get(self, snapshot):
+        with self.lock:
+            if self.snapshot is not snapshot:
+                if self.snapshot is not None and snapshot.created_at < self.snapshot.created_at:
+                    # Older than the indexed snapshot; do not replace it
+                    return self.build(snapshot)
+                self.index = self.build(snapshot)
+                self.snapshot = snapshot
+            return self.index
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Step scheduler for the SUMO bridge
+Paces simulation steps against the wall clock at a target real-time factor.
+Each step has a deadline; when the loop falls behind it runs several steps
+in one batch before collecting data, and when it falls too far behind the
+remaining lag is written off and reported as drift
+"""
+
+import math
+import threading
+import time
+
+MAX_SPEED = 'max'
+
+
+def parse_speed(value):
+    """Parse a real-time factor: a finite positive number, or 'max' for unpaced stepping"""
+    if isinstance(value, str):
+        if value.strip().lower() == MAX_SPEED:
+            return None
+        value = value.strip().lower().rstrip('x')
+    factor = float(value)
+    if not math.isfinite(factor) or factor <= 0:
+        raise ValueError('Real-time factor must be a finite positive number or "max"')
+    return factor
+
+
+class StepScheduler:
+    """Deadline-based pacing of simulation steps"""
+
+    def __init__(self, real_time_factor=1.0, step_length=1.0, publish_interval=0.1,
+                 max_batch_steps=50, max_lag_seconds=1.0):
+        self.real_time_factor = real_time_factor  # None means as fast as possible
+        self.step_length = step_length
+        self.publish_interval = publish_interval
+        self.max_batch_steps = max_batch_steps
+        self.max_lag_seconds = max_lag_seconds
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.reset()
+
+    def reset(self, step_length=None):
+        """Start pacing from now, e.g. after connecting or resuming"""
+        with self.lock:
+            if step_length:
+                self.step_length = step_length
+            self.rebase(time.monotonic())
+            self.total_steps = 0
+            self.batches = 0
+            self.largest_batch = 0
+            self.dropped_seconds = 0.0
+            self.achieved_factor = 0.0
+            self.rate_started = self.anchor_time
+            self.rate_steps = 0
+
+    def rebase(self, now):
+        """Make the next step due at `now`"""
+        self.anchor_time = now
+        self.anchor_steps = 0
+
+    def resume(self):
+        """Pace from now after a pause instead of catching up the paused time"""
+        with self.lock:
+            self.rebase(time.monotonic())
+
+    def set_speed(self, real_time_factor):
+        """Change the target factor without a catch-up burst for the old one"""
+        with self.lock:
+            self.real_time_factor = real_time_factor
+            self.rebase(time.monotonic())
+        self.wakeup.set()
+
+    def step_interval(self):
+        """Wall-clock seconds per step at the target factor"""
+        if self.real_time_factor is None:
+            return 0.0
+        return self.step_length / self.real_time_factor
+
+    def next_deadline(self):
+        return self.anchor_time + self.anchor_steps * self.step_interval()
+
+    def step_due(self):
+        """Whether the next step should run now; writes off lag beyond max_lag_seconds"""
+        now = time.monotonic()
+        with self.lock:
+            if self.real_time_factor is None:
+                return True
+            lag = now - self.next_deadline()
+            if lag > self.max_lag_seconds:
+                self.dropped_seconds += lag
+                self.rebase(now)
+                return True
+            return lag >= 0
+
+    def batch_limit_reached(self, steps, batch_started):
+        """Stop a batch to publish a frame at least every publish_interval"""
+        return steps >= self.max_batch_steps or time.monotonic() - batch_started >= self.publish_interval
+
+    def advance(self, steps=1):
+        """Record executed steps"""
+        with self.lock:
+            self.anchor_steps += steps
+            self.total_steps += steps
+            self.rate_steps += steps
+
+    def finish_batch(self, steps):
+        """Account a completed batch and refresh the achieved real-time factor"""
+        now = time.monotonic()
+        with self.lock:
+            if steps:
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, steps)
+            elapsed = now - self.rate_started
+            if elapsed >= 1.0:
+                self.achieved_factor = self.rate_steps * self.step_length / elapsed
+                self.rate_started = now
+                self.rate_steps = 0
+
+    def wait(self, paused=False):
+        """Sleep until the next step is due, or one publish interval while paused"""
+        if paused:
+            timeout = self.publish_interval
+        else:
+            with self.lock:
+                timeout = self.next_deadline() - time.monotonic()
+            timeout = min(timeout, self.publish_interval)
+        if timeout > 0:
+            self.wakeup.wait(timeout)
+        self.wakeup.clear()
+
+    def stats(self):
+        with self.lock:
+            lag = time.monotonic() - self.next_deadline()
+            return {
+                'targetRealTimeFactor': MAX_SPEED if self.real_time_factor is None else self.real_time_factor,
+                'achievedRealTimeFactor': round(self.achieved_factor, 3),
+                'stepLength': self.step_length,
+                'lagSeconds': round(max(0.0, lag), 3) if self.real_time_factor is not None else 0.0,
+                'droppedSeconds': round(self.dropped_seconds, 3),
+                'totalSteps': self.total_steps,
+                'batches': self.batches,
+                'largestBatch': self.largest_batch,
+                'maxBatchSteps': self.max_batch_steps,
+                'publishInterval': self.publish_interval
+            }
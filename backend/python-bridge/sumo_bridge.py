@@ -6,47 +6,194 @@ Connects to SUMO via TraCI and exposes data via HTTP API
 
 import traci
 import sumolib
+from traci import constants as tc
 import json
 import time
 import threading
 import subprocess
-from flask import Flask, jsonify
+import numpy as np
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import logging
 import sys
 import os
 
+from binary_frame import StringTable, build_response, encode_frame
+from bridge_metrics import BridgeMetrics
+from command_queue import CommandQueue, SimulationStatus, TrafficLightOverride
+from frame_cache import FrameCache
+from frame_stream import FrameBroadcaster, sse_frame
+from edge_stats import EdgeStats
+from geo_projection import NetworkProjection
+from heatmap import Heatmap, parse_zoom_range
+from history import StepHistory, parse_fields, vehicle_columns
+from network_geometry import find_net_file, load_network_geometry, read_location
+from run_recorder import RunRecorder, config_output
+from scenario_manager import ScenarioManager, parse_cpu_sets, parse_scenarios, pin_process
+from simulation_snapshot import SimulationSnapshot, EMPTY_SNAPSHOT
+from spatial_index import SnapshotIndex, parse_bbox
+from step_scheduler import StepScheduler, parse_speed
+from traffic_lights import OVERRIDE_SIGNALS, STATE_NAMES, OverrideScheduler, TrafficLightTracker
+from vehicle_delta import VehicleChangeLog
+from vehicle_registry import VehicleRegistry
+from vehicle_subscriptions import VehicleSubscriptionManager
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Serializes traci.start() and the working directory change around it
+TRACI_START_LOCK = threading.Lock()
+
+# A vehicle whose id or vType contains one of these is an emergency vehicle
+EMERGENCY_KEYWORDS = ('ambulance', 'police', 'fire', 'emergency', 'rescue')
+
 class SUMOBridge:
-    def __init__(self, sumo_host='localhost', sumo_port=8813, api_port=8814):
+    def __init__(self, sumo_host='localhost', sumo_port=8813, api_port=8814, scenario_id=None, config_path=None,
+                 cpus=None):
         self.sumo_host = sumo_host
         self.sumo_port = sumo_port
         self.api_port = api_port
         self.connected = False
         self.simulation_running = False
         
+        # Scenario bridges each own a TraCI connection under their scenario id;
+        # `self.traci` is that connection once started (the traci module before)
+        self.scenario_id = scenario_id
+        self.label = scenario_id or 'default'
+        self.config_path = config_path
+        self.traci = traci
+        
+        # CPUs the SUMO process is pinned to, None to leave it unpinned
+        self.cpus = cpus
+        
+        # Other scenarios mounted under /scenarios/<id> of this bridge's app
+        self.scenarios = None
+        
         # SUMO process management
         self.sumo_process = None
         
-        # Data cache
-        self.vehicles_data = []
-        self.intersections_data = []
-        self.roads_data = []
-        self.emergency_vehicles_data = []
-        self.simulation_stats = {}
+        # Data cache: the update thread publishes one immutable snapshot per
+        # step by swapping this reference; readers never take a lock
+        self.snapshot = EMPTY_SNAPSHOT
+        self.step_length = 1.0
+        
+        # Latency and per-step histograms served at /metrics
+        self.metrics = BridgeMetrics()
+        
+        # Each snapshot view is serialized once and shared by all clients
+        self.frame_cache = FrameCache(gzip_level=int(os.getenv('FRAME_GZIP_LEVEL', '5')),
+                                      observe=self.observe_serialization)
+        self.frame_gzip = os.getenv('FRAME_GZIP', 'true').lower() == 'true'
+        
+        # Ids interned for /all-data.bin, replaced together with the run id
+        self.frame_strings = StringTable()
+        
+        # Push subscribers of /stream; each holds at most STREAM_QUEUE_FRAMES
+        # pending frames and skips to the latest step when it falls behind
+        self.frame_stream = FrameBroadcaster(max_frames=int(os.getenv('STREAM_QUEUE_FRAMES', '1')))
+        self.stream_keepalive = float(os.getenv('STREAM_KEEPALIVE_SECONDS', '15'))
+        
+        # Grid index over vehicle positions for /vehicles?bbox=, built once per snapshot
+        self.vehicle_index = SnapshotIndex(cell_meters=float(os.getenv('SPATIAL_CELL_METERS', '250')))
+        
+        # Zoom levels aggregated per step for /heatmap
+        self.heatmap_zooms = parse_zoom_range(os.getenv('HEATMAP_ZOOMS', '10-16'))
+        
+        # Recent per-step vehicle changes for /vehicles/delta
+        self.vehicle_changes = VehicleChangeLog(max_steps=int(os.getenv('DELTA_LOG_STEPS', '300')))
+        
+        # Columnar vehicles of the last HISTORY_STEPS published steps for
+        # /history, in an arena of at most HISTORY_MAX_MB
+        self.history = StepHistory(max_steps=int(os.getenv('HISTORY_STEPS', '600')),
+                                   max_bytes=int(float(os.getenv('HISTORY_MAX_MB', '256')) * 1024 * 1024))
+        # Registry slots of the last collected vehicles, in snapshot order
+        self.collected_slots = None
+        
+        # Append-only recording of every step under RECORD_DIR (disabled when unset)
+        self.recorder = RunRecorder(os.getenv('RECORD_DIR', ''),
+                                    segment_steps=int(os.getenv('RECORD_SEGMENT_STEPS', '600')))
+        
+        # Static network geometry (edge shapes, junction and TLS positions),
+        # loaded in the background on connect and cached on disk by net hash
+        self.network_geometry = None
+        self.projection = NetworkProjection()
+        
+        # Per-edge traffic state for the whole network, built on the geometry
+        self.edge_stats = None
+        self.network_cache_dir = os.getenv('NETWORK_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+        
+        # Step pacing: SIM_REAL_TIME_FACTOR is simulated seconds per wall-clock
+        # second ('max' runs unpaced); frames are published at least every
+        # SIM_PUBLISH_INTERVAL seconds while catching up
+        self.scheduler = StepScheduler(
+            real_time_factor=parse_speed(os.getenv('SIM_REAL_TIME_FACTOR', '10')),
+            publish_interval=float(os.getenv('SIM_PUBLISH_INTERVAL', '0.1')),
+            max_batch_steps=int(os.getenv('SIM_MAX_BATCH_STEPS', '50')),
+            max_lag_seconds=float(os.getenv('SIM_MAX_LAG_SECONDS', '1.0'))
+        )
+        
+        # Vehicle collection: 'subscription' reads every vehicle from one
+        # step response, 'polling' issues per-vehicle getter calls
+        self.vehicle_collection_mode = os.getenv('VEHICLE_COLLECTION_MODE', 'subscription')
+        self.vehicle_subscriptions = VehicleSubscriptionManager()
+        
+        # Static per-vehicle attributes and the shared route table behind /routes
+        self.vehicle_registry = VehicleRegistry(self.classify_vehicle_type, self.classify_vehicle)
+        
+        # Traffic light programs and positions, with one subscription per light
+        self.traffic_lights = TrafficLightTracker()
+        
+        # Timed overrides from /command/traffic-light, restored on expiry
+        self.overrides = OverrideScheduler(self.traffic_lights)
+        
+        # TraCI commands from request threads, applied by the update loop
+        # between steps; requests wait at most COMMAND_TIMEOUT_SECONDS
+        self.commands = CommandQueue(observe=self.observe_command)
+        self.command_timeout = float(os.getenv('COMMAND_TIMEOUT_SECONDS', '5'))
+        
+        # Views of the current snapshot that take no parameters, by route:
+        # (frame cache view, payload builder). Flask and the ASGI server both
+        # serve them from the frame cache
+        self.snapshot_views = {
+            '/vehicles': ('vehicles', self.build_vehicles),
+            '/intersections': ('intersections', self.build_intersections),
+            '/roads': ('roads', self.build_roads),
+            '/emergency-vehicles': ('emergency-vehicles', self.build_emergency_vehicles),
+            '/simulation-stats': ('simulation-stats', self.build_simulation_stats),
+            '/all-data': ('all-data', self.build_all_data)
+        }
         
         # Flask app
         self.app = Flask(__name__)
         CORS(self.app)
         self.setup_routes()
+        self.setup_request_metrics()
         
         # Update thread
         self.update_thread = None
         self.stop_updates = False
-        
+
+    @property
+    def vehicles_data(self):
+        return self.snapshot.vehicles
+
+    @property
+    def emergency_vehicles_data(self):
+        return self.snapshot.emergency_vehicles
+
+    @property
+    def intersections_data(self):
+        return self.snapshot.intersections
+
+    @property
+    def roads_data(self):
+        return self.snapshot.roads
+
+    @property
+    def simulation_stats(self):
+        return self.snapshot.stats
+
     def safe_float(self, value, default=0.0):
         """Safely convert TraCI return value to float"""
         try:
@@ -77,6 +224,51 @@ class SUMOBridge:
         except (ValueError, TypeError, IndexError, OverflowError):
             return default
         
+    def setup_request_metrics(self):
+        """Time every request by its route pattern"""
+        
+        @self.app.before_request
+        def start_request_timer():
+            request.metrics_started = time.perf_counter()
+        
+        @self.app.after_request
+        def observe_request(response):
+            started = getattr(request, 'metrics_started', None)
+            if started is not None:
+                # Streams stay open for the whole connection; their latency says nothing
+                if not response.is_streamed:
+                    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+                    self.metrics.request_seconds.observe(time.perf_counter() - started, endpoint=endpoint,
+                                                         method=request.method, status=response.status_code)
+            return response
+    
+    def observe_serialization(self, view, encoding, seconds):
+        # Delta and viewport views are keyed by their parameters; label each kind as one view
+        if view.startswith('vehicles-delta-'):
+            view = 'vehicles-delta'
+        elif view.startswith('vehicles-bbox-'):
+            view = 'vehicles-bbox'
+        elif view.startswith('heatmap-'):
+            view = 'heatmap'
+        self.metrics.serialize_seconds.observe(seconds, view=view, encoding=encoding)
+    
+    def observe_command(self, command, seconds):
+        self.metrics.command_seconds.observe(seconds, command=command.name)
+    
+    def execute_command(self, command):
+        """
+        Run a TraCI command from a request thread and return its result. The
+        update loop applies it at the next step boundary; while no loop is
+        running the caller applies it under the connection lock instead.
+        """
+        future = self.commands.submit(command)
+        if self.update_thread is not None and self.update_thread.is_alive():
+            self.scheduler.wakeup.set()
+        else:
+            with self.commands.connection_lock:
+                self.commands.apply_pending(self)
+        return future.result(timeout=self.command_timeout)
+    
     def setup_routes(self):
         """Setup Flask API routes"""
         
@@ -86,9 +278,49 @@ class SUMOBridge:
                 'status': 'healthy',
                 'connected': self.connected,
                 'simulation_running': self.simulation_running,
+                'stream': self.frame_stream.stats(),
+                'history': self.history.stats(),
+                'recorder': self.recorder.stats(),
+                'timestamp': time.time()
+            })
+        
+        @self.app.route('/scenarios')
+        def list_scenarios():
+            """Scenarios served under /scenarios/<id>/, each with its own SUMO"""
+            scenarios = self.scenarios.describe() if self.scenarios else []
+            return jsonify({
+                'scenarios': scenarios,
+                'count': len(scenarios),
                 'timestamp': time.time()
             })
         
+        @self.app.route('/scenarios/connect', methods=['POST'])
+        def connect_scenarios():
+            """Start all scenarios, or those listed in {"scenarios": [...]}"""
+            if not self.scenarios:
+                return jsonify({'status': 'error', 'message': 'No scenarios configured'}), 404
+            data = request.get_json(silent=True) or {}
+            results = self.scenarios.connect(data.get('scenarios'))
+            return jsonify({
+                'status': 'success' if all(results.values()) else 'error',
+                'connected': results,
+                'scenarios': self.scenarios.describe()
+            })
+        
+        @self.app.route('/scenarios/disconnect', methods=['POST'])
+        def disconnect_scenarios():
+            if not self.scenarios:
+                return jsonify({'status': 'error', 'message': 'No scenarios configured'}), 404
+            self.scenarios.disconnect()
+            return jsonify({'status': 'success', 'scenarios': self.scenarios.describe()})
+        
+        @self.app.route('/metrics')
+        def get_metrics():
+            """Histograms in Prometheus text format, or as JSON with ?format=json"""
+            if request.args.get('format') == 'json':
+                return jsonify(self.metrics.as_json())
+            return Response(self.metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+        
         @self.app.route('/system-info')
         def system_info():
             """Provide comprehensive system information"""
@@ -118,8 +350,8 @@ class SUMOBridge:
                             'traci_port': self.sumo_port,
                             'connected': self.connected
                         },
-                        'vehicle_count': len(traci.vehicle.getIDList()) if self.connected else 0,
-                        'simulation_time': self.safe_float(traci.simulation.getTime()) if self.connected else 0,
+                        'vehicle_count': self.snapshot.vehicle_count if self.connected else 0,
+                        'simulation_time': self.snapshot.sim_time if self.connected else 0,
                         'timestamp': time.time()
                     }
                 })
@@ -134,14 +366,15 @@ class SUMOBridge:
         def connect():
             try:
                 success = self.connect_to_sumo()
+                status = self.execute_command(SimulationStatus()) if success else {}
                 return jsonify({
                     'status': 'success' if success else 'error',
                     'message': 'Connected to SUMO' if success else 'Failed to connect to SUMO',
                     'data': {
                         'connected': success,
                         'sumo_running': success,
-                        'simulation_time': traci.simulation.getTime() if success else 0,
-                        'vehicle_count': len(traci.vehicle.getIDList()) if success else 0
+                        'simulation_time': status.get('simulation_time', 0),
+                        'vehicle_count': status.get('vehicle_count', 0)
                     }
                 })
             except Exception as e:
@@ -167,10 +400,11 @@ class SUMOBridge:
                     time.sleep(3)
                     
                     # Get initial statistics
-                    current_time = self.safe_float(traci.simulation.getTime())
-                    final_vehicle_count = len(traci.vehicle.getIDList())
-                    loaded_count = traci.simulation.getLoadedNumber()
-                    departed_count = traci.simulation.getDepartedNumber()
+                    status = self.execute_command(SimulationStatus())
+                    current_time = status['simulation_time']
+                    final_vehicle_count = status['vehicle_count']
+                    loaded_count = status['loaded_count']
+                    departed_count = status['departed_count']
                     
                     logger.info(f"SUMO connected - Loaded: {loaded_count}, Active: {final_vehicle_count}, Departed: {departed_count}")
                     
@@ -235,19 +469,21 @@ class SUMOBridge:
                     if connected:
                         # Wait for vehicles to load in full simulation
                         time.sleep(5)
-                        final_vehicle_count = len(traci.vehicle.getIDList())
+                        status = self.execute_command(SimulationStatus())
                         
-                        # If no vehicles yet, try advancing more steps
-                        if final_vehicle_count == 0:
-                            logger.info("No vehicles found initially in full sim, advancing simulation...")
+                        # If no vehicles yet, give the update loop time to advance
+                        if status['vehicle_count'] == 0:
+                            logger.info("No vehicles found initially in full sim, waiting for the simulation to advance...")
                             for _ in range(10):
-                                traci.simulationStep()
-                                final_vehicle_count = len(traci.vehicle.getIDList())
-                                if final_vehicle_count > 0:
-                                    break
                                 time.sleep(1)
+                                status = self.execute_command(SimulationStatus())
+                                if status['vehicle_count'] > 0:
+                                    break
+                        final_vehicle_count = status['vehicle_count']
+                        simulation_time = status['simulation_time']
                     else:
                         final_vehicle_count = 0
+                        simulation_time = 0
                     
                     return jsonify({
                         'status': 'success' if connected else 'error',
@@ -255,7 +491,7 @@ class SUMOBridge:
                         'data': {
                             'sumo_started': True,
                             'connected': connected,
-                            'simulation_time': self.safe_float(traci.simulation.getTime()) if connected else 0,
+                            'simulation_time': simulation_time,
                             'vehicle_count': final_vehicle_count,
                             'configuration': 'full'
                         }
@@ -289,87 +525,172 @@ class SUMOBridge:
         
         @self.app.route('/status')
         def get_status():
-            try:
-                if self.connected:
-                    current_time = traci.simulation.getTime()
-                    vehicle_count = len(traci.vehicle.getIDList())
-                else:
-                    current_time = 0
-                    vehicle_count = 0
-                    
-                return jsonify({
-                    'status': 'success',
-                    'data': {
-                        'connected': self.connected,
-                        'sumo_running': self.simulation_running,
-                        'simulation_time': current_time,
-                        'vehicle_count': vehicle_count,
-                        'last_update': time.time()
-                    }
-                })
-            except Exception as e:
-                return jsonify({
-                    'status': 'error',
-                    'message': str(e),
-                    'data': {
-                        'connected': False,
-                        'sumo_running': False,
-                        'simulation_time': 0,
-                        'vehicle_count': 0,
-                        'last_update': time.time()
-                    }
-                })
+            snapshot = self.snapshot
+            return jsonify({
+                'status': 'success',
+                'data': {
+                    'connected': self.connected,
+                    'sumo_running': self.simulation_running,
+                    'simulation_time': snapshot.sim_time if self.connected else 0,
+                    'vehicle_count': snapshot.vehicle_count if self.connected else 0,
+                    'step': snapshot.step,
+                    'last_update': time.time()
+                }
+            })
         
         @self.app.route('/vehicles')
         def get_vehicles():
-            return jsonify({
+            bbox = request.args.get('bbox')
+            limit = request.args.get('limit')
+            if bbox is not None or limit is not None:
+                try:
+                    bbox = parse_bbox(bbox) if bbox is not None else None
+                    limit = int(limit) if limit is not None else None
+                    if limit is not None and limit < 0:
+                        raise ValueError('limit must not be negative')
+                except ValueError as e:
+                    return jsonify({'status': 'error', 'message': str(e)}), 400
+                view = f"vehicles-bbox-{','.join(map(str, bbox)) if bbox else 'all'}-{limit}"
+                return self.frame_response(view, lambda snapshot: self.build_viewport(snapshot, bbox, limit))
+            
+            return self.frame_response(*self.snapshot_views['/vehicles'])
+        
+        @self.app.route('/heatmap')
+        def get_heatmap():
+            """Per-cell vehicle counts and speeds at map zoom z, optionally within a bbox"""
+            zoom = request.args.get('z', type=int)
+            if zoom is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Query parameter z=<zoom> is required'
+                }), 400
+            bbox = request.args.get('bbox')
+            try:
+                bbox = parse_bbox(bbox) if bbox is not None else None
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+            
+            view = f"heatmap-{zoom}-{','.join(map(str, bbox)) if bbox else 'all'}"
+            return self.frame_response(view, lambda snapshot: self.build_heatmap(snapshot, zoom, bbox))
+        
+        @self.app.route('/vehicles/delta')
+        def get_vehicles_delta():
+            since = request.args.get('since', type=int)
+            if since is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': 'Query parameter since=<step> is required'
+                }), 400
+            
+            # Steps from a previous run mean nothing in this one
+            run = request.args.get('run')
+            if run is not None and run != self.frame_cache.run_id:
+                since = -1
+            
+            return self.frame_response(f'vehicles-delta-{since}', lambda snapshot: {
                 'status': 'success',
-                'data': self.vehicles_data,
-                'timestamp': time.time(),
-                'count': len(self.vehicles_data)
+                'run': self.frame_cache.run_id,
+                **self.vehicle_changes.delta(since, snapshot)
             })
         
+        @self.app.route('/history')
+        def get_history():
+            """
+            Recorded steps between simulation times `from` and `to` (negative:
+            seconds before the newest step), with the vehicle columns in `fields`
+            """
+            try:
+                start_time = float(request.args['from']) if 'from' in request.args else None
+                end_time = float(request.args['to']) if 'to' in request.args else None
+                fields = parse_fields(request.args.get('fields'))
+                bbox = parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+                every = int(request.args.get('every', 1))
+                limit = int(request.args.get('limit', 300))
+                if every < 1 or limit < 1:
+                    raise ValueError('every and limit must be positive')
+            except ValueError as e:
+                return jsonify({'status': 'error', 'message': str(e)}), 400
+            
+            return jsonify(self.history.query(start_time, end_time, fields, bbox, every, limit))
+        
+        @self.app.route('/history/info')
+        def get_history_info():
+            return jsonify({'status': 'success', 'data': self.history.stats()})
+        
+        @self.app.route('/routes/<route_id>')
+        def get_route(route_id):
+            """Edges of an interned route; ids are content hashes, so responses never change"""
+            edges = self.vehicle_registry.routes.get(route_id)
+            if edges is None:
+                return jsonify({'error': f'Unknown route {route_id}'}), 404
+            response = jsonify({'id': route_id, 'edges': list(edges)})
+            response.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+            return response
+        
         @self.app.route('/intersections')
         def get_intersections():
-            return jsonify({
-                'status': 'success',
-                'data': self.intersections_data,
-                'timestamp': time.time(),
-                'count': len(self.intersections_data)
-            })
+            return self.frame_response(*self.snapshot_views['/intersections'])
         
         @self.app.route('/roads')
         def get_roads():
-            return jsonify({
-                'roads': self.roads_data,
-                'timestamp': time.time(),
-                'count': len(self.roads_data)
-            })
+            return self.frame_response(*self.snapshot_views['/roads'])
         
         @self.app.route('/emergency-vehicles')
         def get_emergency_vehicles():
-            return jsonify({
-                'emergency_vehicles': self.emergency_vehicles_data,
-                'timestamp': time.time(),
-                'count': len(self.emergency_vehicles_data)
-            })
+            return self.frame_response(*self.snapshot_views['/emergency-vehicles'])
         
         @self.app.route('/simulation-stats')
         def get_simulation_stats():
-            return jsonify({
-                'stats': self.simulation_stats,
-                'timestamp': time.time()
-            })
+            return self.frame_response(*self.snapshot_views['/simulation-stats'])
         
         @self.app.route('/all-data')
         def get_all_data():
-            return jsonify({
-                'vehicles': self.vehicles_data,
-                'intersections': self.intersections_data,
-                'roads': self.roads_data,
-                'emergency_vehicles': self.emergency_vehicles_data,
-                'stats': self.simulation_stats,
-                'timestamp': time.time()
+            return self.frame_response(*self.snapshot_views['/all-data'])
+        
+        @self.app.route('/all-data.bin')
+        def get_all_data_binary():
+            """
+            Columnar binary /all-data frame. `dict` is the number of string
+            table entries the client holds for run `run`; only newer entries
+            are sent.
+            """
+            run = request.args.get('run')
+            known = request.args.get('dict', default=0, type=int)
+            if run != self.frame_cache.run_id or known < 0:
+                known = 0
+            
+            snapshot = self.snapshot
+            strings = self.frame_strings
+            compressed = self.frame_gzip and 'gzip' in request.headers.get('Accept-Encoding', '')
+            etag = f"{self.frame_cache.etag(snapshot, 'all-data.bin', compressed)}-{known}"
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                build = lambda snapshot: encode_frame(snapshot, strings)
+                frame, _ = self.frame_cache.get(snapshot, 'all-data.bin', build)
+                body = build_response(strings, known, frame)
+                if compressed:
+                    # The dictionary prefix differs per client; a second gzip
+                    # member with the cached compressed frame follows it
+                    compressed_frame, _ = self.frame_cache.get(snapshot, 'all-data.bin', build, True)
+                    body = self.frame_cache.compress('all-data.bin', body[:-len(frame)]) + compressed_frame
+                response = Response(body, mimetype='application/octet-stream')
+                if compressed:
+                    response.headers['Content-Encoding'] = 'gzip'
+            
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.headers['Vary'] = 'Accept-Encoding'
+            response.headers['X-Frame-Run'] = self.frame_cache.run_id
+            return response
+        
+        @self.app.route('/stream')
+        def stream_all_data():
+            """Server-Sent Events stream of /all-data frames, one per step"""
+            subscriber = self.frame_stream.subscribe()
+            return Response(self.stream_frames(subscriber), mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
             })
         
         @self.app.route('/command/traffic-light', methods=['POST'])
@@ -379,16 +700,35 @@ class SUMOBridge:
                 data = request.get_json()
                 intersection_id = data.get('intersectionId')
                 phase = data.get('phase', 'green')
-                duration = data.get('duration', 30)
+                try:
+                    duration = float(data.get('duration', 30))
+                except (TypeError, ValueError):
+                    duration = 0
+                if phase not in OVERRIDE_SIGNALS or duration <= 0:
+                    return jsonify({
+                        'success': False,
+                        'message': f'phase must be one of {", ".join(OVERRIDE_SIGNALS)} and duration a positive number'
+                    }), 400
                 
-                success = self.override_traffic_light(intersection_id, phase, duration)
+                override = self.execute_command(TrafficLightOverride(intersection_id, phase, duration)) \
+                    if self.connected else None
                 return jsonify({
-                    'success': success,
-                    'message': f'Traffic light {intersection_id} set to {phase}' if success else 'Command failed'
+                    'success': override is not None,
+                    'message': f'Traffic light {intersection_id} set to {phase} for {duration:g}s'
+                               if override is not None else 'Command failed',
+                    'expiresAt': override.expires_at if override is not None else None
                 })
             except Exception as e:
                 return jsonify({'success': False, 'message': str(e)}), 500
                 
+        @self.app.route('/command/traffic-light/active')
+        def active_overrides():
+            """Overrides that have not expired yet, earliest expiry first"""
+            return jsonify({
+                'success': True,
+                'data': self.overrides.describe(self.snapshot.sim_time)
+            })
+                
         @self.app.route('/simulation/pause', methods=['POST'])
         def pause_simulation():
             try:
@@ -410,6 +750,24 @@ class SUMOBridge:
                     'message': str(e)
                 }), 500
                 
+        @self.app.route('/simulation/speed', methods=['GET', 'POST'])
+        def simulation_speed():
+            if request.method == 'POST':
+                data = request.get_json(silent=True) or {}
+                try:
+                    self.scheduler.set_speed(parse_speed(data.get('realTimeFactor')))
+                except (TypeError, ValueError):
+                    return jsonify({
+                        'status': 'error',
+                        'message': 'realTimeFactor must be a finite positive number or "max"'
+                    }), 400
+                logger.info(f"Simulation speed set to {data.get('realTimeFactor')}")
+            
+            return jsonify({
+                'status': 'success',
+                'data': self.scheduler.stats()
+            })
+        
         @self.app.route('/simulation/resume', methods=['POST'])
         def resume_simulation():
             try:
@@ -431,16 +789,153 @@ class SUMOBridge:
                     'message': str(e)
                 }), 500
     
+    def build_viewport(self, snapshot, bbox, limit):
+        """Build a /vehicles payload restricted to a bounding box and/or count"""
+        if bbox is not None:
+            vehicles = [snapshot.vehicles[index] for index in self.vehicle_index.get(snapshot).query(*bbox).tolist()]
+        else:
+            vehicles = list(snapshot.vehicles)
+        total = len(vehicles)
+        if limit is not None:
+            vehicles = vehicles[:limit]
+        return {
+            'status': 'success',
+            'data': vehicles,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at,
+            'count': len(vehicles),
+            'total': total,
+            'truncated': len(vehicles) < total
+        }
+    
+    def build_heatmap(self, snapshot, zoom, bbox):
+        """Build a /heatmap payload from the snapshot's precomputed grids"""
+        heatmap = snapshot.heatmap
+        grid = heatmap.grid(zoom) if heatmap is not None else None
+        return {
+            'status': 'success',
+            'zoom': grid.zoom if grid is not None else zoom,
+            'cellZoom': grid.cell_zoom if grid is not None else None,
+            'cells': grid.cells(bbox) if grid is not None else [],
+            'vehicleCount': heatmap.vehicle_count if heatmap is not None else 0,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at
+        }
+    
+    def build_vehicles(self, snapshot):
+        return {
+            'status': 'success',
+            'data': snapshot.vehicles,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at,
+            'count': len(snapshot.vehicles)
+        }
+    
+    def build_intersections(self, snapshot):
+        return {
+            'status': 'success',
+            'data': snapshot.intersections,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at,
+            'count': len(snapshot.intersections)
+        }
+    
+    def build_roads(self, snapshot):
+        return {
+            'roads': snapshot.roads,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at,
+            'count': len(snapshot.roads)
+        }
+    
+    def build_emergency_vehicles(self, snapshot):
+        return {
+            'emergency_vehicles': snapshot.emergency_vehicles,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at,
+            'count': len(snapshot.emergency_vehicles)
+        }
+    
+    def build_simulation_stats(self, snapshot):
+        return {
+            'stats': snapshot.stats,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at
+        }
+    
+    def build_all_data(self, snapshot):
+        """Build the /all-data payload for a snapshot"""
+        return {
+            'vehicles': snapshot.vehicles,
+            'intersections': snapshot.intersections,
+            'roads': snapshot.roads,
+            'emergency_vehicles': snapshot.emergency_vehicles,
+            'stats': snapshot.stats,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'timestamp': snapshot.created_at
+        }
+    
+    def stream_frames(self, subscriber):
+        """Yield SSE events for a subscriber, starting with the current frame"""
+        try:
+            yield b'retry: 1000\n\n'
+            snapshot = self.snapshot
+            last_etag = None
+            
+            while True:
+                if snapshot is None:
+                    # Comment line keeps proxies open and detects gone clients
+                    yield b': keepalive\n\n'
+                else:
+                    body, etag = self.frame_cache.get(snapshot, 'all-data', self.build_all_data)
+                    if etag != last_etag:
+                        last_etag = etag
+                        yield sse_frame(etag, body)
+                
+                snapshot = subscriber.next(self.stream_keepalive)
+        finally:
+            self.frame_stream.unsubscribe(subscriber)
+    
+    def frame_response(self, view, build):
+        """Serve a view of the current snapshot from the frame cache with ETag/304 support"""
+        snapshot = self.snapshot
+        compressed = self.frame_gzip and 'gzip' in request.headers.get('Accept-Encoding', '')
+        etag = self.frame_cache.etag(snapshot, view, compressed)
+        
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            body, etag = self.frame_cache.get(snapshot, view, build, compressed)
+            response = Response(body, mimetype='application/json')
+            if compressed:
+                response.headers['Content-Encoding'] = 'gzip'
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    
     def connect_to_sumo(self, use_gui=False):
         """Connect to SUMO via TraCI using fixed approach with traci.start()"""
         try:
             logger.info("Connecting to SUMO via TraCI (using fixed method with traci.start())...")
             
-            # Close any existing connection first
-            try:
-                traci.close()
-            except Exception:
-                pass
+            # Stop stepping any existing connection, then close it
+            self.stop_data_updates()
+            with self.commands.connection_lock:
+                self.commands.cancel_pending('Reconnecting to SUMO')
+                try:
+                    traci.getConnection(self.label).close()
+                except Exception:
+                    pass
             
             # Determine config path to use
             config_to_use = None
@@ -450,7 +945,8 @@ class SUMOBridge:
             project_root = os.path.dirname(os.path.dirname(script_dir))
             
             # Use AddisAbaba.sumocfg as the main config (it has routes.xml)
-            regular_config = os.path.join(project_root, 'AddisAbabaSumo', 'AddisAbaba.sumocfg')
+            # unless this bridge runs a scenario with its own config
+            regular_config = self.config_path or os.path.join(project_root, 'AddisAbabaSumo', 'AddisAbaba.sumocfg')
             
             if os.path.exists(regular_config):
                 config_to_use = regular_config
@@ -499,72 +995,107 @@ class SUMOBridge:
                     "--time-to-teleport", "600"
                 ])
             
+            # The recorder replaces the config's FCD XML output
+            if self.recorder.enabled and config_output(config_path, 'fcd-output'):
+                sumo_cmd.extend(["--fcd-output", "/dev/null"])
+            
             logger.info(f"Starting SUMO with: {' '.join(sumo_cmd)}")
             logger.info(f"Working directory: {config_dir}")
             
-            # Store original working directory
-            original_cwd = os.getcwd()
+            # traci.start is not thread-safe and the working directory is
+            # shared by every scenario, so start one SUMO at a time
+            with TRACI_START_LOCK:
+                original_cwd = os.getcwd()
+                try:
+                    # CRITICAL: Change to config directory for relative paths
+                    os.chdir(config_dir)
+                    
+                    # Use traci.start() - the proper way to connect; only the
+                    # default bridge makes its connection TraCI's current one
+                    traci.start(sumo_cmd, label=self.label, doSwitch=self.scenario_id is None)
+                finally:
+                    # Restore original directory
+                    os.chdir(original_cwd)
             
-            try:
-                # CRITICAL: Change to config directory for relative paths
-                os.chdir(config_dir)
-                
-                # Use traci.start() - the proper way to connect
-                traci.start(sumo_cmd, label="default")
-                
-                # Wait for initialization
-                import time
-                time.sleep(2)
-                
-                # Verify connection
-                current_time = self.safe_float(traci.simulation.getTime())
-                loaded_vehicles = traci.simulation.getLoadedNumber()
-                departed_vehicles = traci.simulation.getDepartedNumber()
-                
-                logger.info(f"Connected to SUMO successfully!")
-                logger.info(f"Initial state - Time: {current_time}, Loaded: {loaded_vehicles}, Departed: {departed_vehicles}")
-                
-                # CRITICAL FIX: Advance simulation to load vehicles from routes.xml
-                if loaded_vehicles == 0 or departed_vehicles == 0:
-                    logger.warning("No vehicles loaded/departed initially, advancing simulation to load routes...")
-                    steps_needed = 0
-                    max_steps = 100  # Try up to 100 steps to get vehicles
+            # Request threads must not use the new connection while it is set up
+            with self.commands.connection_lock:
+                try:
+                    self.traci = traci.getConnection(self.label)
+                    self.pin_sumo_process()
+                    self.metrics.attach(self.traci)
+                    self.vehicle_subscriptions.reset(self.traci)
+                    self.vehicle_registry.reset(self.traci)
+                    self.traffic_lights.reset(self.traci)
+                    self.overrides.reset(self.traci)
+                    self.frame_strings = StringTable()
+                    self.history.reset(self.frame_strings)
+                    self.frame_cache.new_run()
+                    self.vehicle_changes.reset()
+                    self.step_length = self.safe_float(self.traci.simulation.getDeltaT(), 1.0)
+                    self.scheduler.reset(self.step_length)
+                    self.recorder.start(f'{self.label}_{self.frame_cache.run_id}', self.frame_strings,
+                                        self.step_length, config_path)
+                    self.load_network(config_path)
                     
-                    for i in range(max_steps):
-                        traci.simulationStep()
-                        steps_needed += 1
+                    # Wait for initialization
+                    import time
+                    time.sleep(2)
+                    
+                    # Verify connection
+                    current_time = self.safe_float(self.traci.simulation.getTime())
+                    loaded_vehicles = self.traci.simulation.getLoadedNumber()
+                    departed_vehicles = self.traci.simulation.getDepartedNumber()
+                    
+                    logger.info(f"Connected to SUMO successfully!")
+                    logger.info(f"Initial state - Time: {current_time}, Loaded: {loaded_vehicles}, Departed: {departed_vehicles}")
+                    
+                    # CRITICAL FIX: Advance simulation to load vehicles from routes.xml
+                    if loaded_vehicles == 0 or departed_vehicles == 0:
+                        logger.warning("No vehicles loaded/departed initially, advancing simulation to load routes...")
+                        steps_needed = 0
+                        max_steps = 100  # Try up to 100 steps to get vehicles
                         
-                        # Check every 10 steps
-                        if i % 10 == 0:
-                            loaded_vehicles = traci.simulation.getLoadedNumber()
-                            departed_vehicles = traci.simulation.getDepartedNumber()
-                            active_vehicles = len(traci.vehicle.getIDList())
-                            
-                            logger.info(f"Step {i}: Loaded={loaded_vehicles}, Departed={departed_vehicles}, Active={active_vehicles}")
+                        for i in range(max_steps):
+                            self.traci.simulationStep()
+                            steps_needed += 1
+                            if self.recorder.path is not None:
+                                self.record_unpublished_step()
                             
-                            # If we have active vehicles, routes are loading correctly
-                            if active_vehicles > 0:
-                                logger.info(f"✅ Vehicles detected after {steps_needed} steps! Active vehicles: {active_vehicles}")
-                                break
+                            # Check every 10 steps
+                            if i % 10 == 0:
+                                loaded_vehicles = self.traci.simulation.getLoadedNumber()
+                                departed_vehicles = self.traci.simulation.getDepartedNumber()
+                                active_vehicles = len(self.traci.vehicle.getIDList())
+                                
+                                logger.info(f"Step {i}: Loaded={loaded_vehicles}, Departed={departed_vehicles}, Active={active_vehicles}")
+                                
+                                # If we have active vehicles, routes are loading correctly
+                                if active_vehicles > 0:
+                                    logger.info(f"✅ Vehicles detected after {steps_needed} steps! Active vehicles: {active_vehicles}")
+                                    break
+                        
+                        # Final check
+                        final_active = len(self.traci.vehicle.getIDList())
+                        if final_active == 0:
+                            logger.warning(f"⚠️ No active vehicles after {max_steps} steps. Check route file: routes.xml")
+                        else:
+                            logger.info(f"✅ Simulation ready with {final_active} active vehicles")
                     
-                    # Final check
-                    final_active = len(traci.vehicle.getIDList())
-                    if final_active == 0:
-                        logger.warning(f"⚠️ No active vehicles after {max_steps} steps. Check route file: routes.xml")
-                    else:
-                        logger.info(f"✅ Simulation ready with {final_active} active vehicles")
-                
-                self.connected = True
-                self.simulation_running = True
-                
-                # Start data update thread
-                self.start_data_updates()
-                
-                return True
-                
-            finally:
-                # Restore original directory
-                os.chdir(original_cwd)
+                    self.connected = True
+                    self.simulation_running = True
+                    
+                    # Start data update thread
+                    self.start_data_updates()
+                    
+                    return True
+                    
+                except Exception:
+                    # Do not leave a SUMO process behind a bridge that is not connected
+                    try:
+                        self.traci.close()
+                    except Exception:
+                        pass
+                    raise
                 
         except Exception as e:
             logger.error(f"Failed to connect to SUMO: {e}")
@@ -572,16 +1103,57 @@ class SUMOBridge:
             self.connected = False
             return False
     
+    def pin_sumo_process(self):
+        """Restrict the SUMO process of this bridge to its CPUs"""
+        if not self.cpus:
+            return
+        process = getattr(self.traci, '_process', None)
+        if process is None or not hasattr(os, 'sched_setaffinity'):
+            logger.warning(f"Cannot pin SUMO of {self.label} to CPUs {sorted(self.cpus)} on this platform")
+            return
+        pinned = pin_process(process.pid, self.cpus)
+        if pinned:
+            logger.info(f"Pinned SUMO of {self.label} (pid {process.pid}, {pinned} tasks) to CPUs {sorted(self.cpus)}")
+        else:
+            logger.warning(f"Could not pin SUMO of {self.label} to CPUs {sorted(self.cpus)}")
+    
+    def load_network(self, config_path):
+        """
+        Set up the config's network: the projection is read from the net
+        header right away, the full geometry is loaded in the background
+        """
+        try:
+            net_file = find_net_file(config_path)
+            if net_file is None or not os.path.exists(net_file):
+                logger.warning(f"No network file found for {config_path}; road and intersection positions unavailable")
+                return
+            self.projection = NetworkProjection(read_location(net_file))
+            logger.info(f"Network projection ready (fit error {self.projection.fit_error * 1000:.1f} mm)")
+        except Exception as e:
+            logger.error(f"Error reading network projection: {e}")
+            return
+        
+        def load():
+            try:
+                self.network_geometry = load_network_geometry(net_file, self.network_cache_dir)
+            except Exception as e:
+                logger.error(f"Error loading network geometry: {e}")
+        
+        threading.Thread(target=load, name='network-geometry', daemon=True).start()
+    
     def disconnect_from_sumo(self):
         """Disconnect from SUMO"""
         try:
             self.stop_data_updates()
             
-            if self.connected:
-                traci.close()
-                self.connected = False
-                self.simulation_running = False
-                logger.info("Disconnected from SUMO")
+            with self.commands.connection_lock:
+                self.commands.cancel_pending('Disconnected from SUMO')
+                if self.connected:
+                    self.traci.close()
+                    self.connected = False
+                    self.simulation_running = False
+                    logger.info("Disconnected from SUMO")
+                self.recorder.close()
                 
         except Exception as e:
             logger.error(f"Error during disconnection: {e}")
@@ -718,7 +1290,7 @@ class SUMOBridge:
         """Start the data update thread"""
         if self.update_thread is None or not self.update_thread.is_alive():
             self.stop_updates = False
-            self.update_thread = threading.Thread(target=self.update_data_loop)
+            self.update_thread = threading.Thread(target=self.update_data_loop, name=f'updates-{self.label}')
             self.update_thread.daemon = True
             self.update_thread.start()
             logger.info("Started data update thread")
@@ -731,42 +1303,45 @@ class SUMOBridge:
             logger.info("Stopped data update thread")
     
     def update_data_loop(self):
-        """Main data update loop - steps simulation and updates data"""
+        """Main data update loop - steps simulation on the scheduler's deadlines and publishes data"""
         logger.info("Data update loop started - controlling simulation")
         update_count = 0
         last_time = -1
+        self.scheduler.resume()
         
         while not self.stop_updates and self.connected:
             try:
-                update_count += 1
-                
-                # Get current simulation state BEFORE stepping
-                current_time = self.safe_float(traci.simulation.getTime())
-                vehicle_count = len(traci.vehicle.getIDList())
-                
-                # CRITICAL: Step the simulation to advance time
-                # This is needed for vehicles to move and routes to be processed
-                if self.simulation_running:
-                    traci.simulationStep()
+                # Only this thread uses the connection while it applies
+                # commands, steps and collects; it is released while waiting
+                with self.commands.connection_lock:
+                    # Commands queued since the last pass run before the next step
+                    self.commands.apply_pending(self)
+                    paused = not self.simulation_running
+                    steps = 0 if paused else self.run_due_steps()
                     
-                    # Check if time is advancing
-                    new_time = self.safe_float(traci.simulation.getTime())
-                    if new_time > last_time:
-                        last_time = new_time
-                    else:
-                        logger.warning(f"Simulation time not advancing: {new_time}")
-                
-                # Log every 10 updates to monitor progress
-                if update_count % 10 == 0:
-                    loaded = traci.simulation.getLoadedNumber()
-                    departed = traci.simulation.getDepartedNumber()
-                    logger.info(f"Update {update_count}: Time={current_time:.1f}s, Active={vehicle_count}, Loaded={loaded}, Departed={departed}")
-                
-                # Update all simulation data after stepping
-                self.update_simulation_data()
+                    if steps:
+                        update_count += 1
+                        
+                        # Update all simulation data after stepping
+                        self.update_simulation_data()
+                        self.scheduler.finish_batch(steps)
+                        
+                        # Check if time is advancing
+                        snapshot = self.snapshot
+                        if snapshot.sim_time > last_time:
+                            last_time = snapshot.sim_time
+                        else:
+                            logger.warning(f"Simulation time not advancing: {snapshot.sim_time}")
+                        
+                        # Log every 10 updates to monitor progress
+                        if update_count % 10 == 0:
+                            loaded = self.traci.simulation.getLoadedNumber()
+                            departed = self.traci.simulation.getDepartedNumber()
+                            pacing = self.scheduler.stats()
+                            logger.info(f"Update {update_count}: Time={snapshot.sim_time:.1f}s, Active={snapshot.vehicle_count}, "
+                                        f"Loaded={loaded}, Departed={departed}, RTF={pacing['achievedRealTimeFactor']}x")
                 
-                # Control update rate (adjust as needed for performance)
-                time.sleep(0.1)  # Update 10 times per second
+                self.scheduler.wait(paused=paused)
                 
             except Exception as e:
                 logger.error(f"Error in data update loop (update {update_count}): {e}")
@@ -781,28 +1356,85 @@ class SUMOBridge:
                     
                 time.sleep(5)  # Wait before retrying
         
+        # Commands queued while the loop was stopping
+        with self.commands.connection_lock:
+            if self.connected:
+                self.commands.apply_pending(self)
+            else:
+                self.commands.cancel_pending('Not connected to SUMO')
+        
         logger.info(f"Data update loop stopped after {update_count} updates")
     
+    def run_due_steps(self):
+        """
+        Run every step that is due, batching when behind schedule, but stop
+        after one publish interval. Returns the number of steps taken.
+        """
+        batch_started = time.monotonic()
+        steps = 0
+        while self.scheduler.step_due() and not self.scheduler.batch_limit_reached(steps, batch_started):
+            if steps and self.recorder.path is not None:
+                # Only the last step of a batch is published; record the others
+                # before the next step replaces their subscription results
+                with self.metrics.timer(self.metrics.collect_seconds, phase='record'):
+                    self.record_unpublished_step()
+            with self.metrics.timer(self.metrics.step_seconds):
+                self.traci.simulationStep()
+            # Keep the departures and arrivals of every step in a batch
+            self.vehicle_subscriptions.record_step()
+            # Only the earliest expiry is checked, and only while overrides are active
+            if self.overrides.expiries:
+                self.overrides.expire(self.safe_float(self.traci.simulation.getTime()))
+            self.scheduler.advance()
+            steps += 1
+        return steps
+    
     def update_simulation_data(self):
-        """Update all simulation data from SUMO"""
+        """Collect all simulation data from SUMO and publish it as one snapshot"""
         if not self.connected:
             return
         
         try:
-            # Update vehicles
-            self.update_vehicles_data()
-            
-            # Update intersections (traffic lights)
-            self.update_intersections_data()
+            current_time = self.safe_float(self.traci.simulation.getTime())
             
-            # Update roads (edges)
-            self.update_roads_data()
+            # Collect every part of the step before publishing anything
+            metrics = self.metrics
+            with metrics.timer(metrics.collect_seconds, phase='vehicles'):
+                vehicles, emergency_vehicles = self.collect_vehicles_data()
+            with metrics.timer(metrics.collect_seconds, phase='intersections'):
+                intersections = self.collect_intersections_data(current_time)
+            with metrics.timer(metrics.collect_seconds, phase='roads'):
+                roads = self.collect_roads_data(vehicles + emergency_vehicles)
+            with metrics.timer(metrics.collect_seconds, phase='stats'):
+                stats = self.collect_simulation_stats(current_time, len(vehicles) + len(emergency_vehicles))
+            with metrics.timer(metrics.collect_seconds, phase='heatmap'):
+                heatmap = self.collect_heatmap()
             
-            # Update simulation stats
-            self.update_simulation_stats()
+            snapshot = SimulationSnapshot(
+                step=int(round(current_time / self.step_length)),
+                sim_time=current_time,
+                vehicles=tuple(vehicles),
+                emergency_vehicles=tuple(emergency_vehicles),
+                intersections=tuple(intersections),
+                roads=tuple(roads),
+                stats=stats,
+                heatmap=heatmap
+            )
+            with metrics.timer(metrics.collect_seconds, phase='publish'):
+                self.publish_snapshot(snapshot)
+            slots = self.collected_slots
+            if slots is not None and (self.history.enabled or self.recorder.path is not None):
+                # History and recording store the same vehicle columns, built once
+                with metrics.timer(metrics.collect_seconds, phase='history'):
+                    rows = vehicle_columns(self.vehicle_registry, slots, self.frame_strings)
+                    self.history.record(snapshot, self.vehicle_registry, slots, rows)
+                with metrics.timer(metrics.collect_seconds, phase='record'):
+                    self.recorder.record(snapshot.step, snapshot.sim_time, snapshot.created_at, rows,
+                                         snapshot.intersections, self.edge_stats)
+            metrics.observe_update(len(vehicles) + len(emergency_vehicles))
             
             # Check if simulation has ended
-            if traci.simulation.getMinExpectedNumber() == 0:
+            if self.traci.simulation.getMinExpectedNumber() == 0:
                 logger.info("Simulation completed - no more vehicles expected")
                 
         except Exception as e:
@@ -814,220 +1446,245 @@ class SUMOBridge:
                 self.connected = False
                 self.simulation_running = False
     
-    def update_vehicles_data(self):
-        """Update vehicle data from SUMO"""
+    def publish_snapshot(self, snapshot):
+        """Make a snapshot visible to readers with a single reference swap"""
+        # Log the changes first so a delta is available for every published step
+        self.vehicle_changes.record(snapshot.step, snapshot.vehicles)
+        self.snapshot = snapshot
+        self.frame_stream.publish(snapshot)
+    
+    def poll_vehicle_values(self):
+        """Read vehicle values with individual getter calls (legacy mode)"""
+        vehicle_values = {}
+        for vehicle_id in self.traci.vehicle.getIDList():
+            try:
+                vehicle_values[vehicle_id] = {
+                    tc.VAR_POSITION: self.traci.vehicle.getPosition(vehicle_id),
+                    tc.VAR_SPEED: self.traci.vehicle.getSpeed(vehicle_id),
+                    tc.VAR_ANGLE: self.traci.vehicle.getAngle(vehicle_id),
+                    tc.VAR_ROAD_ID: self.traci.vehicle.getRoadID(vehicle_id),
+                    tc.VAR_LANE_ID: self.traci.vehicle.getLaneID(vehicle_id),
+                    tc.VAR_ROUTE_ID: self.traci.vehicle.getRouteID(vehicle_id),
+                    tc.VAR_WAITING_TIME: self.traci.vehicle.getWaitingTime(vehicle_id),
+                    tc.VAR_DISTANCE: self.traci.vehicle.getDistance(vehicle_id)
+                }
+            except Exception as e:
+                logger.warning(f"Error getting data for vehicle {vehicle_id}: {e}")
+        return vehicle_values
+    
+    def sync_vehicle_registry(self):
+        """Bring the vehicle registry to the current step and return its projected active slots"""
+        registry = self.vehicle_registry
+        if self.vehicle_collection_mode == 'polling':
+            vehicle_values = self.poll_vehicle_values()
+            registry.sync(vehicle_values)
+        else:
+            vehicle_values = self.vehicle_subscriptions.collect()
+            if self.vehicle_subscriptions.resynced:
+                registry.sync(vehicle_values)
+            else:
+                registry.apply(self.vehicle_subscriptions.take_events())
+        registry.update(vehicle_values)
+        
+        # Project every active vehicle at once
+        slots = registry.active_slots()
+        registry.lat[slots], registry.lng[slots] = self.projection.project(registry.x[slots], registry.y[slots])
+        return slots
+    
+    def record_unpublished_step(self):
+        """Record the step just taken, which will not be published, with the columns of a published one"""
         try:
-            vehicle_ids = traci.vehicle.getIDList()
-            vehicles = []
-            emergency_vehicles = []
+            current_time = self.safe_float(self.traci.simulation.getTime())
+            registry = self.vehicle_registry
+            slots = self.sync_vehicle_registry()
+            emergency = registry.emergency[slots]
+            slots = np.concatenate((slots[~emergency], slots[emergency]))
             
-            for vehicle_id in vehicle_ids:
-                try:
-                    # Get vehicle data
-                    position = traci.vehicle.getPosition(vehicle_id)
-                    speed = self.safe_float(traci.vehicle.getSpeed(vehicle_id))
-                    angle = self.safe_float(traci.vehicle.getAngle(vehicle_id))
-                    vehicle_type = traci.vehicle.getTypeID(vehicle_id)
-                    road_id = traci.vehicle.getRoadID(vehicle_id)
-                    lane_id = traci.vehicle.getLaneID(vehicle_id)
-                    route = traci.vehicle.getRoute(vehicle_id)
-                    
-                    # Convert SUMO coordinates to lat/lng for Addis Ababa
-                    # Assuming SUMO coordinates are in meters from a reference point
-                    # Adjust these offsets based on your network's actual coordinate system
-                    lat = 9.0320 + (position[1] / 111320.0)  # Convert meters to degrees latitude
-                    lng = 38.7469 + (position[0] / (111320.0 * 0.9))  # Convert meters to degrees longitude
-                    
-                    vehicle_data = {
-                        'id': vehicle_id,
-                        'type': self.map_vehicle_type(vehicle_type),
-                        'position': {
-                            'lat': lat,
-                            'lng': lng,
-                            'roadId': road_id,
-                            'laneId': lane_id
-                        },
-                        'speed': speed * 3.6,  # Convert m/s to km/h
-                        'angle': angle,
-                        'route': list(route),
-                        'timestamp': time.time() * 1000,  # Convert to milliseconds
-                        'waitingTime': self.safe_float(traci.vehicle.getWaitingTime(vehicle_id)),
-                        'distance': self.safe_float(traci.vehicle.getDistance(vehicle_id))
-                    }
-                    
-                    # Check if it's an emergency vehicle
-                    if self.is_emergency_vehicle(vehicle_id, vehicle_type):
-                        emergency_data = vehicle_data.copy()
-                        emergency_data.update({
-                            'emergencyType': self.get_emergency_type(vehicle_id, vehicle_type),
-                            'priority': 'high',
-                            'status': 'responding'
-                        })
-                        emergency_vehicles.append(emergency_data)
-                    else:
-                        vehicles.append(vehicle_data)
-                        
-                except Exception as e:
-                    logger.warning(f"Error getting data for vehicle {vehicle_id}: {e}")
-                    continue
+            edge_stats = None
+            geometry = self.network_geometry
+            if geometry is not None:
+                if self.edge_stats is None or self.edge_stats.geometry is not geometry:
+                    self.edge_stats = EdgeStats(geometry)
+                slot_list = slots.tolist()
+                self.edge_stats.update_lanes([registry.road_ids[slot] for slot in slot_list],
+                                             [registry.lane_ids[slot] for slot in slot_list],
+                                             registry.speed[slots].tolist())
+                edge_stats = self.edge_stats
             
-            self.vehicles_data = vehicles
-            self.emergency_vehicles_data = emergency_vehicles
+            self.recorder.record(int(round(current_time / self.step_length)), current_time, time.time(),
+                                 vehicle_columns(registry, slots, self.frame_strings),
+                                 self.collect_intersections_data(current_time), edge_stats)
+        except Exception as e:
+            logger.error(f"Error recording step: {e}")
+    
+    def collect_vehicles_data(self):
+        """Collect vehicle data from SUMO, returns (vehicles, emergency_vehicles)"""
+        try:
+            registry = self.vehicle_registry
+            slots = self.sync_vehicle_registry()
+            
+            timestamp = time.time() * 1000  # Convert to milliseconds
+            
+            # Split by the emergency mask
+            emergency = registry.emergency[slots]
+            self.collected_slots = np.concatenate((slots[~emergency], slots[emergency]))
+            vehicles = self.vehicle_records(slots[~emergency], timestamp)
+            emergency_vehicles = self.vehicle_records(slots[emergency], timestamp)
+            
+            info = registry.info
+            for slot, vehicle_data in zip(slots[emergency].tolist(), emergency_vehicles):
+                vehicle_data.update({
+                    'emergencyType': info[slot].emergency_type,
+                    'priority': 'high',
+                    'status': 'responding'
+                })
+            
+            return vehicles, emergency_vehicles
             
         except Exception as e:
             logger.error(f"Error updating vehicles data: {e}")
+            self.collected_slots = None
+            return self.snapshot.vehicles, self.snapshot.emergency_vehicles
+    
+    def vehicle_records(self, slots, timestamp):
+        """Vehicle records of registry slots, reading every column at once"""
+        registry = self.vehicle_registry
+        columns = zip(slots.tolist(), registry.lat[slots].tolist(), registry.lng[slots].tolist(),
+                      (registry.speed[slots] * 3.6).tolist(),  # Convert m/s to km/h
+                      registry.angle[slots].tolist(),
+                      registry.waiting_time[slots].tolist(),
+                      registry.distance[slots].tolist())
+        ids = registry.ids
+        info = registry.info
+        road_ids = registry.road_ids
+        lane_ids = registry.lane_ids
+        
+        return [{
+            'id': ids[slot],
+            'type': info[slot].type,
+            'position': {
+                'lat': lat,
+                'lng': lng,
+                'roadId': road_ids[slot],
+                'laneId': lane_ids[slot]
+            },
+            'speed': speed,
+            'angle': angle,
+            'routeId': info[slot].route_id,
+            'timestamp': timestamp,
+            'waitingTime': waiting_time,
+            'distance': distance
+        } for slot, lat, lng, speed, angle, waiting_time, distance in columns]
     
-    def update_intersections_data(self):
-        """Update intersection/traffic light data from SUMO"""
+    def collect_intersections_data(self, current_time):
+        """Collect intersection/traffic light data from SUMO"""
         try:
-            tls_ids = traci.trafficlight.getIDList()
+            geometry = self.network_geometry
+            if geometry is None:
+                # Positions are not known until the network geometry is loaded
+                return []
+            
             intersections = []
             
-            for tls_id in tls_ids:
+            # Phase, state, next switch and lane queues come from the step's
+            # subscription results; lanes and positions are cached per light
+            for light in self.traffic_lights.update(current_time, geometry.tls_position):
                 try:
-                    # Get traffic light data
-                    state = traci.trafficlight.getRedYellowGreenState(tls_id)
-                    phase = self.safe_int(traci.trafficlight.getPhase(tls_id))
-                    next_switch = self.safe_float(traci.trafficlight.getNextSwitch(tls_id))
-                    program = traci.trafficlight.getProgram(tls_id)
+                    queue_lengths, waiting_times, approaches, congestion_level = self.traffic_lights.queues(light)
                     
-                    # Get controlled lanes
-                    controlled_lanes = traci.trafficlight.getControlledLanes(tls_id)
-                    
-                    # Calculate position (average of controlled junctions)
-                    # This is a simplified approach
-                    lat = 9.0320 + (hash(tls_id) % 1000) / 100000.0
-                    lng = 38.7469 + (hash(tls_id) % 1000) / 100000.0
-                    
-                    intersection_data = {
-                        'id': tls_id,
-                        'position': {
-                            'lat': lat,
-                            'lng': lng
-                        },
-                        'trafficLights': [{
-                            'phase': self.map_tls_state(state[0] if state else 'r'),
-                            'direction': 'all',
-                            'remainingTime': max(0.0, next_switch - self.safe_float(traci.simulation.getTime())),
-                            'nextPhase': 'green' if state and state[0] == 'r' else 'red'
-                        }],
-                        'queueLengths': {},
-                        'waitingTimes': {},
-                        'congestionLevel': 'low',
-                        'timestamp': time.time() * 1000
-                    }
-                    
-                    # Get queue lengths for controlled lanes
-                    for lane_id in controlled_lanes[:5]:  # Limit to first 5 lanes
-                        try:
-                            queue_length = traci.lane.getLastStepHaltingNumber(lane_id)
-                            waiting_time = traci.lane.getWaitingTime(lane_id)
-                            intersection_data['queueLengths'][lane_id] = queue_length
-                            intersection_data['waitingTimes'][lane_id] = waiting_time
-                        except:
-                            pass
+                    # Reuse the previous record while the phase and queues are unchanged
+                    record = light.record
+                    if record is None or record['trafficLights'][0] is not light.signal or \
+                            record['approaches'] != approaches or record['queueLengths'] != queue_lengths or \
+                            record['waitingTimes'] != waiting_times:
+                        vehicle_count = sum(approach['vehicles'] for approach in approaches.values())
+                        record = light.record = {
+                            'id': light.tls_id,
+                            'position': light.position,
+                            'trafficLights': [light.signal],
+                            'queueLengths': queue_lengths,
+                            'waitingTimes': waiting_times,
+                            'approaches': approaches,
+                            'maxQueueLength': max(queue_lengths.values(), default=0),
+                            'averageWaitingTime': sum(waiting_times.values()) / vehicle_count if vehicle_count else 0.0,
+                            'congestionLevel': congestion_level,
+                            'timestamp': time.time() * 1000
+                        }
                     
-                    intersections.append(intersection_data)
+                    # The countdown moves every step; publish it on a copy so
+                    # the cached record and earlier snapshots stay unchanged
+                    remaining_time = max(0.0, light.next_switch - current_time)
+                    if light.signal['remainingTime'] != remaining_time:
+                        record = dict(record, trafficLights=[dict(light.signal, remainingTime=remaining_time)])
+                    intersections.append(record)
                     
                 except Exception as e:
-                    logger.warning(f"Error getting data for intersection {tls_id}: {e}")
+                    logger.warning(f"Error getting data for intersection {light.tls_id}: {e}")
                     continue
             
-            self.intersections_data = intersections
+            return intersections
             
         except Exception as e:
             logger.error(f"Error updating intersections data: {e}")
+            return self.snapshot.intersections
     
-    def update_roads_data(self):
-        """Update road/edge data from SUMO"""
+    def collect_roads_data(self, vehicles):
+        """Collect road/edge data for every occupied edge from the step's vehicle records"""
         try:
-            edge_ids = traci.edge.getIDList()
-            roads = []
+            geometry = self.network_geometry
+            if geometry is None:
+                return []
             
-            for edge_id in edge_ids[:50]:  # Limit to first 50 edges for performance
-                try:
-                    # Skip internal edges
-                    if edge_id.startswith(':'):
-                        continue
-                    
-                    # Get edge data
-                    vehicle_count = self.safe_int(traci.edge.getLastStepVehicleNumber(edge_id))
-                    mean_speed = self.safe_float(traci.edge.getLastStepMeanSpeed(edge_id))
-                    vehicle_ids = traci.edge.getLastStepVehicleIDs(edge_id)
-                    
-                    # Get lane data
-                    lane_count = self.safe_int(traci.edge.getLaneNumber(edge_id))
-                    lanes = []
-                    
-                    for lane_index in range(lane_count):
-                        lane_id = f"{edge_id}_{lane_index}"
-                        try:
-                            lane_vehicle_count = self.safe_int(traci.lane.getLastStepVehicleNumber(lane_id))
-                            lane_mean_speed = self.safe_float(traci.lane.getLastStepMeanSpeed(lane_id))
-                            lane_length = self.safe_float(traci.lane.getLength(lane_id))
-                            
-                            lanes.append({
-                                'id': lane_id,
-                                'vehicleCount': lane_vehicle_count,
-                                'averageSpeed': lane_mean_speed * 3.6,  # Convert to km/h
-                                'density': lane_vehicle_count / (lane_length / 1000) if lane_length > 0 else 0,
-                                'flow': lane_vehicle_count * 3600 / max(1.0, lane_mean_speed) if lane_mean_speed > 0 else 0
-                            })
-                        except:
-                            pass
-                    
-                    # Calculate congestion level
-                    congestion_level = 'low'
-                    if mean_speed < 5.0:
-                        congestion_level = 'high'
-                    elif mean_speed < 15.0:
-                        congestion_level = 'medium'
-                    
-                    # Generate simplified coordinates (you may want to get actual geometry)
-                    coordinates = [
-                        [9.0320 + (hash(edge_id) % 100) / 10000.0, 38.7469 + (hash(edge_id) % 100) / 10000.0],
-                        [9.0320 + (hash(edge_id + "_end") % 100) / 10000.0, 38.7469 + (hash(edge_id + "_end") % 100) / 10000.0]
-                    ]
-                    
-                    road_data = {
-                        'id': edge_id,
-                        'coordinates': coordinates,
-                        'lanes': lanes,
-                        'congestionLevel': congestion_level,
-                        'incidents': [],
-                        'timestamp': time.time() * 1000
-                    }
-                    
-                    roads.append(road_data)
-                    
-                except Exception as e:
-                    logger.warning(f"Error getting data for edge {edge_id}: {e}")
-                    continue
+            if self.edge_stats is None or self.edge_stats.geometry is not geometry:
+                self.edge_stats = EdgeStats(geometry)
             
-            self.roads_data = roads
+            self.edge_stats.update(vehicles)
+            return self.edge_stats.road_records(time.time() * 1000)
             
         except Exception as e:
             logger.error(f"Error updating roads data: {e}")
+            return self.snapshot.roads
     
-    def update_simulation_stats(self):
-        """Update simulation statistics"""
+    def collect_heatmap(self):
+        """Aggregate the step's vehicles into heatmap grids from the registry arrays"""
         try:
-            current_time = traci.simulation.getTime()
-            loaded_vehicles = traci.simulation.getLoadedNumber()
-            departed_vehicles = traci.simulation.getDepartedNumber()
-            arrived_vehicles = traci.simulation.getArrivedNumber()
+            registry = self.vehicle_registry
+            slots = registry.active_slots()
+            return Heatmap(registry.lat[slots], registry.lng[slots], registry.speed[slots], self.heatmap_zooms)
+        except Exception as e:
+            logger.error(f"Error building heatmap: {e}")
+            return None
+    
+    def collect_simulation_stats(self, current_time, active_vehicles):
+        """Collect simulation statistics"""
+        try:
+            loaded_vehicles = self.traci.simulation.getLoadedNumber()
+            departed_vehicles = self.traci.simulation.getDepartedNumber()
+            arrived_vehicles = self.traci.simulation.getArrivedNumber()
             
-            self.simulation_stats = {
+            return {
                 'currentTime': current_time,
                 'loadedVehicles': loaded_vehicles,
                 'departedVehicles': departed_vehicles,
                 'arrivedVehicles': arrived_vehicles,
-                'activeVehicles': len(self.vehicles_data) + len(self.emergency_vehicles_data),
+                'activeVehicles': active_vehicles,
+                **(self.edge_stats.summary() if self.edge_stats is not None else {}),
                 'timestamp': time.time() * 1000
             }
             
         except Exception as e:
             logger.error(f"Error updating simulation stats: {e}")
+            return self.snapshot.stats
+    
+    def classify_vehicle_type(self, sumo_type):
+        """Frontend type and emergency keywords of a SUMO vType; the registry calls this once per vType"""
+        return self.map_vehicle_type(sumo_type), self.emergency_keywords(sumo_type)
+    
+    def classify_vehicle(self, vehicle_id, type_class):
+        """Frontend type and emergency type (None for regular vehicles) of a departing vehicle"""
+        vehicle_type, type_keywords = type_class
+        keywords = type_keywords | self.emergency_keywords(vehicle_id)
+        return vehicle_type, self.get_emergency_type(keywords) if keywords else None
     
     def map_vehicle_type(self, sumo_type):
         """Map SUMO vehicle type to frontend type"""
@@ -1043,64 +1700,58 @@ class SUMOBridge:
     
     def map_tls_state(self, state):
         """Map SUMO traffic light state to frontend state"""
-        state_mapping = {
-            'r': 'red',
-            'y': 'yellow',
-            'g': 'green',
-            'G': 'green'
-        }
-        return state_mapping.get(state, 'red')
+        return STATE_NAMES.get(state, 'red')
     
-    def is_emergency_vehicle(self, vehicle_id, vehicle_type):
-        """Check if vehicle is an emergency vehicle"""
-        emergency_keywords = ['ambulance', 'police', 'fire', 'emergency', 'rescue']
-        vehicle_id_lower = vehicle_id.lower()
-        vehicle_type_lower = vehicle_type.lower()
-        
-        return any(keyword in vehicle_id_lower or keyword in vehicle_type_lower 
-                  for keyword in emergency_keywords)
+    def emergency_keywords(self, name):
+        """Emergency keywords contained in a vehicle id or vType name"""
+        name = name.lower()
+        return frozenset(keyword for keyword in EMERGENCY_KEYWORDS if keyword in name)
     
-    def get_emergency_type(self, vehicle_id, vehicle_type):
-        """Get emergency vehicle type"""
-        vehicle_str = (vehicle_id + vehicle_type).lower()
-        
-        if 'ambulance' in vehicle_str:
+    def get_emergency_type(self, keywords):
+        """Get emergency vehicle type from the keywords of its id and vType"""
+        if 'ambulance' in keywords:
             return 'ambulance'
-        elif 'police' in vehicle_str:
+        elif 'police' in keywords:
             return 'police'
-        elif 'fire' in vehicle_str:
+        elif 'fire' in keywords:
             return 'fire'
         else:
             return 'rescue'
     
     def override_traffic_light(self, intersection_id, phase, duration=30):
-        """Override traffic light phase via TraCI"""
+        """
+        Hold every link of a traffic light at one colour for `duration`
+        simulated seconds, after which its program and phase are restored.
+        Request threads queue a TrafficLightOverride instead of calling this.
+        Returns the active override, or None on failure.
+        """
         if not self.connected:
-            return False
+            return None
         
         try:
-            # Map phase to SUMO traffic light state
-            phase_mapping = {
-                'red': 'r',
-                'yellow': 'y', 
-                'green': 'G'
-            }
-            
-            sumo_phase = phase_mapping.get(phase, 'G')
-            
-            # Set traffic light state
-            current_program = traci.trafficlight.getProgram(intersection_id)
-            traci.trafficlight.setRedYellowGreenState(intersection_id, sumo_phase * 4)  # Assume 4 lanes
-            
-            logger.info(f"Traffic light {intersection_id} overridden to {phase} for {duration}s")
-            return True
+            current_time = self.safe_float(self.traci.simulation.getTime())
+            override = self.overrides.override(intersection_id, OVERRIDE_SIGNALS.get(phase, 'G'), duration,
+                                               current_time)
+            logger.info(f"Traffic light {intersection_id} overridden to {phase} until {override.expires_at:.0f}s")
+            return override
             
         except Exception as e:
             logger.error(f"Failed to override traffic light {intersection_id}: {e}")
-            return False
+            return None
     
     def run(self):
-        """Run the Flask API server"""
+        """
+        Run the API server: Flask's threaded server by default, or the
+        asyncio server from asgi_server.py with SERVER_MODE=asgi
+        """
+        server_mode = os.getenv('SERVER_MODE', 'threaded').lower()
+        if server_mode == 'asgi':
+            # Imported here so the threaded mode does not need uvicorn
+            from asgi_server import serve
+            logger.info(f"Starting SUMO Bridge ASGI server on port {self.api_port}")
+            serve(self, host='0.0.0.0', port=self.api_port)
+            return
+        
         logger.info(f"Starting SUMO Bridge API server on port {self.api_port}")
         self.app.run(host='0.0.0.0', port=self.api_port, debug=False, threaded=True)
 
@@ -1114,14 +1765,34 @@ def main():
     # Create and run bridge
     bridge = SUMOBridge(sumo_host=sumo_host, sumo_port=sumo_port, api_port=api_port)
     
+    # Additional scenarios, e.g. SUMO_SCENARIOS=morning_rush=dev/config_morning_rush.sumocfg,...
+    # Each runs its own SUMO and is served under /scenarios/<id>/
+    scenarios = parse_scenarios(os.getenv('SUMO_SCENARIOS', ''))
+    if scenarios:
+        cpu_sets = parse_cpu_sets(os.getenv('SCENARIO_CPUS', ''), len(scenarios))
+        bridge.scenarios = ScenarioManager(
+            lambda scenario_id, config_path, cpus: SUMOBridge(sumo_host=sumo_host, sumo_port=sumo_port,
+                                                              api_port=api_port, scenario_id=scenario_id,
+                                                              config_path=config_path, cpus=cpus),
+            scenarios, cpu_sets)
+        bridge.scenarios.mount(bridge.app)
+        logger.info(f"Serving scenarios {', '.join(scenario_id for scenario_id, _ in scenarios)}")
+        if os.getenv('SCENARIO_AUTOSTART', 'false').lower() == 'true':
+            bridge.scenarios.connect()
+    
     try:
         bridge.run()
     except KeyboardInterrupt:
-        logger.info("Shutting down SUMO Bridge...")
-        bridge.disconnect_from_sumo()
+        # The threaded server stops with Ctrl+C; uvicorn handles it and returns
+        pass
     except Exception as e:
         logger.error(f"Error running SUMO Bridge: {e}")
         sys.exit(1)
+    
+    logger.info("Shutting down SUMO Bridge...")
+    bridge.disconnect_from_sumo()
+    if bridge.scenarios:
+        bridge.scenarios.disconnect()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -24,6 +24,8 @@ else:
 import traci
 import sumolib
 
+from step_scheduler import StepScheduler, parse_speed
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,6 +37,7 @@ class SUMOBridge:
         self.sumo_process = None
         self.update_thread = None
         self.stop_updates = False
+        self.scheduler = StepScheduler(real_time_factor=parse_speed(os.getenv('SIM_REAL_TIME_FACTOR', '10')))
         self.current_data = {
             'time': 0,
             'vehicles': [],
@@ -114,6 +117,7 @@ class SUMOBridge:
                 
                 # Use traci.start() which handles the connection properly
                 traci.start(sumo_cmd, label="default")
+                self.scheduler.reset(traci.simulation.getDeltaT())
                 
                 # Wait for initialization
                 time.sleep(0.5)
@@ -187,12 +191,22 @@ class SUMOBridge:
     
     def update_data_loop(self):
         """Main loop for updating simulation data"""
+        self.scheduler.resume()
         while not self.stop_updates and self.connected:
             try:
-                if self.simulation_running:
-                    # Advance simulation
+                if not self.simulation_running:
+                    self.scheduler.wait(paused=True)
+                    continue
+                
+                # Advance simulation by every step that is due
+                batch_started = time.monotonic()
+                steps = 0
+                while self.scheduler.step_due() and not self.scheduler.batch_limit_reached(steps, batch_started):
                     traci.simulationStep()
-                    
+                    self.scheduler.advance()
+                    steps += 1
+                
+                if steps:
                     # Update current data
                     self.current_data = {
                         'time': traci.simulation.getTime(),
@@ -200,8 +214,9 @@ class SUMOBridge:
                         'traffic_lights': self.get_traffic_light_data(),
                         'statistics': self.get_statistics()
                     }
-                    
-                time.sleep(0.1)  # 100ms update interval
+                    self.scheduler.finish_batch(steps)
+                
+                self.scheduler.wait()
                 
             except Exception as e:
                 logger.error(f"Error in update loop: {e}")
@@ -267,9 +282,9 @@ class SUMOBridge:
             return False
     
     def set_simulation_speed(self, speed):
-        """Set simulation speed (delay between steps in ms)"""
-        # This would be implemented based on your needs
-        pass
+        """Set simulation speed as a real-time factor (e.g. 1, 5) or 'max'"""
+        self.scheduler.set_speed(parse_speed(speed))
+        logger.info(f"Simulation speed set to {speed}")
     
     def pause_simulation(self):
         """Pause the simulation"""
@@ -340,6 +355,17 @@ def resume():
     bridge.resume_simulation()
     return jsonify({'success': True})
 
+@app.route('/speed', methods=['GET', 'POST'])
+def speed():
+    """Get or set the simulation speed"""
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            bridge.set_simulation_speed(data.get('realTimeFactor'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'speed': bridge.scheduler.stats()})
+
 @app.route('/data', methods=['GET'])
 def get_data():
     """Get current simulation data"""
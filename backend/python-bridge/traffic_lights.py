@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Traffic light tracking for the SUMO bridge
+Caches what only changes with a program switch (controlled lanes and links,
+phase definitions) and subscribes every traffic light to its phase, state,
+next switch time and program, so a step costs no per-light TraCI calls and
+an intersection's signal entry is only rebuilt when its phase changes.
+Queues are read from one subscription per incoming lane, shared by every
+light that controls the lane, and rolled up by the side of the junction
+each lane arrives from. Timed overrides force a light to one colour and
+restore its program when they expire
+"""
+
+import heapq
+import itertools
+import logging
+import math
+
+import traci
+from traci import constants as tc
+
+logger = logging.getLogger(__name__)
+
+# Values delivered for every traffic light with each step response
+TLS_VARIABLES = (
+    tc.TL_CURRENT_PHASE,
+    tc.TL_RED_YELLOW_GREEN_STATE,
+    tc.TL_NEXT_SWITCH,
+    tc.TL_CURRENT_PROGRAM,
+)
+
+# Values delivered for every incoming lane of a traffic light
+LANE_VARIABLES = (
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_VEHICLE_HALTING_NUMBER,
+    tc.VAR_WAITING_TIME,
+)
+
+# Road space taken by one queued vehicle (SUMO's default length plus minGap)
+QUEUED_VEHICLE_LENGTH = 7.5
+
+# Share of an approach's lane length taken by its queue, from the worst level down
+CONGESTION_QUEUE_RATIOS = (
+    ('critical', 0.8),
+    ('high', 0.5),
+    ('medium', 0.2),
+)
+
+APPROACHES = ('N', 'E', 'S', 'W')
+
+STATE_NAMES = {
+    'r': 'red',
+    'y': 'yellow',
+    'g': 'green',
+    'G': 'green'
+}
+
+# Signal letter of every link while a light is overridden to a colour
+OVERRIDE_SIGNALS = {
+    'red': 'r',
+    'yellow': 'y',
+    'green': 'G'
+}
+
+
+def approach_of(shape):
+    """
+    Side of the junction a lane arrives from ('N', 'E', 'S' or 'W'), from the
+    heading of the lane's last segment in network coordinates, or None for a
+    lane without a usable shape. Northbound lanes arrive from the south.
+    """
+    x1, y1 = shape[-1] if shape else (0.0, 0.0)
+    for x0, y0 in reversed(shape[:-1]):
+        if x0 != x1 or y0 != y1:
+            heading = math.degrees(math.atan2(x1 - x0, y1 - y0)) % 360.0  # 0 = north, clockwise
+            return APPROACHES[(int((heading + 45.0) // 90.0) + 2) % 4]
+    return None
+
+
+def congestion_level(queue_ratio):
+    for level, threshold in CONGESTION_QUEUE_RATIOS:
+        if queue_ratio >= threshold:
+            return level
+    return 'low'
+
+
+class LaneInfo:
+    """Static attributes of an incoming lane"""
+
+    __slots__ = ('length', 'approach', 'users')
+
+    def __init__(self, connection, lane_id):
+        self.length = float(connection.lane.getLength(lane_id))
+        self.approach = approach_of(connection.lane.getShape(lane_id))
+        # Programs whose incoming lanes include this one
+        self.users = 0
+
+
+class TrafficLightProgram:
+    """Static definition of a traffic light under one program"""
+
+    __slots__ = ('tls_id', 'program', 'controlled_lanes', 'incoming_lanes', 'controlled_links', 'phases')
+
+    def __init__(self, connection, tls_id, program):
+        self.tls_id = tls_id
+        self.program = program
+        self.controlled_lanes = tuple(connection.trafficlight.getControlledLanes(tls_id))
+        # getControlledLanes repeats a lane for each of its links
+        self.incoming_lanes = tuple(dict.fromkeys(self.controlled_lanes))
+        self.controlled_links = tuple(tuple(links) for links in connection.trafficlight.getControlledLinks(tls_id))
+        self.phases = ()
+        for logic in connection.trafficlight.getAllProgramLogics(tls_id):
+            if logic.programID == program:
+                self.phases = tuple(phase.state for phase in logic.phases)
+                break
+
+
+class TrafficLightState:
+    """Cached position, program and last signal entry of one traffic light"""
+
+    __slots__ = ('tls_id', 'position', 'program', 'phase', 'state', 'next_switch', 'signal', 'record')
+
+    def __init__(self, tls_id, position):
+        self.tls_id = tls_id
+        self.position = position
+        self.program = None
+        self.phase = None
+        self.state = None
+        self.next_switch = None
+        self.signal = None
+        # Intersection record last built from `signal`, reused while nothing changes
+        self.record = None
+
+
+class TrafficLightTracker:
+    """Keeps one TraCI subscription and a static cache entry per traffic light"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, connection=None):
+        """Forget subscriptions and cached programs from a previous connection"""
+        self.traci = connection or traci
+        self.started = False
+        self.tls_ids = ()
+        self.lights = {}
+        self.lanes = {}
+        self.lane_values = {}
+
+    def start(self, locate):
+        self.tls_ids = tuple(self.traci.trafficlight.getIDList())
+        for tls_id in self.tls_ids:
+            self.traci.trafficlight.subscribe(tls_id, TLS_VARIABLES)
+            self.lights[tls_id] = TrafficLightState(tls_id, locate(tls_id))
+        self.started = True
+        logger.info(f"Subscribed {len(self.tls_ids)} traffic lights")
+
+    def use_lanes(self, program, previous):
+        """Subscribe lanes a program starts using and drop those no program uses any more"""
+        for lane_id in program.incoming_lanes:
+            lane = self.lanes.get(lane_id)
+            if lane is None:
+                lane = self.lanes[lane_id] = LaneInfo(self.traci, lane_id)
+                self.traci.lane.subscribe(lane_id, LANE_VARIABLES)
+            lane.users += 1
+        if previous is not None:
+            self.release_lanes(previous)
+
+    def release_lanes(self, program):
+        for lane_id in program.incoming_lanes:
+            lane = self.lanes.get(lane_id)
+            if lane is not None:
+                lane.users -= 1
+                if lane.users <= 0:
+                    del self.lanes[lane_id]
+                    self.traci.lane.unsubscribe(lane_id)
+
+    def invalidate(self, tls_id):
+        """Drop the cached program of a light, e.g. after an override"""
+        light = self.lights.get(tls_id)
+        if light is not None:
+            if light.program is not None:
+                self.release_lanes(light.program)
+            light.program = None
+            light.signal = None
+            light.record = None
+
+    def program(self, tls_id):
+        """Static definition of a light's current program, or None before the first update"""
+        light = self.lights.get(tls_id)
+        return light.program if light is not None else None
+
+    def restore_point(self, tls_id):
+        """Program and phase index a light runs now, from the last update when cached"""
+        light = self.lights.get(tls_id)
+        if light is not None and light.program is not None and light.phase is not None:
+            return light.program.program, light.phase
+        return self.traci.trafficlight.getProgram(tls_id), self.traci.trafficlight.getPhase(tls_id)
+
+    def link_count(self, tls_id):
+        """Number of signals in a light's state string, from the cached program when there is one"""
+        program = self.program(tls_id)
+        if program is not None:
+            return len(program.controlled_links)
+        return len(self.traci.trafficlight.getControlledLinks(tls_id))
+
+    def update(self, current_time, locate):
+        """
+        Apply the step's subscription results and return the states of the
+        lights that have a position. `locate(tls_id)` gives a light's
+        position and is called once per light. A light's signal entry stays
+        the same object until its phase, state or next switch changes.
+        """
+        if not self.started:
+            # Subscribing also delivers the current values
+            self.start(locate)
+        results = self.traci.trafficlight.getAllSubscriptionResults()
+
+        current = []
+        for tls_id, values in results.items():
+            light = self.lights.get(tls_id)
+            if light is None or light.position is None:
+                continue
+            try:
+                program_id = values[tc.TL_CURRENT_PROGRAM]
+                if light.program is None or light.program.program != program_id:
+                    program = TrafficLightProgram(self.traci, tls_id, program_id)
+                    self.use_lanes(program, light.program)
+                    light.program = program
+                    light.signal = None
+                    light.record = None
+
+                phase = values[tc.TL_CURRENT_PHASE]
+                state = values[tc.TL_RED_YELLOW_GREEN_STATE]
+                next_switch = float(values[tc.TL_NEXT_SWITCH])
+                if light.signal is None or phase != light.phase or state != light.state or \
+                        next_switch != light.next_switch:
+                    light.phase = phase
+                    light.state = state
+                    light.next_switch = next_switch
+                    light.signal = self.signal(light, current_time)
+                current.append(light)
+            except Exception as e:
+                logger.warning(f"Error getting data for intersection {tls_id}: {e}")
+
+        # Subscribing delivers current values too, so lanes added above are included
+        self.lane_values = self.traci.lane.getAllSubscriptionResults()
+        return current
+
+    def queues(self, light):
+        """
+        Queue metrics over the unique incoming lanes of a light: per-lane
+        halting vehicles and waiting time, rolled up per approach, and the
+        congestion level of the worst approach
+        """
+        lane_values = self.lane_values
+        queue_lengths = {}
+        waiting_times = {}
+        approaches = {}
+        for lane_id in light.program.incoming_lanes:
+            values = lane_values.get(lane_id)
+            lane = self.lanes.get(lane_id)
+            if values is None or lane is None:
+                continue
+            halting = values[tc.LAST_STEP_VEHICLE_HALTING_NUMBER]
+            waiting = values[tc.VAR_WAITING_TIME]
+            queue_lengths[lane_id] = halting
+            waiting_times[lane_id] = waiting
+
+            approach = approaches.get(lane.approach)
+            if approach is None:
+                approach = approaches[lane.approach] = {
+                    'lanes': 0,
+                    'vehicles': 0,
+                    'queueLength': 0,
+                    'waitingTime': 0.0,
+                    'laneLength': 0.0
+                }
+            approach['lanes'] += 1
+            approach['vehicles'] += values[tc.LAST_STEP_VEHICLE_NUMBER]
+            approach['queueLength'] += halting
+            approach['waitingTime'] += waiting
+            approach['laneLength'] += lane.length
+
+        worst = 0.0
+        for approach in approaches.values():
+            length = approach.pop('laneLength')
+            approach['queueRatio'] = min(1.0, approach['queueLength'] * QUEUED_VEHICLE_LENGTH / length) \
+                if length > 0 else 0.0
+            worst = max(worst, approach['queueRatio'])
+
+        # Lanes without a usable shape count towards the level but get no approach
+        approaches.pop(None, None)
+        return queue_lengths, waiting_times, approaches, congestion_level(worst)
+
+    def signal(self, light, current_time):
+        """Signal entry of an intersection record, built when the phase changes"""
+        state = light.state
+        return {
+            'phase': STATE_NAMES.get(state[0], 'red') if state else 'red',
+            'direction': 'all',
+            'remainingTime': max(0.0, light.next_switch - current_time),
+            'nextSwitch': light.next_switch,
+            'nextPhase': 'green' if state and state[0] == 'r' else 'red',
+            'phaseIndex': light.phase,
+            'state': state
+        }
+
+
+class ActiveOverride:
+    """A light held at one state until `expires_at`, and the program to restore afterwards"""
+
+    __slots__ = ('tls_id', 'state', 'expires_at', 'program', 'phase', 'sequence')
+
+    def __init__(self, tls_id, program, phase):
+        self.tls_id = tls_id
+        self.program = program
+        self.phase = phase
+        self.state = None
+        self.expires_at = None
+        self.sequence = None
+
+
+class OverrideScheduler:
+    """
+    Timed traffic light overrides in a heap ordered by expiry (simulation
+    time), so a step only looks at the earliest expiry instead of every light
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.reset()
+
+    def reset(self, connection=None):
+        """Forget overrides from a previous connection"""
+        self.traci = connection or traci
+        self.active = {}
+        self.expiries = []
+        self.sequence = itertools.count()
+
+    def next_expiry(self):
+        return self.expiries[0][0] if self.expiries else None
+
+    def override(self, tls_id, signal, duration, current_time):
+        """
+        Set every link of a light to `signal` for `duration` simulated seconds.
+        Overriding a light that is already overridden replaces its state and
+        expiry but keeps the program recorded by the first override.
+        """
+        active = self.active.get(tls_id)
+        if active is None:
+            program, phase = self.tracker.restore_point(tls_id)
+            active = ActiveOverride(tls_id, program, phase)
+
+        state = signal * self.tracker.link_count(tls_id)
+        self.traci.trafficlight.setRedYellowGreenState(tls_id, state)
+        # The light now runs SUMO's "online" program with this state
+        self.tracker.invalidate(tls_id)
+
+        active.state = state
+        active.expires_at = current_time + duration
+        active.sequence = next(self.sequence)
+        self.active[tls_id] = active
+        heapq.heappush(self.expiries, (active.expires_at, active.sequence, tls_id))
+        return active
+
+    def expire(self, current_time):
+        """Restore the program and phase of every override due by `current_time`; returns their light ids"""
+        restored = []
+        while self.expiries and self.expiries[0][0] <= current_time:
+            _, sequence, tls_id = heapq.heappop(self.expiries)
+            active = self.active.get(tls_id)
+            if active is None or active.sequence != sequence:
+                # Replaced by a later override of the same light
+                continue
+            del self.active[tls_id]
+            try:
+                self.traci.trafficlight.setProgram(tls_id, active.program)
+                self.traci.trafficlight.setPhase(tls_id, active.phase)
+                self.tracker.invalidate(tls_id)
+                restored.append(tls_id)
+                logger.info(f"Traffic light {tls_id} restored to program {active.program} phase {active.phase}")
+            except traci.TraCIException as e:
+                logger.warning(f"Could not restore traffic light {tls_id}: {e}")
+        return restored
+
+    def describe(self, current_time):
+        return [{
+            'intersectionId': active.tls_id,
+            'state': active.state,
+            'expiresAt': active.expires_at,
+            'remainingTime': max(0.0, active.expires_at - current_time),
+            'restoreProgram': active.program,
+            'restorePhase': active.phase
+        } for active in sorted(self.active.values(), key=lambda active: active.expires_at)]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Vehicle change log for the SUMO bridge
+Keeps a bounded per-step log of vehicles added, removed and changed so that
+clients can fetch only what changed since the last step they saw
+"""
+
+import threading
+from collections import deque
+
+# Fields that change on every step by construction and carry no information
+IGNORED_FIELDS = ('timestamp',)
+
+
+class ChangeLogEntry:
+    """Changes between two consecutive recorded steps"""
+    __slots__ = ('base_step', 'step', 'added', 'removed', 'changed')
+
+    def __init__(self, base_step, step, added, removed, changed):
+        self.base_step = base_step
+        self.step = step
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+
+class VehicleChangeLog:
+    """Bounded log of per-step vehicle changes"""
+
+    def __init__(self, max_steps=300):
+        self.max_steps = max_steps
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop all history, e.g. when a new simulation is started"""
+        with self.lock:
+            self.entries = deque()
+            self.previous = {}
+            self.step = None
+
+    def record(self, step, vehicles):
+        """Diff a step's vehicle records against the previous recorded step"""
+        if step == self.step:
+            return
+
+        previous = self.previous
+        current = {vehicle['id']: vehicle for vehicle in vehicles}
+        added = {}
+        changed = {}
+
+        for vehicle_id, record in current.items():
+            old = previous.get(vehicle_id)
+            if old is None:
+                added[vehicle_id] = record
+                continue
+            fields = {key: value for key, value in record.items()
+                      if key not in IGNORED_FIELDS and old.get(key) != value}
+            if fields:
+                changed[vehicle_id] = fields
+
+        removed = [vehicle_id for vehicle_id in previous if vehicle_id not in current]
+
+        with self.lock:
+            if self.step is not None:
+                self.entries.append(ChangeLogEntry(self.step, step, added, removed, changed))
+                while len(self.entries) > self.max_steps:
+                    self.entries.popleft()
+            self.previous = current
+            self.step = step
+
+    def delta(self, since, snapshot):
+        """
+        Build the delta payload from step `since` up to the snapshot's step.
+
+        Clients apply `removed`, then `added` (full records), then `changed`
+        (only the fields that differ). When the log no longer reaches back
+        to `since`, a full frame is returned instead with `full` set.
+        """
+        with self.lock:
+            entries = list(self.entries)
+
+        if since == snapshot.step:
+            return self.build_payload(since, snapshot, {}, set(), {})
+
+        if not entries or entries[0].base_step > since or since > snapshot.step:
+            return {
+                'full': True,
+                'since': since,
+                'step': snapshot.step,
+                'simulationTime': snapshot.sim_time,
+                'vehicles': snapshot.vehicles,
+                'timestamp': snapshot.created_at
+            }
+
+        added = {}
+        removed = set()
+        changed = {}
+
+        for entry in entries:
+            if entry.step <= since or entry.step > snapshot.step:
+                continue
+            for vehicle_id, record in entry.added.items():
+                added[vehicle_id] = record
+                removed.discard(vehicle_id)
+                changed.pop(vehicle_id, None)
+            for vehicle_id in entry.removed:
+                added.pop(vehicle_id, None)
+                changed.pop(vehicle_id, None)
+                removed.add(vehicle_id)
+            for vehicle_id, fields in entry.changed.items():
+                if vehicle_id in added:
+                    added[vehicle_id] = {**added[vehicle_id], **fields}
+                else:
+                    changed.setdefault(vehicle_id, {}).update(fields)
+
+        return self.build_payload(since, snapshot, added, removed, changed)
+
+    def build_payload(self, since, snapshot, added, removed, changed):
+        """Shape a delta response"""
+        return {
+            'full': False,
+            'since': since,
+            'step': snapshot.step,
+            'simulationTime': snapshot.sim_time,
+            'added': list(added.values()),
+            'removed': sorted(removed),
+            'changed': [{'id': vehicle_id, **fields} for vehicle_id, fields in changed.items()],
+            'timestamp': snapshot.created_at
+        }
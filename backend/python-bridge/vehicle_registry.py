@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Vehicle registry for the SUMO bridge
+Keeps every running vehicle in a stable slot of preallocated arrays, updated
+from departure/arrival/teleport events instead of being rebuilt each step.
+Attributes that do not change from step to step (type, route, emergency
+class) are read and classified once per vehicle, and vTypes once per run.
+Routes are interned in a table shared by all vehicles and served
+separately, so step records only carry a route id.
+"""
+
+import hashlib
+import logging
+import threading
+
+import numpy as np
+import traci
+from traci import constants as tc
+
+logger = logging.getLogger(__name__)
+
+
+def route_id(edges):
+    """Content-derived route id, stable across runs for the same edge list"""
+    return hashlib.blake2b('\n'.join(edges).encode('utf-8'), digest_size=6).hexdigest()
+
+
+class RouteTable:
+    """Interned routes: route id -> tuple of edge ids"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def __len__(self):
+        return len(self.routes)
+
+    def intern(self, edges):
+        edges = tuple(edges)
+        key = route_id(edges)
+        with self.lock:
+            self.routes.setdefault(key, edges)
+        return key
+
+    def get(self, key):
+        return self.routes.get(key)
+
+    def clear(self):
+        with self.lock:
+            self.routes = {}
+
+
+class VehicleInfo:
+    """Static attributes of one vehicle"""
+
+    __slots__ = ('sumo_type', 'type', 'emergency_type', 'sumo_route_id', 'route_id')
+
+    def __init__(self, sumo_type, vehicle_type, emergency_type, sumo_route_id, route_id):
+        self.sumo_type = sumo_type
+        self.type = vehicle_type
+        self.emergency_type = emergency_type
+        self.sumo_route_id = sumo_route_id
+        self.route_id = route_id
+
+
+class VehicleRegistry:
+    """
+    Running vehicles in stable integer slots.
+
+    A vehicle keeps its slot from departure to arrival, and freed slots are
+    reused, so per-vehicle state lives in preallocated arrays indexed by slot
+    and only grows when more vehicles run at once than ever before. The
+    registry follows departures, arrivals and teleports from step events;
+    listing every vehicle is only needed to resynchronize.
+
+    `classify_type(sumo_type)` is called once per vType and its result is
+    cached; `classify(vehicle_id, type_class)` gets that result and returns
+    (frontend type, emergency type or None) once per vehicle. A vehicle's
+    route is read again only when its SUMO route id changes, which is what
+    rerouting does.
+    """
+
+    def __init__(self, classify_type, classify, capacity=1024):
+        self.traci = traci
+        self.classify_type = classify_type
+        self.classify = classify
+        self.type_classes = {}  # SUMO vType -> classify_type result
+        self.routes = RouteTable()
+        self.initial_capacity = capacity
+        self.allocate(capacity)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.slots = {}  # vehicle id -> slot
+        self.free = list(range(capacity - 1, -1, -1))  # pop() hands out the lowest slot
+
+        # Static attributes, set once per vehicle
+        self.ids = [None] * capacity
+        self.info = [None] * capacity
+
+        # Dynamic state, overwritten every step
+        self.road_ids = [None] * capacity
+        self.lane_ids = [None] * capacity
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.speed = np.zeros(capacity, dtype=np.float64)  # m/s
+        self.angle = np.zeros(capacity, dtype=np.float64)
+        self.waiting_time = np.zeros(capacity, dtype=np.float64)
+        self.distance = np.zeros(capacity, dtype=np.float64)
+        # Projected positions, written by the collector for the active slots
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lng = np.zeros(capacity, dtype=np.float64)
+
+        # A slot is active once it holds values for a vehicle on the network;
+        # teleporting vehicles keep their slot but are not active
+        self.active = np.zeros(capacity, dtype=bool)
+        self.teleporting = np.zeros(capacity, dtype=bool)
+        # Set with a vehicle's static attributes; splits regular and emergency vehicles
+        self.emergency = np.zeros(capacity, dtype=bool)
+
+    def reset(self, connection=None):
+        """Forget vehicles and routes from a previous connection; `connection` defaults to TraCI's current one"""
+        self.traci = connection or traci
+        self.allocate(self.initial_capacity)
+        self.type_classes = {}
+        self.routes.clear()
+
+    def grow(self):
+        """Double the capacity, keeping every slot where it is"""
+        old = self.capacity
+        new = old * 2
+        for name in ('x', 'y', 'speed', 'angle', 'waiting_time', 'distance', 'lat', 'lng', 'active', 'teleporting',
+                     'emergency'):
+            array = getattr(self, name)
+            grown = np.zeros(new, dtype=array.dtype)
+            grown[:old] = array
+            setattr(self, name, grown)
+        for name in ('ids', 'info', 'road_ids', 'lane_ids'):
+            getattr(self, name).extend([None] * (new - old))
+        self.free[:0] = range(new - 1, old - 1, -1)
+        self.capacity = new
+        logger.info(f"Vehicle registry grown to {new} slots")
+
+    def add(self, vehicle_id):
+        """Give a vehicle a slot; it becomes active with its first values"""
+        slot = self.slots.get(vehicle_id)
+        if slot is None:
+            if not self.free:
+                self.grow()
+            slot = self.free.pop()
+            self.slots[vehicle_id] = slot
+            self.ids[slot] = vehicle_id
+        return slot
+
+    def remove(self, vehicle_id):
+        slot = self.slots.pop(vehicle_id, None)
+        if slot is not None:
+            self.ids[slot] = None
+            self.info[slot] = None
+            self.road_ids[slot] = None
+            self.lane_ids[slot] = None
+            self.active[slot] = False
+            self.teleporting[slot] = False
+            self.emergency[slot] = False
+            self.free.append(slot)
+
+    def apply(self, events):
+        """Follow departures, arrivals and teleports, in step order"""
+        for step_events in events:
+            for vehicle_id in step_events.departed:
+                self.add(vehicle_id)
+            for vehicle_id in step_events.teleport_started:
+                slot = self.slots.get(vehicle_id)
+                if slot is not None:
+                    self.teleporting[slot] = True
+                    self.active[slot] = False
+            for vehicle_id in step_events.teleport_ended:
+                slot = self.slots.get(vehicle_id)
+                if slot is not None:
+                    self.teleporting[slot] = False
+            for vehicle_id in step_events.arrived:
+                self.remove(vehicle_id)
+
+    def sync(self, vehicle_ids):
+        """Match the registry to a complete list of running vehicles"""
+        for vehicle_id in [vehicle_id for vehicle_id in self.slots if vehicle_id not in vehicle_ids]:
+            self.remove(vehicle_id)
+        for vehicle_id in vehicle_ids:
+            self.add(vehicle_id)
+
+    def describe(self, slot, sumo_route_id):
+        """Static attributes of the vehicle in a slot, read on first use and after reroutes"""
+        info = self.info[slot]
+        if info is None:
+            vehicle_id = self.ids[slot]
+            sumo_type = self.traci.vehicle.getTypeID(vehicle_id)
+            type_class = self.type_classes.get(sumo_type)
+            if type_class is None:
+                type_class = self.type_classes[sumo_type] = self.classify_type(sumo_type)
+            vehicle_type, emergency_type = self.classify(vehicle_id, type_class)
+            info = self.info[slot] = VehicleInfo(sumo_type, vehicle_type, emergency_type, sumo_route_id,
+                                                 self.routes.intern(self.traci.vehicle.getRoute(vehicle_id)))
+            self.emergency[slot] = emergency_type is not None
+        elif sumo_route_id != info.sumo_route_id:
+            info.sumo_route_id = sumo_route_id
+            info.route_id = self.routes.intern(self.traci.vehicle.getRoute(self.ids[slot]))
+        return info
+
+    def update(self, vehicle_values):
+        """
+        Store the step's values ({vehicle_id: {variable_id: value}}) in the
+        vehicles' slots. Vehicles without a slot (e.g. values arriving before
+        their departure was applied) are added.
+        """
+        slots = self.slots
+        for vehicle_id, values in vehicle_values.items():
+            slot = slots.get(vehicle_id)
+            if slot is None:
+                slot = self.add(vehicle_id)
+            try:
+                self.describe(slot, values[tc.VAR_ROUTE_ID])
+                self.x[slot], self.y[slot] = values[tc.VAR_POSITION]
+                self.speed[slot] = values[tc.VAR_SPEED]
+                self.angle[slot] = values[tc.VAR_ANGLE]
+                self.waiting_time[slot] = values[tc.VAR_WAITING_TIME]
+                self.distance[slot] = values[tc.VAR_DISTANCE]
+                self.road_ids[slot] = values[tc.VAR_ROAD_ID]
+                self.lane_ids[slot] = values[tc.VAR_LANE_ID]
+            except Exception as e:
+                logger.warning(f"Error getting data for vehicle {vehicle_id}: {e}")
+                continue
+            if not self.teleporting[slot]:
+                self.active[slot] = True
+
+    def active_slots(self):
+        """Slots of the vehicles currently on the network, in slot order"""
+        return np.flatnonzero(self.active)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Vehicle subscription management for the SUMO bridge
+Subscribes each vehicle once on departure so that all per-vehicle values
+arrive with the simulationStep response instead of one TraCI call per value.
+Departures, arrivals and teleports of every step are recorded as events so
+the vehicle registry can follow them without listing all vehicles
+"""
+
+import logging
+from collections import namedtuple
+
+import traci
+from traci import constants as tc
+
+logger = logging.getLogger(__name__)
+
+# Values collected for every vehicle on every step. Type and route edges are
+# static and read once per vehicle by the registry; the route id is enough to
+# notice a reroute
+VEHICLE_VARIABLES = (
+    tc.VAR_POSITION,
+    tc.VAR_SPEED,
+    tc.VAR_ANGLE,
+    tc.VAR_ROAD_ID,
+    tc.VAR_LANE_ID,
+    tc.VAR_ROUTE_ID,
+    tc.VAR_WAITING_TIME,
+    tc.VAR_DISTANCE,
+)
+
+# Simulation values delivered with every step response
+SIMULATION_VARIABLES = (
+    tc.VAR_TIME,
+    tc.VAR_DEPARTED_VEHICLES_IDS,
+    tc.VAR_ARRIVED_VEHICLES_IDS,
+    tc.VAR_TELEPORT_STARTING_VEHICLES_IDS,
+    tc.VAR_TELEPORT_ENDING_VEHICLES_IDS,
+)
+
+# Vehicle id lists of one simulation step
+StepEvents = namedtuple('StepEvents', ('departed', 'arrived', 'teleport_started', 'teleport_ended'))
+
+
+class VehicleSubscriptionManager:
+    """Keeps one TraCI subscription per running vehicle"""
+
+    def __init__(self):
+        self.traci = traci
+        self.step_length = 1.0
+        self.last_time = None
+        self.started = False
+        # Events of the steps since the last collect, and whether that collect
+        # had to resync because steps went unrecorded
+        self.events = []
+        self.resynced = False
+
+    def start(self):
+        """Subscribe to departures and to every vehicle already running"""
+        self.step_length = float(self.traci.simulation.getDeltaT())
+        self.traci.simulation.subscribe(SIMULATION_VARIABLES)
+        self.resync()
+        self.started = True
+
+    def reset(self, connection=None):
+        """Forget state from a previous connection; `connection` defaults to TraCI's current one"""
+        self.traci = connection or traci
+        self.last_time = None
+        self.started = False
+        self.events = []
+
+    def subscribe(self, vehicle_id):
+        """Subscribe a single vehicle to all collected values"""
+        self.traci.vehicle.subscribe(vehicle_id, VEHICLE_VARIABLES)
+
+    def resync(self):
+        """Subscribe every running vehicle that has no subscription results yet"""
+        results = self.traci.vehicle.getAllSubscriptionResults()
+        missing = [vehicle_id for vehicle_id in self.traci.vehicle.getIDList() if vehicle_id not in results]
+        for vehicle_id in missing:
+            self.subscribe(vehicle_id)
+        if missing:
+            logger.info(f"Subscribed {len(missing)} running vehicles")
+        self.last_time = float(self.traci.simulation.getTime())
+
+    def record_step(self):
+        """
+        Subscribe the vehicles that departed in the step just taken and keep
+        its events. Call after every simulationStep when several steps run
+        between collects; recording a step twice has no effect.
+
+        Returns False when steps were taken without being recorded.
+        """
+        if not self.started:
+            return False
+
+        simulation_values = self.traci.simulation.getSubscriptionResults()
+        current_time = simulation_values.get(tc.VAR_TIME)
+        if current_time is None or self.last_time is None:
+            return False
+        if current_time == self.last_time:
+            return True
+        if current_time - self.last_time > self.step_length * 1.5:
+            return False
+
+        departed = simulation_values.get(tc.VAR_DEPARTED_VEHICLES_IDS, ())
+        for vehicle_id in departed:
+            self.subscribe(vehicle_id)
+        self.events.append(StepEvents(
+            departed,
+            simulation_values.get(tc.VAR_ARRIVED_VEHICLES_IDS, ()),
+            simulation_values.get(tc.VAR_TELEPORT_STARTING_VEHICLES_IDS, ()),
+            simulation_values.get(tc.VAR_TELEPORT_ENDING_VEHICLES_IDS, ())
+        ))
+        self.last_time = current_time
+        return True
+
+    def take_events(self):
+        """Events recorded since the last call, oldest first"""
+        events, self.events = self.events, []
+        return events
+
+    def collect(self):
+        """
+        Return {vehicle_id: {variable_id: value}} for the current step.
+
+        Must be called once after every simulationStep, or after a batch of
+        steps that were each passed to record_step. The returned mapping is
+        owned by TraCI and is cleared on the next step, so callers should copy
+        what they need before stepping again.
+        """
+        if not self.started:
+            self.start()
+            self.events = []
+            self.resynced = True
+        elif not self.record_step():
+            # Steps were taken without recording (e.g. during connect), so
+            # departures from the skipped steps were never seen
+            self.resync()
+            self.events = []
+            self.resynced = True
+        else:
+            self.resynced = False
+
+        return self.traci.vehicle.getAllSubscriptionResults()
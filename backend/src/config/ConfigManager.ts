@@ -27,7 +27,9 @@ const SUMOConfigSchema = z.object({
   reconnectInterval: z.number().int().min(1000).default(5000),
   maxReconnectAttempts: z.number().int().min(1).default(10),
   timeout: z.number().int().min(1000).default(10000),
-  enableMockData: z.boolean().default(true)
+  enableMockData: z.boolean().default(true),
+  streamUpdates: z.boolean().default(true),
+  binaryFrames: z.boolean().default(false)
 });
 
 const PerformanceConfigSchema = z.object({
@@ -149,7 +151,9 @@ export class ConfigManager {
         reconnectInterval: env.SUMO_RECONNECT_INTERVAL ? parseInt(env.SUMO_RECONNECT_INTERVAL) : 5000,
         maxReconnectAttempts: env.SUMO_MAX_RECONNECT_ATTEMPTS ? parseInt(env.SUMO_MAX_RECONNECT_ATTEMPTS) : 5,
         timeout: env.SUMO_TIMEOUT ? parseInt(env.SUMO_TIMEOUT) : 10000,
-        enableMockData: env.ENABLE_MOCK_DATA !== 'false'
+        enableMockData: env.ENABLE_MOCK_DATA !== 'false',
+        streamUpdates: env.SUMO_STREAM_UPDATES !== 'false',
+        binaryFrames: env.SUMO_BINARY_FRAMES === 'true'
       },
       performance: {
         maxVehiclesDisplayed: env.MAX_VEHICLES_TRACKED ? parseInt(env.MAX_VEHICLES_TRACKED) : 1000,
@@ -0,0 +1,198 @@
+import {
+  VehicleData,
+  EmergencyVehicleData,
+  SimulationUpdate
+} from '../types/SUMOData.js';
+
+const MAGIC = 'SBF1';
+const DICTIONARY_HEADER_BYTES = 16;
+const FRAME_HEADER_BYTES = 32;
+
+// Code tables; must match binary_frame.py in the Python bridge
+const VEHICLE_TYPES = ['car', 'bus', 'truck', 'motorcycle', 'bicycle', 'emergency'] as const;
+const EMERGENCY_TYPES = [null, 'ambulance', 'police', 'fire', 'rescue'] as const;
+
+export interface VehicleColumns {
+  count: number;
+  id: Uint32Array;
+  roadId: Uint32Array;
+  laneId: Uint32Array;
+  routeId: Uint32Array;
+  lat: Float32Array;
+  lng: Float32Array;
+  speed: Float32Array; // km/h
+  angle: Float32Array;
+  waitingTime: Float32Array;
+  distance: Float32Array;
+  type: Uint8Array;
+  emergencyType: Uint8Array; // 0 for regular vehicles
+}
+
+export interface BinaryFrame {
+  step: number;
+  simulationTime: number;
+  timestamp: number;
+  vehicles: VehicleColumns;
+  intersections: any[];
+  roads: any[];
+  stats: any;
+}
+
+/**
+ * Decodes /all-data.bin responses of the Python bridge. Column arrays are
+ * views on the response buffer; ids are looked up in a string table that is
+ * kept for the bridge run and extended by each response.
+ */
+export class BinaryFrameDecoder {
+  private run: string | null = null;
+  private strings: string[] = [];
+  private textDecoder = new TextDecoder();
+
+  /**
+   * Query parameters for the next request, so the bridge only sends the
+   * string table entries this decoder does not have yet
+   */
+  public requestParams(): { run?: string; dict: number } {
+    return this.run ? { run: this.run, dict: this.strings.length } : { dict: 0 };
+  }
+
+  public reset(): void {
+    this.run = null;
+    this.strings = [];
+  }
+
+  public string(index: number): string {
+    return this.strings[index];
+  }
+
+  public decode(data: ArrayBuffer | Uint8Array, run: string): BinaryFrame {
+    let bytes = data instanceof Uint8Array ? data : new Uint8Array(data);
+    if (bytes.byteOffset % 4 !== 0) {
+      // Typed array views need 4-byte alignment
+      bytes = new Uint8Array(bytes);
+    }
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+
+    const magic = this.textDecoder.decode(bytes.subarray(0, 4));
+    if (magic !== MAGIC) {
+      throw new Error(`Unknown binary frame format: ${magic}`);
+    }
+
+    const dictionaryStart = view.getUint32(4, true);
+    const dictionaryCount = view.getUint32(8, true);
+    const dictionaryBytes = view.getUint32(12, true);
+
+    if (run !== this.run) {
+      this.strings = [];
+      this.run = run;
+    }
+    if (dictionaryStart > this.strings.length) {
+      const known = this.strings.length;
+      this.reset();
+      throw new Error(`String table gap: have ${known} entries, frame starts at ${dictionaryStart}`);
+    }
+    if (dictionaryCount > 0) {
+      const blob = this.textDecoder.decode(bytes.subarray(DICTIONARY_HEADER_BYTES, DICTIONARY_HEADER_BYTES + dictionaryBytes));
+      this.strings = this.strings.slice(0, dictionaryStart).concat(blob.split('\0'));
+    }
+
+    let offset = DICTIONARY_HEADER_BYTES + dictionaryBytes + (-dictionaryBytes & 3);
+    const step = view.getUint32(offset, true);
+    const count = view.getUint32(offset + 4, true);
+    const simulationTime = view.getFloat64(offset + 8, true);
+    const timestamp = view.getFloat64(offset + 16, true);
+    const jsonBytes = view.getUint32(offset + 28, true);
+    offset += FRAME_HEADER_BYTES;
+
+    const base = bytes.byteOffset;
+    const uint32 = () => {
+      const column = new Uint32Array(bytes.buffer, base + offset, count);
+      offset += 4 * count;
+      return column;
+    };
+    const float32 = () => {
+      const column = new Float32Array(bytes.buffer, base + offset, count);
+      offset += 4 * count;
+      return column;
+    };
+    const uint8 = () => {
+      const column = new Uint8Array(bytes.buffer, base + offset, count);
+      offset += count;
+      return column;
+    };
+
+    const vehicles: VehicleColumns = {
+      count,
+      id: uint32(),
+      roadId: uint32(),
+      laneId: uint32(),
+      routeId: uint32(),
+      lat: float32(),
+      lng: float32(),
+      speed: float32(),
+      angle: float32(),
+      waitingTime: float32(),
+      distance: float32(),
+      type: uint8(),
+      emergencyType: uint8()
+    };
+    offset += -offset & 3;
+
+    const trailer = JSON.parse(this.textDecoder.decode(bytes.subarray(offset, offset + jsonBytes)));
+
+    return {
+      step,
+      simulationTime,
+      timestamp,
+      vehicles,
+      intersections: trailer.intersections || [],
+      roads: trailer.roads || [],
+      stats: trailer.stats || {}
+    };
+  }
+
+  /**
+   * Expand a frame into the record format of the JSON endpoints
+   */
+  public toSimulationUpdate(frame: BinaryFrame): SimulationUpdate {
+    const columns = frame.vehicles;
+    const vehicles: VehicleData[] = [];
+    const emergencyVehicles: EmergencyVehicleData[] = [];
+
+    for (let i = 0; i < columns.count; i++) {
+      const vehicle: any = {
+        id: this.strings[columns.id[i]],
+        type: VEHICLE_TYPES[columns.type[i]] || 'car',
+        position: {
+          lat: columns.lat[i],
+          lng: columns.lng[i],
+          roadId: this.strings[columns.roadId[i]],
+          laneId: this.strings[columns.laneId[i]]
+        },
+        speed: columns.speed[i],
+        angle: columns.angle[i],
+        routeId: this.strings[columns.routeId[i]],
+        timestamp: frame.timestamp,
+        waitingTime: columns.waitingTime[i],
+        distance: columns.distance[i]
+      };
+
+      const emergencyType = EMERGENCY_TYPES[columns.emergencyType[i]];
+      if (emergencyType) {
+        emergencyVehicles.push({ ...vehicle, emergencyType, priority: 'high', status: 'responding' });
+      } else {
+        vehicles.push(vehicle);
+      }
+    }
+
+    return {
+      timestamp: frame.timestamp,
+      simulationTime: frame.simulationTime,
+      vehicles,
+      intersections: frame.intersections,
+      roads: frame.roads,
+      emergencyVehicles,
+      metrics: frame.stats
+    };
+  }
+}
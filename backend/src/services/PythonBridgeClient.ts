@@ -1,5 +1,6 @@
 import axios from 'axios';
 import { Logger } from '../utils/Logger.js';
+import { BinaryFrameDecoder } from './BinaryFrameDecoder.js';
 import { 
   VehicleData, 
   IntersectionData, 
@@ -23,10 +24,21 @@ export interface BridgeResponse<T> {
   timestamp?: number;
 }
 
+export interface BridgeStream {
+  close(): void;
+}
+
 export class PythonBridgeClient {
   private client: any;
   private config: PythonBridgeConfig;
   private connected: boolean = false;
+  // Last /all-data frame and its ETag; the bridge answers 304 while the step is unchanged
+  private allDataEtag: string | null = null;
+  private allDataCache: SimulationUpdate | null = null;
+  // String table and ETag state for /all-data.bin
+  private frameDecoder = new BinaryFrameDecoder();
+  private binaryEtag: string | null = null;
+  private binaryCache: SimulationUpdate | null = null;
 
   constructor(config: PythonBridgeConfig) {
     this.config = config;
@@ -35,7 +47,8 @@ export class PythonBridgeClient {
       timeout: config.timeout,
       headers: {
         'Content-Type': 'application/json'
-      }
+      },
+      validateStatus: (status: number) => (status >= 200 && status < 300) || status === 304
     });
   }
 
@@ -125,19 +138,58 @@ export class PythonBridgeClient {
 
   public async getAllData(): Promise<SimulationUpdate> {
     try {
-      const response = await this.client.get('/all-data');
-      const data = response.data;
-      
+      const headers = this.allDataEtag && this.allDataCache ? { 'If-None-Match': this.allDataEtag } : {};
+      const response = await this.client.get('/all-data', { headers });
+
+      if (response.status === 304 && this.allDataCache) {
+        return this.allDataCache;
+      }
+
+      const update = this.toSimulationUpdate(response.data);
+
+      this.allDataEtag = response.headers?.etag || null;
+      this.allDataCache = update;
+      return update;
+    } catch (error) {
+      logger.error('Error getting all data:', error);
       return {
-        timestamp: data.timestamp || Date.now(),
-        vehicles: data.vehicles || [],
-        intersections: data.intersections || [],
-        roads: data.roads || [],
-        emergencyVehicles: data.emergency_vehicles || [],
-        metrics: data.stats || {}
+        timestamp: Date.now(),
+        vehicles: [],
+        intersections: [],
+        roads: [],
+        emergencyVehicles: [],
+        metrics: {}
       };
+    }
+  }
+
+  /**
+   * Fetch the current step as a columnar binary frame (/all-data.bin). Only
+   * string table entries added since the previous request are transferred.
+   */
+  public async getAllDataBinary(): Promise<SimulationUpdate> {
+    try {
+      const headers = this.binaryEtag && this.binaryCache ? { 'If-None-Match': this.binaryEtag } : {};
+      const response = await this.client.get('/all-data.bin', {
+        headers,
+        params: this.frameDecoder.requestParams(),
+        responseType: 'arraybuffer'
+      });
+
+      if (response.status === 304 && this.binaryCache) {
+        return this.binaryCache;
+      }
+
+      const frame = this.frameDecoder.decode(new Uint8Array(response.data), response.headers['x-frame-run']);
+      const update = this.frameDecoder.toSimulationUpdate(frame);
+
+      this.binaryEtag = response.headers?.etag || null;
+      this.binaryCache = update;
+      return update;
     } catch (error) {
-      logger.error('Error getting all data:', error);
+      logger.error('Error getting binary frame:', error);
+      this.binaryEtag = null;
+      this.binaryCache = null;
       return {
         timestamp: Date.now(),
         vehicles: [],
@@ -149,6 +201,89 @@ export class PythonBridgeClient {
     }
   }
 
+  /**
+   * Subscribe to the bridge's Server-Sent Events stream of /all-data frames.
+   * `onUpdate` is called once per simulation step; `onClose` when the stream
+   * ends or fails, after which the caller may fall back to polling.
+   */
+  public streamAllData(
+    onUpdate: (update: SimulationUpdate) => void,
+    onClose: (error?: Error) => void
+  ): BridgeStream {
+    const controller = new AbortController();
+    let closed = false;
+
+    const finish = (error?: Error) => {
+      if (!closed) {
+        closed = true;
+        onClose(error);
+      }
+    };
+
+    this.client.get('/stream', {
+      responseType: 'stream',
+      timeout: 0,
+      signal: controller.signal,
+      headers: { Accept: 'text/event-stream' }
+    }).then((response: any) => {
+      let buffer = '';
+
+      response.data.setEncoding('utf8');
+      response.data.on('data', (chunk: string) => {
+        buffer += chunk;
+
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary !== -1) {
+          const event = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf('\n\n');
+
+          const data = event
+            .split('\n')
+            .filter(line => line.startsWith('data: '))
+            .map(line => line.slice(6))
+            .join('\n');
+
+          if (data) {
+            try {
+              const update = this.toSimulationUpdate(JSON.parse(data));
+              this.allDataCache = update;
+              onUpdate(update);
+            } catch (error) {
+              logger.error('Error parsing stream frame:', error);
+            }
+          }
+        }
+      });
+      response.data.on('end', () => finish());
+      response.data.on('error', (error: Error) => finish(error));
+    }).catch((error: Error) => {
+      if (!controller.signal.aborted) {
+        logger.error('Error opening data stream:', error);
+      }
+      finish(error);
+    });
+
+    return {
+      close: () => {
+        closed = true;
+        controller.abort();
+      }
+    };
+  }
+
+  private toSimulationUpdate(data: any): SimulationUpdate {
+    return {
+      timestamp: data.timestamp || Date.now(),
+      simulationTime: data.simulationTime,
+      vehicles: data.vehicles || [],
+      intersections: data.intersections || [],
+      roads: data.roads || [],
+      emergencyVehicles: data.emergency_vehicles || [],
+      metrics: data.stats || {}
+    };
+  }
+
   public async getSimulationStats(): Promise<any> {
     try {
       const response = await this.client.get('/simulation-stats');
@@ -1,6 +1,6 @@
 import { ConfigManager } from '../config/ConfigManager.js';
 import { WebSocketService } from './WebSocketService.js';
-import { PythonBridgeClient } from './PythonBridgeClient.js';
+import { PythonBridgeClient, BridgeStream } from './PythonBridgeClient.js';
 import { MockDataService } from './MockDataService.js';
 import { Logger } from '../utils/Logger.js';
 import { SimulationUpdate } from '../types/SUMOData.js';
@@ -17,6 +17,7 @@ export class SUMOService {
   private reconnectAttempts: number = 0;
   private reconnectTimer?: NodeJS.Timeout;
   private dataUpdateTimer?: NodeJS.Timeout;
+  private dataStream: BridgeStream | null = null;
   private isProcessing: boolean = false;
   private lastProcessingStats: any = null;
 
@@ -127,6 +128,18 @@ export class SUMOService {
       clearInterval(this.dataUpdateTimer);
     }
     
+    if (this.dataStream) {
+      this.dataStream.close();
+      this.dataStream = null;
+    }
+    
+    // The bridge pushes one frame per simulation step; polling is the
+    // fallback for mock data or when the stream cannot be kept open
+    if (config.streamUpdates && !this.usingMockData && this.pythonBridge) {
+      this.startDataStream();
+      return;
+    }
+    
     this.dataUpdateTimer = setInterval(async () => {
       await this.processAndBroadcastData();
     }, config.updateInterval);
@@ -134,7 +147,42 @@ export class SUMOService {
     logger.info(`Started data updates with ${config.updateInterval}ms interval`);
   }
 
+  private startDataStream(): void {
+    const bridge = this.pythonBridge!;
+    
+    const stream = bridge.streamAllData(
+      (update) => this.broadcastUpdate(update),
+      async (error) => {
+        if (this.dataStream !== stream) {
+          return;
+        }
+        this.dataStream = null;
+        logger.warn('Bridge data stream closed, falling back to polling:', error);
+        
+        if (!(await bridge.checkHealth())) {
+          logger.warn('Lost connection to SUMO, attempting reconnection...');
+          this.connected = false;
+          this.attemptReconnect();
+          return;
+        }
+        
+        const config = this.configManager.getSUMOConfig();
+        this.dataUpdateTimer = setInterval(async () => {
+          await this.processAndBroadcastData();
+        }, config.updateInterval);
+      }
+    );
+    
+    this.dataStream = stream;
+    logger.info('Started data updates from bridge stream');
+  }
+
   private stopDataUpdates(): void {
+    if (this.dataStream) {
+      this.dataStream.close();
+      this.dataStream = null;
+    }
+    
     if (this.dataUpdateTimer) {
       clearInterval(this.dataUpdateTimer);
       this.dataUpdateTimer = undefined;
@@ -163,24 +211,15 @@ export class SUMOService {
         simulationUpdate = this.mockDataService.getSimulationUpdate();
       } else if (this.pythonBridge) {
         // Use Python bridge
-        simulationUpdate = await this.pythonBridge.getAllData();
+        simulationUpdate = this.configManager.getSUMOConfig().binaryFrames
+          ? await this.pythonBridge.getAllDataBinary()
+          : await this.pythonBridge.getAllData();
       } else {
         return;
       }
       
       if (simulationUpdate) {
-        // Broadcast all data types (including metrics) in a single call
-        this.wsService.broadcastSimulationUpdate(simulationUpdate);
-        
-        // Update processing stats
-        this.lastProcessingStats = {
-          vehiclesProcessed: simulationUpdate.vehicles?.length || 0,
-          intersectionsProcessed: simulationUpdate.intersections?.length || 0,
-          roadsProcessed: simulationUpdate.roads?.length || 0,
-          emergencyVehiclesProcessed: simulationUpdate.emergencyVehicles?.length || 0,
-          usingMockData: this.usingMockData,
-          timestamp: Date.now()
-        };
+        this.broadcastUpdate(simulationUpdate);
       }
       
     } catch (error) {
@@ -199,6 +238,21 @@ export class SUMOService {
     }
   }
 
+  private broadcastUpdate(simulationUpdate: SimulationUpdate): void {
+    // Broadcast all data types (including metrics) in a single call
+    this.wsService.broadcastSimulationUpdate(simulationUpdate);
+    
+    // Update processing stats
+    this.lastProcessingStats = {
+      vehiclesProcessed: simulationUpdate.vehicles?.length || 0,
+      intersectionsProcessed: simulationUpdate.intersections?.length || 0,
+      roadsProcessed: simulationUpdate.roads?.length || 0,
+      emergencyVehiclesProcessed: simulationUpdate.emergencyVehicles?.length || 0,
+      usingMockData: this.usingMockData,
+      timestamp: Date.now()
+    };
+  }
+
   private cleanup(): void {
     this.stopDataUpdates();
     this.connected = false;
@@ -20,7 +20,8 @@ export const VehicleDataSchema = z.object({
   speed: z.number().min(0), // km/h
   acceleration: z.number(),
   angle: z.number().min(0).max(360), // degrees
-  route: z.array(z.string()),
+  route: z.array(z.string()).optional(),
+  routeId: z.string().optional(), // edges are served by the bridge at /routes/{routeId}
   timestamp: z.number(),
   // Additional SUMO-specific fields
   waitingTime: z.number().min(0).optional(),
@@ -45,12 +46,22 @@ export const TrafficLightSchema = z.object({
   phaseIndex: z.number().min(0).optional()
 });
 
+// Queue rollup of the incoming lanes arriving from one side of an intersection
+export const ApproachSchema = z.object({
+  lanes: z.number().min(0),
+  vehicles: z.number().min(0),
+  queueLength: z.number().min(0), // halting vehicles
+  waitingTime: z.number().min(0), // seconds, summed over the approach's lanes
+  queueRatio: z.number().min(0).max(1) // share of the approach's lane length taken by the queue
+});
+
 export const IntersectionDataSchema = z.object({
   id: z.string(),
   position: PositionSchema,
   trafficLights: z.array(TrafficLightSchema),
   queueLengths: z.record(z.string(), z.number().min(0)), // laneId -> queue length
   waitingTimes: z.record(z.string(), z.number().min(0)), // laneId -> waiting time
+  approaches: z.record(z.enum(['N', 'E', 'S', 'W']), ApproachSchema).optional(),
   congestionLevel: CongestionLevelSchema,
   timestamp: z.number(),
   // Additional intersection metrics
@@ -171,6 +182,7 @@ export type TrafficLightPhase = z.infer<typeof TrafficLightPhaseSchema>;
 export type TrafficLightDirection = z.infer<typeof TrafficLightDirectionSchema>;
 export type CongestionLevel = z.infer<typeof CongestionLevelSchema>;
 export type TrafficLight = z.infer<typeof TrafficLightSchema>;
+export type Approach = z.infer<typeof ApproachSchema>;
 export type IntersectionData = z.infer<typeof IntersectionDataSchema>;
 export type LaneData = z.infer<typeof LaneDataSchema>;
 export type IncidentType = z.infer<typeof IncidentTypeSchema>;